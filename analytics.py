@@ -0,0 +1,179 @@
+# Offline item analysis: per-question difficulty, discrimination and option choices
+import math
+from array import array
+from datetime import datetime
+from itertools import compress
+
+from database import get_db_connection
+from grading import VALID_OPTIONS, UNGRADABLE
+from models import db, Question, ItemStat
+
+try:
+    import numpy as np
+except ImportError:  # Optional: the byte-string path below is used without it
+    np = None
+
+# Answer sheets read per query while streaming a quiz's responses
+CHUNK_SIZE = 50000
+
+# Option codes counted per question: 0 (unanswered) and 1-4
+OPTION_CODES = (0, 1, 2, 3, 4)
+
+# Per answer-key code, maps a chosen option code to 1 if it matches, else 0
+_MATCH_TABLES = {code: bytes(int(i == code) for i in range(256)) for code in (1, 2, 3, 4, UNGRADABLE)}
+
+
+class _Totals:
+    """Running sums for one question across every chunk."""
+
+    __slots__ = ('responses', 'correct', 'score_sum', 'score_squares', 'correct_score_sum', 'options')
+
+    def __init__(self):
+        self.responses = 0
+        self.correct = 0
+        self.score_sum = 0.0  # Total scores of everyone who saw the question
+        self.score_squares = 0.0
+        self.correct_score_sum = 0.0  # Total scores of those who answered it correctly
+        self.options = [0] * len(OPTION_CODES)
+
+    def p_value(self):
+        return self.correct / self.responses if self.responses else None
+
+    def discrimination(self):
+        """Point-biserial correlation between answering correctly and total score."""
+        n, n1 = self.responses, self.correct
+        if n == 0 or n1 in (0, n):
+            return None
+        mean = self.score_sum / n
+        variance = self.score_squares / n - mean * mean
+        if variance <= 1e-12:
+            return None
+        mean_correct = self.correct_score_sum / n1
+        mean_wrong = (self.score_sum - self.correct_score_sum) / (n - n1)
+        p = n1 / n
+        return (mean_correct - mean_wrong) / math.sqrt(variance) * math.sqrt(p * (1 - p))
+
+
+def _accumulate_numpy(totals, question_ids, key, answers, scores):
+    # answers: n packed sheets of len(key) bytes each, concatenated
+    sheet = np.frombuffer(answers, dtype=np.uint8).reshape(len(scores), len(key))
+    scores = np.asarray(scores, dtype=np.float64)
+    correct = sheet == np.frombuffer(key, dtype=np.uint8)
+    correct_counts = correct.sum(axis=0)
+    correct_score_sums = scores @ correct
+    option_counts = [(sheet == code).sum(axis=0) for code in OPTION_CODES]
+    score_sum, score_squares = float(scores.sum()), float(scores @ scores)
+
+    for column, question_id in enumerate(question_ids):
+        item = totals.get(question_id)
+        if item is None:
+            continue
+        item.responses += len(scores)
+        item.correct += int(correct_counts[column])
+        item.score_sum += score_sum
+        item.score_squares += score_squares
+        item.correct_score_sum += float(correct_score_sums[column])
+        for i, counts in enumerate(option_counts):
+            item.options[i] += int(counts[column])
+
+
+def _accumulate_bytes(totals, question_ids, key, answers, scores):
+    # Same sums without NumPy: each question's column is a strided slice of
+    # the concatenated sheets, so counting stays in C rather than per answer
+    width = len(key)
+    score_sum = float(sum(scores))
+    score_squares = float(sum(score * score for score in scores))
+
+    for column, question_id in enumerate(question_ids):
+        item = totals.get(question_id)
+        if item is None:
+            continue
+        chosen = answers[column::width]
+        matches = chosen.translate(_MATCH_TABLES[key[column]])
+        item.responses += len(chosen)
+        item.correct += matches.count(1)
+        item.score_sum += score_sum
+        item.score_squares += score_squares
+        item.correct_score_sum += sum(compress(scores, matches))
+        for i, code in enumerate(OPTION_CODES):
+            item.options[i] += chosen.count(code)
+
+
+def _accumulate(totals, question_ids, key, answers, scores):
+    if np is not None:
+        _accumulate_numpy(totals, question_ids, key, answers, scores)
+    else:
+        _accumulate_bytes(totals, question_ids, key, answers, scores)
+
+
+def _flush(totals, layouts, correct_codes):
+    for question_ids_blob, (answers, scores) in layouts.items():
+        question_ids = array('q')
+        question_ids.frombytes(question_ids_blob)
+        key = bytes(correct_codes.get(question_id, UNGRADABLE) for question_id in question_ids)
+        _accumulate(totals, question_ids, key, b''.join(answers), scores)
+
+
+def analyse_quiz(quiz_id, chunk_size=CHUNK_SIZE):
+    """Compute item statistics for a quiz from its stored answer sheets.
+
+    Sheets are read in keyset-paged chunks straight from SQLite and grouped
+    by question layout (sheets submitted before questions were added or
+    removed have a different one), then reduced to per-question sums.
+    Correctness is judged against the current answer key. Replaces the
+    quiz's ItemStat rows and returns the number of sheets analysed.
+    """
+    questions = Question.query.filter_by(quiz_id=quiz_id).order_by(Question.id).all()
+    correct_codes = {
+        question.id: VALID_OPTIONS.get(str(question.correct_option), UNGRADABLE)
+        for question in questions
+    }
+    totals = {question.id: _Totals() for question in questions}
+
+    sheets = 0
+    last_id = 0
+    conn = get_db_connection()
+    try:
+        while True:
+            rows = conn.execute(
+                'SELECT score.id, score.total_scored, answer_sheet.question_ids, answer_sheet.answers '
+                'FROM score JOIN answer_sheet ON answer_sheet.score_id = score.id '
+                'WHERE score.quiz_id = ? AND score.id > ? ORDER BY score.id LIMIT ?',
+                (quiz_id, last_id, chunk_size)
+            ).fetchall()
+            if not rows:
+                break
+            # question_ids blob -> (answers, scores), with answers padded to the layout
+            layouts = {}
+            for score_id, total_scored, question_ids, answers in rows:
+                width = len(question_ids) // array('q').itemsize
+                group = layouts.get(question_ids)
+                if group is None:
+                    group = layouts[question_ids] = ([], [])
+                group[0].append(answers[:width].ljust(width, b'\0'))
+                group[1].append(total_scored or 0)
+            _flush(totals, layouts, correct_codes)
+            sheets += len(rows)
+            last_id = rows[-1][0]
+    finally:
+        conn.close()
+
+    computed_at = datetime.now()
+    ItemStat.query.filter_by(quiz_id=quiz_id).delete()
+    db.session.add_all([
+        ItemStat(
+            quiz_id=quiz_id,
+            question_id=question_id,
+            responses=item.responses,
+            p_value=item.p_value(),
+            discrimination=item.discrimination(),
+            unanswered=item.options[0],
+            chose_option1=item.options[1],
+            chose_option2=item.options[2],
+            chose_option3=item.options[3],
+            chose_option4=item.options[4],
+            computed_at=computed_at
+        ) for question_id, item in totals.items()
+    ])
+    db.session.commit()
+    return sheets
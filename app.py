@@ -1,32 +1,160 @@
 # Import required libraries and modules
-from flask import Flask, render_template, redirect, request, session, url_for, flash, jsonify
-from models import db, User, Subject, Chapter, Quiz, Question, Score
-import sqlite3
-from sqlalchemy import func, or_
-from datetime import datetime
+from flask import Flask, render_template, redirect, request, session, url_for, flash, jsonify, abort, Response, stream_with_context, g, send_from_directory
+from models import db, User, Subject, Chapter, Quiz, Question, Score, AnswerSheet, ItemStat
+from database import init_database
+from grading import unpack_answers, regrade_quiz
+from rollups import subject_stats, leaderboards, SCOPES as LEADERBOARD_SCOPES
+from quiz_cache import QuizCache
+from page_cache import PageCache
+from submissions import SubmissionQueue
+from timers import QuizTimers
+from search import search, search_ids
+from instrumentation import RequestMetrics
+from server import PreforkServer
+from jobs import JobQueue
+import migrations
+import assets as asset_pipeline
+import question_io
+import analytics
+import exports
+import click
+from sqlalchemy import func, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from datetime import datetime, date
+from array import array
 import calendar
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask_wtf.csrf import CSRFProtect
+import os
+import time
+from passwords import PasswordHasher, PasswordServiceBusy, LoginRateLimiter, SQLiteRateLimiter
+from sessions import SessionStore, login_user, login_required, api_login_required, admin_required
+from flask_wtf.csrf import CSRFProtect, generate_csrf
 
 # Initialize Flask application
 app = Flask(__name__)
 
 # Configure application settings
 app.config['SECRET_KEY'] = 'your-secret-key-here'  # Change this to a secure secret key
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///quizmaster.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///quizmaster.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLITE_POOL_SIZE'] = 10  # Pooled connections kept open per process
+app.config['SQLITE_POOL_OVERFLOW'] = 20  # Extra connections allowed under load
+
+# Quiz content cache: 'memory' per process, or 'sqlite' to share one file between workers
+app.config['QUIZ_CACHE_BACKEND'] = 'memory'
+app.config['QUIZ_CACHE_SIZE'] = 512  # Max cached quizzes
+app.config['QUIZ_CACHE_TTL'] = 600  # Seconds
+
+# Rendered catalogue pages, invalidated by generation when admins change the catalogue
+app.config['PAGE_CACHE_ENABLED'] = True
+app.config['PAGE_CACHE_BACKEND'] = 'memory'  # or 'sqlite' to share between workers
+app.config['PAGE_CACHE_SIZE'] = 1024  # Max cached pages
+app.config['PAGE_CACHE_TTL'] = 300  # Seconds
+
+# Write-behind submission queue for exam bursts (journaled, committed in batches)
+app.config['SUBMISSION_QUEUE_ENABLED'] = False
+app.config['SUBMISSION_BATCH_SIZE'] = 200
+app.config['SUBMISSION_FLUSH_INTERVAL'] = 0.05  # Seconds to wait while filling a batch
+app.config['SUBMISSION_MAX_RETRIES'] = 5  # Failed commits retried before waiting for a restart
+
+# Server-enforced quiz timers; unsubmitted attempts are submitted when time runs out
+app.config['QUIZ_TIMERS_ENABLED'] = True
+app.config['QUIZ_TIMER_GRACE'] = 30  # Seconds after the deadline a submission is still accepted
+
+# Password hashing: cost, worker processes (0 = hash on the request thread) and login limits
+app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256'
+app.config['PASSWORD_HASH_ITERATIONS'] = 260000  # Existing hashes are upgraded on next login
+app.config['PASSWORD_HASH_WORKERS'] = os.cpu_count() or 1  # Split between `flask serve` workers
+app.config['LOGIN_RATE_LIMIT'] = 10  # Attempts per username...
+app.config['LOGIN_RATE_WINDOW'] = 60  # ...per this many seconds
+app.config['LOGIN_RATE_BACKEND'] = 'sqlite'  # Shared by worker processes, or 'memory' (per process)
+
+# Request instrumentation: slow-request logging and per-endpoint query budgets
+app.config['SLOW_REQUEST_SECONDS'] = 0.5
+app.config['QUERY_BUDGETS'] = {
+    'admin_summary': 1,
+    'user_summary': 2,
+    'view_scores': 2,
+    'user_dashboard': 1,
+    'view_results': 3,
+    'api_quizzes': 1,
+    'api_quiz': 6,  # Uncached sampled quiz: quiz, bank ids, drawn questions and starting the clock
+    'api_result': 3,
+    'api_leaderboard': 2,
+}
+app.config['ENFORCE_QUERY_BUDGETS'] = False  # Raise instead of log; enable in tests
+app.config['METRICS_PUBLIC'] = False  # Allow /metrics without an admin session
+
+# Server-side sessions: 'sqlite' (shared by worker processes) or 'memory' (tests)
+app.config['SESSION_BACKEND'] = 'sqlite'
+app.config['SESSION_LIFETIME'] = 86400  # Seconds of inactivity before a session expires
+app.config['SESSION_SWEEP_INTERVAL'] = 300  # Seconds between expired-session cleanups
+
+# Production server (`flask serve`): worker processes and quizzes warmed before forking
+app.config['SERVER_WORKERS'] = os.cpu_count() or 1
+app.config['SERVER_WARM_QUIZZES'] = 500  # Upcoming quizzes loaded into the quiz cache
+
+# ASGI servers (asgi.py): threads per worker process running requests at once
+app.config['ASGI_THREADS'] = 16
+
+# Background jobs (result exports): queue in instance/jobs.db, files in EXPORT_DIR
+app.config['JOB_WORKERS'] = 2  # Worker threads per process
+app.config['JOB_POLL_INTERVAL'] = 1  # Seconds between checks for jobs queued by other processes
+app.config['JOB_STALE_SECONDS'] = 300  # A running job silent this long is queued again
+app.config['EXPORT_DIR'] = os.path.join(app.instance_path, 'exports')
+
+# Fingerprinted static assets (built by `flask build-assets`) are cached for a year
+app.config['ASSET_MAX_AGE'] = 31536000
+
+# Page sizes for paginated listings
+SCORES_PER_PAGE = 20
+QUIZZES_PER_PAGE = 20
+SEARCH_RESULTS_PER_PAGE = 20
+LEADERBOARD_MAX_LIMIT = 100
 
 # Initialize CSRF protection
 csrf = CSRFProtect(app)
 
-# Database connection helper function
-def get_db_connection():
-    conn = sqlite3.connect("quizmaster.db")
-    conn.row_factory = sqlite3.Row
-    return conn
+# Initialize database with app (WAL mode, busy timeout and a sized connection pool)
+init_database(app)
+
+# Initialize server-side session store
+session_store = SessionStore(app)
+
+# Initialize quiz content cache
+quiz_cache = QuizCache(app)
+
+# Initialize rendered page cache
+page_cache = PageCache(app)
+
+# Share rollup invalidations between worker processes through the page cache's generations
+subject_stats.share_invalidations(page_cache)
+leaderboards.share_invalidations(page_cache)
+
+# Initialize submission queue
+submission_queue = SubmissionQueue(app)
+
+# Initialize quiz timers (one deadline heap and thread per process)
+quiz_timers = QuizTimers(app)
+
+# Initialize background job queue (worker threads start on first use)
+job_queue = JobQueue(app)
+
+# Initialize request metrics
+request_metrics = RequestMetrics(app)
+
+# Initialize static asset serving (fingerprinted, pre-compressed build when present)
+assets = asset_pipeline.Assets(app)
 
-# Initialize database with app
-db.init_app(app)
+# Initialize password hashing pool and login rate limiter
+password_hasher = PasswordHasher(app)
+if app.config['LOGIN_RATE_BACKEND'] == 'sqlite':
+    login_limiter = SQLiteRateLimiter(
+        app.config.get('LOGIN_RATE_DB_PATH') or os.path.join(app.instance_path, 'login_attempts.db'),
+        app.config['LOGIN_RATE_LIMIT'], app.config['LOGIN_RATE_WINDOW']
+    )
+else:
+    login_limiter = LoginRateLimiter(app.config['LOGIN_RATE_LIMIT'], app.config['LOGIN_RATE_WINDOW'])
 
 # Route: Home page
 @app.route('/')
@@ -39,11 +167,32 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
+        
+        # Refuse floods against one username before spending CPU on hashing
+        if not login_limiter.allow(username):
+            flash('Too many login attempts. Please wait a minute and try again.', 'error')
+            return render_template('login.html'), 429
+        
         user = User.query.filter_by(username=username).first()
         
         # Verify user credentials using password hashing
-        if user and check_password_hash(user.password, password):
-            session['user_id'] = user.id
+        try:
+            valid = user is not None and password_hasher.verify(user.password, password)
+        except PasswordServiceBusy:
+            flash('Server is busy. Please try again in a moment.', 'error')
+            return render_template('login.html'), 503
+        
+        if valid:
+            login_limiter.reset(username)
+            # Upgrade the stored hash if the configured cost has changed
+            if password_hasher.needs_rehash(user.password):
+                try:
+                    user.password = password_hasher.hash(password)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error: {str(e)}")  # For debugging
+            login_user(user)
             return redirect('/user_dashboard')
         else:
             flash('Invalid username or password!', 'error')
@@ -65,9 +214,14 @@ def register():
             return redirect('/register')
             
         # Create new user with hashed password
+        try:
+            hashed_password = password_hasher.hash(password)
+        except PasswordServiceBusy:
+            flash('Server is busy. Please try again in a moment.', 'error')
+            return redirect('/register')
         user = User(
             username=username,
-            password=generate_password_hash(password),
+            password=hashed_password,
             full_name=full_name,
             qualification=qualification,
             dob=dob
@@ -82,118 +236,239 @@ def register():
 @app.route('/logout')
 def logout():
     session.pop('user_id', None)
+    session.pop('user', None)
     return redirect('/')
 
-# Route: User dashboard
-@app.route('/user_dashboard')
-def user_dashboard():
-    if 'user_id' not in session:
-        return redirect('/login')
-    
-    # Get all upcoming quizzes across all subjects and chapters
-    upcoming_quizzes = db.session.query(
-        Quiz, Chapter, Subject,
-        func.count(Question.id).label('question_count')
+def upcoming_quizzes_page(after=''):
+    """One page of upcoming (Quiz, Chapter, Subject) rows ordered by date then id.
+
+    after is the "<date>_<quiz id>" cursor of the last row on the previous
+    page. Returns (rows, cursor for the next page or None); raises ValueError
+    for a malformed cursor.
+    """
+    upcoming_query = db.session.query(
+        Quiz, Chapter, Subject
     ).join(
         Chapter, Quiz.chapter_id == Chapter.id
     ).join(
         Subject, Chapter.subject_id == Subject.id
-    ).outerjoin(
-        Question, Quiz.id == Question.quiz_id
-    ).group_by(
-        Quiz.id
-    ).order_by(
-        Quiz.date_of_quiz
-    ).all()
+    ).filter(
+        Quiz.date_of_quiz >= date.today()
+    )
+
+    if after:
+        after_date, after_id = after.split('_')
+        after_date = datetime.strptime(after_date, '%Y-%m-%d').date()
+        after_id = int(after_id)
+        upcoming_query = upcoming_query.filter(or_(
+            Quiz.date_of_quiz > after_date,
+            and_(Quiz.date_of_quiz == after_date, Quiz.id > after_id)
+        ))
+
+    rows = upcoming_query.order_by(
+        Quiz.date_of_quiz, Quiz.id
+    ).limit(QUIZZES_PER_PAGE + 1).all()
+
+    next_after = None
+    if len(rows) > QUIZZES_PER_PAGE:
+        rows = rows[:QUIZZES_PER_PAGE]
+        last_quiz = rows[-1][0]
+        next_after = f'{last_quiz.date_of_quiz.isoformat()}_{last_quiz.id}'
+    return rows, next_after
+
+# Route: User dashboard
+@app.route('/user_dashboard')
+@login_required
+@page_cache.cached('quizzes')
+def user_dashboard():
+    # Get the next page of upcoming quizzes
+    after = request.args.get('after', '')
+    try:
+        upcoming_quizzes, next_after = upcoming_quizzes_page(after)
+    except ValueError:
+        return redirect(url_for('user_dashboard'))
 
-    return render_template('user_dashboard.html', upcoming_quizzes=upcoming_quizzes)
+    return render_template('user_dashboard.html',
+                         upcoming_quizzes=upcoming_quizzes,
+                         next_after=next_after,
+                         paged=bool(after))
 
 # Route: View chapters for a subject
 @app.route('/view_chapters/<int:subject_id>')
+@login_required
+@page_cache.cached('subject:{subject_id}')
 def view_chapters(subject_id):
-    if 'user_id' not in session:
-        return redirect('/login')
-    
     subject = Subject.query.get(subject_id)
     chapters = Chapter.query.filter_by(subject_id=subject_id).all()
     return render_template('view_chapters.html', subject=subject, chapters=chapters)
 
 # Route: View quizzes for a chapter
 @app.route('/view_quizzes/<int:chapter_id>')
+@login_required
+@page_cache.cached('chapter:{chapter_id}')
 def view_quizzes(chapter_id):
-    if 'user_id' not in session:
-        return redirect('/login')
-    
     chapter = Chapter.query.get(chapter_id)
     quizzes = Quiz.query.filter_by(chapter_id=chapter_id).all()
     return render_template('view_quizzes.html', chapter=chapter, quizzes=quizzes)
 
+def record_attempt(quiz, user_id, form):
+    """Grade a submission against the quiz's compiled answer key and save it.
+
+    quiz is the user's view from quiz_cache.for_user(), so a sampled quiz is
+    graded on the questions drawn for them. form maps question_<id> to an
+    option. With the submission queue enabled
+    the attempt is handed to the background writer instead. Returns
+    (score, queued); raises IntegrityError if the attempt already exists.
+    """
+    answer_key = quiz_cache.answer_key(quiz)
+    answers = answer_key.pack(form)
+    score, _ = answer_key.grade(answers)
+    quiz_timers.finish(quiz['id'], user_id)
+
+    # Hand the graded submission to the background writer
+    if submission_queue.enabled:
+        submission_queue.enqueue(quiz['id'], user_id, quiz['chapter_id'], quiz['subject_id'], score,
+                                 answer_key.packed_ids(), answers)
+        return score, True
+
+    # Save the score and the packed answers in one transaction
+    new_score = Score(quiz_id=quiz['id'], user_id=user_id, total_scored=score)
+    new_score.answer_sheet = AnswerSheet(question_ids=answer_key.packed_ids(), answers=answers)
+    db.session.add(new_score)
+    db.session.commit()
+    subject_stats.record_score(quiz['subject_id'], score)
+    leaderboards.record_score(quiz['id'], quiz['chapter_id'], quiz['subject_id'], user_id, score)
+    return score, False
+
+@quiz_timers.on_expire
+def submit_expired_attempt(quiz_id, user_id):
+    """Record an attempt nobody submitted before its deadline, with no answers."""
+    quiz = quiz_cache.get(quiz_id)
+    if quiz is None or submission_queue.is_pending(quiz_id, user_id) or \
+            Score.query.filter_by(quiz_id=quiz_id, user_id=user_id).first():
+        return
+    try:
+        record_attempt(quiz_cache.for_user(quiz, user_id, quiz_timers.drawn(quiz_id, user_id)), user_id, {})
+    except IntegrityError:
+        # Submitted through another worker process meanwhile
+        db.session.rollback()
+
+def begin_attempt(quiz, user_id):
+    """Start the user's attempt; returns (their view of the quiz, deadline or None)."""
+    draw = (lambda: quiz_cache.draw(quiz, user_id)) if quiz.get('sample_size') else None
+    deadline, drawn = quiz_timers.begin(quiz, user_id, draw)
+    return quiz_cache.for_user(quiz, user_id, drawn), deadline
+
 # Route: Attempt a quiz
 @app.route('/attempt_quiz/<int:quiz_id>', methods=['GET', 'POST'])
+@login_required
 def attempt_quiz(quiz_id):
-    if 'user_id' not in session:
-        return redirect('/login')
-
-    quiz = Quiz.query.get(quiz_id)
-    questions = Question.query.filter_by(quiz_id=quiz_id).all()
+    quiz = quiz_cache.get(quiz_id)
+    if quiz is None:
+        abort(404)
 
     # Check if user has already completed the quiz
-    existing_score = Score.query.filter_by(quiz_id=quiz_id, user_id=session['user_id']).first()
-    if existing_score:
+    existing_score = Score.query.filter_by(quiz_id=quiz_id, user_id=g.user['id']).first()
+    if existing_score or submission_queue.is_pending(quiz_id, g.user['id']):
         return render_template('quiz_completed.html', quiz=quiz)
 
+    # The first visit starts the clock and fixes the questions this user gets
+    # (their own draw for sampled quizzes); the page counts down from what is left
+    quiz, deadline = begin_attempt(quiz, g.user['id'])
+    questions = quiz['questions']
+
     if request.method == 'POST':
+        # Answers arriving after the deadline are discarded, as on expiry
+        late = quiz_timers.expired(deadline)
         try:
-            # Calculate score based on correct answers
-            score = 0
-            total_questions = len(questions)
-            
-            for question in questions:
-                user_answer = request.form.get(f'question_{question.id}')
-                if user_answer and user_answer == question.correct_option:
-                    score += 1
-            
-            # Save the score
-            new_score = Score(quiz_id=quiz_id, user_id=session['user_id'], total_scored=score)
-            db.session.add(new_score)
-            db.session.commit()
-            
-            flash(f'Quiz completed! Your score: {score}/{total_questions}', 'success')
+            score, _ = record_attempt(quiz, g.user['id'], {} if late else request.form)
+            if late:
+                flash('Time ran out before your answers arrived, so they were not counted.', 'error')
+            else:
+                flash(f'Quiz completed! Your score: {score}/{len(questions)}', 'success')
             return redirect(url_for('view_results', quiz_id=quiz_id))
             
+        except IntegrityError:
+            # Another submission for this quiz and user committed first
+            db.session.rollback()
+            return render_template('quiz_completed.html', quiz=quiz)
         except Exception as e:
             db.session.rollback()
             flash('Error submitting quiz. Please try again.', 'error')
             print(f"Error: {str(e)}")  # For debugging
             return redirect(url_for('attempt_quiz', quiz_id=quiz_id))
 
-    return render_template('attempt_quiz.html', quiz=quiz, questions=questions)
+    remaining = max(0, int(deadline - time.time())) if deadline is not None else None
+    return render_template('attempt_quiz.html', quiz=quiz, questions=questions, remaining=remaining)
 
 # Route: View user's scores
 @app.route('/view_scores')
+@login_required
 def view_scores():
-    if 'user_id' not in session:
-        return redirect('/login')
+    user_id = g.user['id']
+    before = request.args.get('before', type=int)
 
-    scores = Score.query.filter_by(user_id=session['user_id']).all()
-    return render_template('view_scores.html', scores=scores)
+    # Totals across all attempts, computed in SQL
+    attempted, average, best = db.session.query(
+        func.count(Score.id),
+        func.avg(Score.total_scored),
+        func.max(Score.total_scored)
+    ).filter(Score.user_id == user_id).one()
+
+    # Newest attempts first, paged by score id
+    scores_query = Score.query.options(
+        joinedload(Score.quiz)
+    ).filter(
+        Score.user_id == user_id
+    )
+    if before:
+        scores_query = scores_query.filter(Score.id < before)
+    scores = scores_query.order_by(Score.id.desc()).limit(SCORES_PER_PAGE + 1).all()
+
+    next_before = None
+    if len(scores) > SCORES_PER_PAGE:
+        scores = scores[:SCORES_PER_PAGE]
+        next_before = scores[-1].id
+
+    return render_template('view_scores.html',
+                         scores=scores,
+                         attempted=attempted,
+                         average=round(average or 0, 1),
+                         best=best or 0,
+                         next_before=next_before,
+                         paged=bool(before))
+
+def attempted_questions(quiz, user_id, answer_sheet):
+    """Questions of a finished attempt, as recorded on its answer sheet for sampled quizzes."""
+    if not quiz.get('sample_size'):
+        return quiz['questions']
+    if answer_sheet is None:
+        return quiz_cache.for_user(quiz, user_id, quiz_timers.drawn(quiz['id'], user_id))['questions']
+    question_ids = array('q')
+    question_ids.frombytes(answer_sheet.question_ids)
+    return quiz_cache.load_questions(list(question_ids))
 
 # Route: View detailed results for a quiz
 @app.route('/view_results/<int:quiz_id>')
+@login_required
 def view_results(quiz_id):
-    if 'user_id' not in session:
-        return redirect('/login')
-
-    quiz = Quiz.query.get_or_404(quiz_id)
-    score = Score.query.filter_by(quiz_id=quiz_id, user_id=session['user_id']).first_or_404()
-    questions = Question.query.filter_by(quiz_id=quiz_id).all()
+    quiz = quiz_cache.get(quiz_id)
+    if quiz is None:
+        abort(404)
+    score = Score.query.options(
+        joinedload(Score.answer_sheet)
+    ).filter_by(quiz_id=quiz_id, user_id=g.user['id']).first()
+    if score is None:
+        # Submission still waiting for the background writer
+        if submission_queue.is_pending(quiz_id, g.user['id']):
+            return render_template('submission_pending.html', quiz=quiz)
+        abort(404)
+    questions = attempted_questions(quiz, g.user['id'], score.answer_sheet)
     
-    # Get user's answers for each question
+    # Get user's answers for each question from the stored answer sheet
     user_answers = {}
-    for question in questions:
-        user_answer = request.form.get(f'question_{question.id}')
-        if user_answer:
-            user_answers[question.id] = user_answer
+    if score.answer_sheet:
+        user_answers = unpack_answers(score.answer_sheet.question_ids, score.answer_sheet.answers)
     
     return render_template('results.html', 
                          quiz=quiz, 
@@ -201,6 +476,164 @@ def view_results(quiz_id):
                          questions=questions,
                          user_answers=user_answers)
 
+# Route: Status of a queued quiz submission (polled by the results page)
+@app.route('/submission_status/<int:quiz_id>')
+@api_login_required
+def submission_status(quiz_id):
+    user_id = g.user['id']
+    if submission_queue.is_pending(quiz_id, user_id):
+        status = 'pending'
+    elif Score.query.filter_by(quiz_id=quiz_id, user_id=user_id).first():
+        status = 'completed'
+    else:
+        status = 'unknown'
+    return jsonify({'status': status})
+
+# Route: API - the logged-in user and a CSRF token to send as X-CSRFToken on POSTs
+@app.route('/api/v1/session')
+@api_login_required
+def api_session():
+    return jsonify({'user': g.user, 'csrf_token': generate_csrf()})
+
+# Route: API - upcoming quizzes, paged with the cursor returned as "next"
+@app.route('/api/v1/quizzes')
+@api_login_required
+def api_quizzes():
+    try:
+        rows, next_after = upcoming_quizzes_page(request.args.get('after', ''))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    return jsonify({
+        'quizzes': [{
+            'id': quiz.id,
+            'subject': subject.name,
+            'chapter': chapter.name,
+            'date': quiz.date_of_quiz.isoformat(),
+            'duration': quiz.time_duration,
+            'questions': min(quiz.question_count, quiz.sample_size or quiz.question_count)
+        } for quiz, chapter, subject in rows],
+        'next': next_after
+    })
+
+# Route: API - a quiz's questions without answers; questions are
+# [id, statement, option1, option2, option3, option4, option order]. X-Attempt-Deadline
+# gives the Unix time by which answers must be submitted.
+@app.route('/api/v1/quizzes/<int:quiz_id>')
+@api_login_required
+def api_quiz(quiz_id):
+    quiz = quiz_cache.get(quiz_id)
+    if quiz is None:
+        return jsonify({'error': 'Quiz not found'}), 404
+
+    # Fetching the questions starts the attempt's clock
+    quiz, deadline = begin_attempt(quiz, g.user['id'])
+
+    # Serialised once per cached copy; unchanged content revalidates with a 304
+    body, etag = quiz_cache.payload(quiz)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    if deadline is not None:
+        response.headers['X-Attempt-Deadline'] = str(int(deadline))
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+# Route: API - submit answers as {"answers": {"<question id>": "<option 1-4>"}}
+@app.route('/api/v1/quizzes/<int:quiz_id>/submission', methods=['POST'])
+@api_login_required
+def api_submit(quiz_id):
+    quiz = quiz_cache.get(quiz_id)
+    if quiz is None:
+        return jsonify({'error': 'Quiz not found'}), 404
+    answers = (request.get_json(silent=True) or {}).get('answers')
+    if not isinstance(answers, dict):
+        return jsonify({'error': 'Expected {"answers": {question id: option}}'}), 400
+
+    user_id = g.user['id']
+    if submission_queue.is_pending(quiz_id, user_id) or \
+            Score.query.filter_by(quiz_id=quiz_id, user_id=user_id).first():
+        return jsonify({'error': 'Quiz already attempted'}), 409
+
+    # Answers arriving after the deadline are discarded, as on expiry
+    quiz, deadline = begin_attempt(quiz, user_id)
+    late = quiz_timers.expired(deadline)
+    try:
+        form = {} if late else {
+            f'question_{question_id}': str(option) for question_id, option in answers.items()
+        }
+        score, queued = record_attempt(quiz, user_id, form)
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Quiz already attempted'}), 409
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error: {str(e)}")  # For debugging
+        return jsonify({'error': 'Error submitting quiz'}), 500
+
+    return jsonify({
+        'status': 'pending' if queued else 'completed',
+        'score': score,
+        'total': len(quiz['questions']),
+        'late': late
+    }), 201
+
+# Route: API - result of the user's attempt; questions are
+# [id, your answer or null, correct option]
+@app.route('/api/v1/quizzes/<int:quiz_id>/result')
+@api_login_required
+def api_result(quiz_id):
+    quiz = quiz_cache.get(quiz_id)
+    if quiz is None:
+        return jsonify({'error': 'Quiz not found'}), 404
+    score = Score.query.options(
+        joinedload(Score.answer_sheet)
+    ).filter_by(quiz_id=quiz_id, user_id=g.user['id']).first()
+    if score is None:
+        if submission_queue.is_pending(quiz_id, g.user['id']):
+            return jsonify({'status': 'pending'}), 202
+        return jsonify({'error': 'Quiz not attempted'}), 404
+
+    questions = attempted_questions(quiz, g.user['id'], score.answer_sheet)
+    user_answers = {}
+    if score.answer_sheet:
+        user_answers = unpack_answers(score.answer_sheet.question_ids, score.answer_sheet.answers)
+    return jsonify({
+        'status': 'completed',
+        'score': score.total_scored,
+        'total': len(questions),
+        'attempted_at': score.attempted_at.isoformat() if score.attempted_at else None,
+        'questions': [
+            [question['id'], user_answers.get(question['id']), question['correct_option']]
+            for question in questions
+        ]
+    })
+
+# Route: API - top entries of a quiz, chapter or subject leaderboard and the
+# user's own rank; chapter and subject boards rank by the sum of quiz scores
+@app.route('/api/v1/leaderboards/<scope>/<int:scope_id>')
+@api_login_required
+def api_leaderboard(scope, scope_id):
+    if scope not in LEADERBOARD_SCOPES:
+        return jsonify({'error': 'Unknown leaderboard'}), 404
+    limit = min(max(request.args.get('limit', 10, type=int), 1), LEADERBOARD_MAX_LIMIT)
+    top, mine, entrants = leaderboards.standings(scope, scope_id, g.user['id'], limit)
+
+    # Names for the listed users only; ranks themselves need no queries
+    names = dict(db.session.query(User.id, User.full_name).filter(
+        User.id.in_([user_id for _, user_id, _ in top])
+    )) if top else {}
+    return jsonify({
+        'scope': scope,
+        'id': scope_id,
+        'entrants': entrants,
+        'top': [{
+            'rank': rank,
+            'user_id': user_id,
+            'name': names.get(user_id, ''),
+            'score': total
+        } for rank, user_id, total in top],
+        'me': {'rank': mine[0], 'score': mine[1]} if mine else None
+    })
+
 # Admin credentials (should be moved to environment variables in production)
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD = "admin123"
@@ -216,6 +649,7 @@ def admin_login():
         username = request.form['username']
         password = request.form['password']
         if username == ADMIN_USERNAME and password == ADMIN_PASSWORD:
+            session.regenerate()
             session['admin'] = True
             flash('Welcome Admin!', 'success')
             return redirect('/admin_dashboard')
@@ -226,12 +660,12 @@ def admin_login():
 
 # Route: Admin dashboard
 @app.route('/admin_dashboard')
+@admin_required
 def admin_dashboard():
-    if 'admin' not in session:
-        return redirect('/admin_login')
     subjects = Subject.query.all()
     users = User.query.all()
-    return render_template('admin_dashboard.html', subjects=subjects, users=users)
+    return render_template('admin_dashboard.html', subjects=subjects, users=users,
+                           export_jobs=job_queue.recent(10), export_formats=exports.FORMATS)
 
 # Route: Admin logout
 @app.route('/admin_logout')
@@ -241,10 +675,8 @@ def admin_logout():
 
 # Route: Add new subject
 @app.route('/add_subject', methods=['POST'])
+@admin_required
 def add_subject():
-    if 'admin' not in session:
-        flash('Please login as admin first!', 'error')
-        return redirect('/admin_login')
     try:
         name = request.form.get('name', '').strip()
         description = request.form.get('description', '').strip()
@@ -261,6 +693,7 @@ def add_subject():
         new_subject = Subject(name=name, description=description)
         db.session.add(new_subject)
         db.session.commit()
+        subject_stats.invalidate()
         flash('Subject added successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -269,30 +702,37 @@ def add_subject():
 
 # Route: Delete a subject
 @app.route('/delete_subject/<int:id>')
+@admin_required
 def delete_subject(id):
-    if 'admin' not in session:
-        return redirect('/admin_login')
     subject = Subject.query.get(id)
     if subject:
+        # Chapters, quizzes, questions and scores go with it (ON DELETE CASCADE)
+        quiz_ids = [quiz_id for quiz_id, in db.session.query(Quiz.id).join(
+            Chapter, Quiz.chapter_id == Chapter.id
+        ).filter(Chapter.subject_id == id)]
+        chapter_ids = [chapter_id for chapter_id, in db.session.query(Chapter.id).filter(Chapter.subject_id == id)]
         db.session.delete(subject)
         db.session.commit()
+        subject_stats.invalidate()
+        leaderboards.invalidate()
+        for quiz_id in quiz_ids:
+            quiz_cache.invalidate(quiz_id)
+        page_cache.bump(f'subject:{id}', 'quizzes', *[f'chapter:{chapter_id}' for chapter_id in chapter_ids])
     return redirect('/admin_dashboard')
 
 # Route: Manage chapters for a subject
 @app.route('/manage_chapters/<int:subject_id>')
+@admin_required
+@page_cache.cached('subject:{subject_id}', per_session=True)
 def manage_chapters(subject_id):
-    if 'admin' not in session:
-        return redirect('/admin_login')
     subject = Subject.query.get(subject_id)
     chapters = Chapter.query.filter_by(subject_id=subject_id).all()
     return render_template('manage_chapters.html', subject=subject, chapters=chapters)
 
 # Route: Add new chapter
 @app.route('/add_chapter/<int:subject_id>', methods=['POST'])
+@admin_required
 def add_chapter(subject_id):
-    if 'admin' not in session:
-        flash('Please login as admin first!', 'error')
-        return redirect('/admin_login')
     try:
         name = request.form.get('name', '').strip()
         
@@ -308,6 +748,8 @@ def add_chapter(subject_id):
         new_chapter = Chapter(name=name, subject_id=subject_id)
         db.session.add(new_chapter)
         db.session.commit()
+        subject_stats.invalidate()
+        page_cache.bump(f'subject:{subject_id}')
         flash('Chapter added successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -316,30 +758,34 @@ def add_chapter(subject_id):
 
 # Route: Delete a chapter
 @app.route('/delete_chapter/<int:id>')
+@admin_required
 def delete_chapter(id):
-    if 'admin' not in session:
-        return redirect('/admin_login')
     chapter = Chapter.query.get(id)
     if chapter:
+        # Quizzes, questions and scores go with it (ON DELETE CASCADE)
+        quiz_ids = [quiz_id for quiz_id, in db.session.query(Quiz.id).filter(Quiz.chapter_id == id)]
+        subject_id = chapter.subject_id
         db.session.delete(chapter)
         db.session.commit()
+        subject_stats.invalidate()
+        leaderboards.invalidate()
+        for quiz_id in quiz_ids:
+            quiz_cache.invalidate(quiz_id)
+        page_cache.bump(f'subject:{subject_id}', f'chapter:{id}', 'quizzes')
     return redirect('/admin_dashboard')
 
 # Route: Manage quizzes for a chapter
 @app.route('/manage_quizzes/<int:chapter_id>')
+@admin_required
 def manage_quizzes(chapter_id):
-    if 'admin' not in session:
-        return redirect('/admin_login')
     chapter = Chapter.query.get(chapter_id)
     quizzes = Quiz.query.filter_by(chapter_id=chapter_id).all()
-    return render_template('manage_quizzes.html', chapter=chapter, quizzes=quizzes)
+    return render_template('manage_quizzes.html', chapter=chapter, quizzes=quizzes, export_formats=exports.FORMATS)
 
 # Route: Add new quiz
 @app.route('/add_quiz/<int:chapter_id>', methods=['POST'])
+@admin_required
 def add_quiz(chapter_id):
-    if 'admin' not in session:
-        flash('Please login as admin first!', 'error')
-        return redirect('/admin_login')
     try:
         date_of_quiz = request.form.get('date_of_quiz', '').strip()
         time_duration = request.form.get('time_duration', '').strip()
@@ -348,6 +794,12 @@ def add_quiz(chapter_id):
             flash('Both date and duration are required!', 'error')
             return redirect(f'/manage_quizzes/{chapter_id}')
             
+        try:
+            date_of_quiz = datetime.strptime(date_of_quiz, '%Y-%m-%d').date()
+        except ValueError:
+            flash('Quiz date must be in YYYY-MM-DD format!', 'error')
+            return redirect(f'/manage_quizzes/{chapter_id}')
+            
         try:
             time_duration = int(time_duration)
             if time_duration < 1 or time_duration > 180:
@@ -355,14 +807,28 @@ def add_quiz(chapter_id):
         except ValueError:
             flash('Duration must be between 1 and 180 minutes!', 'error')
             return redirect(f'/manage_quizzes/{chapter_id}')
+
+        # Optional: draw this many questions per attempt from the quiz's bank
+        sample_size = request.form.get('sample_size', '').strip() or None
+        if sample_size is not None:
+            try:
+                sample_size = int(sample_size)
+                if sample_size < 1:
+                    raise ValueError
+            except ValueError:
+                flash('Questions per attempt must be a positive number!', 'error')
+                return redirect(f'/manage_quizzes/{chapter_id}')
             
         new_quiz = Quiz(
             chapter_id=chapter_id,
             date_of_quiz=date_of_quiz,
-            time_duration=time_duration
+            time_duration=time_duration,
+            sample_size=sample_size
         )
         db.session.add(new_quiz)
         db.session.commit()
+        subject_stats.invalidate()
+        page_cache.bump(f'chapter:{chapter_id}', 'quizzes')
         flash('Quiz added successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -371,22 +837,23 @@ def add_quiz(chapter_id):
 
 # Route: Delete a quiz
 @app.route('/delete_quiz/<int:id>')
+@admin_required
 def delete_quiz(id):
-    if 'admin' not in session:
-        return redirect('/admin_login')
     quiz = Quiz.query.get(id)
     if quiz:
+        chapter_id = quiz.chapter_id
         db.session.delete(quiz)
         db.session.commit()
+        subject_stats.invalidate()
+        leaderboards.invalidate()
+        quiz_cache.invalidate(id)
+        page_cache.bump(f'chapter:{chapter_id}', 'quizzes')
     return redirect('/admin_dashboard')
 
 # Route: Manage questions for a quiz
 @app.route('/manage_questions/<int:quiz_id>', methods=['GET', 'POST'])
+@admin_required
 def manage_questions(quiz_id):
-    if 'admin' not in session:
-        flash('Please login as admin first!', 'error')
-        return redirect('/admin_login')
-    
     quiz = Quiz.query.get_or_404(quiz_id)
     questions = Question.query.filter_by(quiz_id=quiz_id).all()
 
@@ -425,7 +892,10 @@ def manage_questions(quiz_id):
                 correct_option=str(correct_option)  # Store as string in database
             )
             db.session.add(new_question)
+            quiz.question_count = Quiz.question_count + 1
             db.session.commit()
+            quiz_cache.invalidate(quiz_id)
+            page_cache.bump('quizzes')
             flash('Question added successfully!', 'success')
 
         except Exception as e:
@@ -439,16 +909,16 @@ def manage_questions(quiz_id):
 
 # Route: Delete a question
 @app.route('/delete_question/<int:question_id>', methods=['POST'])
+@admin_required
 def delete_question(question_id):
-    if 'admin' not in session:
-        flash('Please login as admin first!', 'error')
-        return redirect('/admin_login')
-    
     try:
         question = Question.query.get_or_404(question_id)
         quiz_id = question.quiz_id
         db.session.delete(question)
+        Quiz.query.filter_by(id=quiz_id).update({Quiz.question_count: Quiz.question_count - 1})
         db.session.commit()
+        quiz_cache.invalidate(quiz_id)
+        page_cache.bump('quizzes')
         flash('Question deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -457,35 +927,156 @@ def delete_question(question_id):
     
     return redirect(url_for('manage_questions', quiz_id=quiz_id))
 
+# Route: Bulk import questions from a CSV or JSON Lines upload
+@app.route('/import_questions/<int:quiz_id>', methods=['POST'])
+@admin_required
+def import_questions(quiz_id):
+    Quiz.query.get_or_404(quiz_id)
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Please choose a CSV or JSONL file to import!', 'error')
+        return redirect(url_for('manage_questions', quiz_id=quiz_id))
+
+    try:
+        fmt = question_io.format_for(upload.filename)
+        imported, error_count, errors = question_io.import_questions(quiz_id, upload.stream, fmt)
+        flash(f'Imported {imported} questions.', 'success')
+        if error_count:
+            flash(f'Skipped {error_count} invalid rows. ' + ' '.join(errors), 'error')
+    except Exception as e:
+        db.session.rollback()
+        flash('Error importing questions. Please check the file and try again.', 'error')
+        print(f"Error: {str(e)}")  # For debugging
+    quiz_cache.invalidate(quiz_id)
+    page_cache.bump('quizzes')
+
+    return redirect(url_for('manage_questions', quiz_id=quiz_id))
+
+# Route: Stream a quiz's questions as CSV or JSON Lines
+@app.route('/export_questions/<int:quiz_id>')
+@admin_required
+def export_questions(quiz_id):
+    Quiz.query.get_or_404(quiz_id)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in question_io.FORMATS:
+        abort(400)
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(question_io.export_questions(quiz_id, fmt)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=quiz_{quiz_id}_questions.{fmt}'}
+    )
+
+# Route: Item analysis for a quiz's questions, as last computed
+@app.route('/item_analysis/<int:quiz_id>')
+@admin_required
+def item_analysis(quiz_id):
+    quiz = Quiz.query.get_or_404(quiz_id)
+    rows = db.session.query(Question, ItemStat).outerjoin(
+        ItemStat, ItemStat.question_id == Question.id
+    ).filter(Question.quiz_id == quiz_id).order_by(Question.id).all()
+    computed_at = max((stat.computed_at for _, stat in rows if stat), default=None)
+    return render_template('item_analysis.html', quiz=quiz, rows=rows, computed_at=computed_at)
+
+# Route: Recompute item analysis for a quiz (`flask item-analysis` does it offline)
+@app.route('/run_item_analysis/<int:quiz_id>', methods=['POST'])
+@admin_required
+def run_item_analysis(quiz_id):
+    Quiz.query.get_or_404(quiz_id)
+    try:
+        sheets = analytics.analyse_quiz(quiz_id)
+        flash(f'Analysed {sheets} responses.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('Error computing item analysis.', 'error')
+        print(f"Error: {str(e)}")  # For debugging
+    return redirect(url_for('item_analysis', quiz_id=quiz_id))
+
+@job_queue.task('export_results')
+def export_results_job(job):
+    params = job.params
+    os.makedirs(app.config['EXPORT_DIR'], exist_ok=True)
+    filename = exports.filename_for(params['scope'], params['scope_id'], params['format'], job.id)
+    exports.export_results(os.path.join(app.config['EXPORT_DIR'], filename),
+                           params['scope'], params['scope_id'], params['format'], progress=job.progress)
+    return filename
+
+# Route: Regrade a quiz's stored answers after an answer-key correction (`flask regrade` does it offline)
+@app.route('/regrade_quiz/<int:quiz_id>', methods=['POST'])
+@admin_required
+def regrade_quiz_route(quiz_id):
+    Quiz.query.get_or_404(quiz_id)
+    try:
+        sheets, changed = regrade_quiz(quiz_id)
+        if changed:
+            subject_stats.invalidate()
+            leaderboards.invalidate()
+        flash(f'Regraded {sheets} responses; {changed} scores changed.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('Error regrading quiz.', 'error')
+        print(f"Error: {str(e)}")  # For debugging
+    return redirect(url_for('manage_questions', quiz_id=quiz_id))
+
+# Route: Queue a results export for a quiz or subject
+@app.route('/export_results', methods=['POST'])
+@admin_required
+def export_results():
+    scope = request.form.get('scope')
+    fmt = request.form.get('format', 'csv')
+    scope_id = request.form.get('scope_id', type=int)
+    if scope not in exports.SCOPES or fmt not in exports.FORMATS or scope_id is None:
+        flash('Invalid export request!', 'error')
+        return redirect('/admin_dashboard')
+
+    if scope == 'quiz':
+        quiz = Quiz.query.get_or_404(scope_id)
+        label = f'{quiz.chapter.name} quiz on {quiz.date_of_quiz}'
+    else:
+        label = Subject.query.get_or_404(scope_id).name
+    try:
+        job_queue.submit('export_results', {'scope': scope, 'scope_id': scope_id, 'format': fmt, 'label': label})
+        flash(f'Export of {label} results queued. It will appear below when ready.', 'success')
+    except Exception as e:
+        flash('Error queueing export. Please try again.', 'error')
+        print(f"Error: {str(e)}")  # For debugging
+    return redirect('/admin_dashboard')
+
+# Route: Export job status (polled by the admin dashboard)
+@app.route('/export_jobs/<int:job_id>')
+@admin_required
+def export_job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None or job['kind'] != 'export_results':
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({
+        'id': job['id'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'total': job['total'],
+        'error': job['error'],
+        'download_url': url_for('download_export', job_id=job_id) if job['status'] == 'done' else None
+    })
+
+# Route: Download a finished export
+@app.route('/export_jobs/<int:job_id>/download')
+@admin_required
+def download_export(job_id):
+    job = job_queue.get(job_id)
+    if job is None or job['kind'] != 'export_results' or job['status'] != 'done':
+        abort(404)
+    return send_from_directory(app.config['EXPORT_DIR'], job['artefact'], as_attachment=True)
+
 # Route: Admin summary/analytics
 @app.route('/admin_summary')
+@admin_required
 def admin_summary():
-    if 'admin' not in session:
-        return redirect('/admin_login')
-    
-    # Get all subjects
-    subjects = Subject.query.all()
-    subject_names = [subject.name for subject in subjects]
-    
-    # Calculate top scores and attempts for each subject
-    top_scores = []
-    attempts_count = []
-    
-    for subject in subjects:
-        chapters = Chapter.query.filter_by(subject_id=subject.id).all()
-        chapter_ids = [chapter.id for chapter in chapters]
-        quizzes = Quiz.query.filter(Quiz.chapter_id.in_(chapter_ids)).all()
-        quiz_ids = [quiz.id for quiz in quizzes]
-        
-        if quiz_ids:
-            top_score = db.session.query(func.max(Score.total_scored)).filter(Score.quiz_id.in_(quiz_ids)).scalar() or 0
-            attempts = Score.query.filter(Score.quiz_id.in_(quiz_ids)).count()
-        else:
-            top_score = 0
-            attempts = 0
-            
-        top_scores.append(top_score)
-        attempts_count.append(attempts)
+    # Top scores and attempts per subject from the cached rollup
+    stats = subject_stats.all()
+    subject_names = [row['name'] for row in stats]
+    top_scores = [row['top_score'] for row in stats]
+    attempts_count = [row['attempts'] for row in stats]
     
     return render_template('admin_summary.html', 
                          subjects=subject_names,
@@ -494,34 +1085,35 @@ def admin_summary():
 
 # Route: User summary/analytics
 @app.route('/user_summary')
+@login_required
 def user_summary():
-    if 'user_id' not in session:
-        return redirect('/login')
+    user_id = g.user['id']
     
-    user_id = session['user_id']
+    # Subject quiz counts come from the cached rollup
+    stats = subject_stats.all()
+    subject_names = [row['name'] for row in stats]
+    quiz_counts = [row['quiz_count'] for row in stats]
     
-    # Get all subjects and their quiz counts
-    subjects = Subject.query.all()
-    subject_names = [subject.name for subject in subjects]
-    quiz_counts = []
+    # Last 6 calendar months, oldest first, as (year, month) buckets
+    now = datetime.now()
+    buckets = []
+    for i in range(5, -1, -1):
+        year, month = divmod(now.year * 12 + now.month - 1 - i, 12)
+        buckets.append((year, month + 1))
+    start = datetime(buckets[0][0], buckets[0][1], 1)
     
-    for subject in subjects:
-        chapters = Chapter.query.filter_by(subject_id=subject.id).all()
-        chapter_ids = [chapter.id for chapter in chapters]
-        quiz_count = Quiz.query.filter(Quiz.chapter_id.in_(chapter_ids)).count()
-        quiz_counts.append(quiz_count)
+    # Get monthly attempts data in one grouped query
+    month_key = func.strftime('%Y-%m', Score.attempted_at)
+    rows = db.session.query(
+        month_key, func.count(Score.id)
+    ).filter(
+        Score.user_id == user_id,
+        Score.attempted_at >= start
+    ).group_by(month_key).all()
+    counts = dict(rows)
     
-    # Get monthly attempts data
-    current_month = datetime.now().month
-    months = []
-    monthly_attempts = []
-    
-    for i in range(6):  # Last 6 months
-        month_num = ((current_month - i - 1) % 12) + 1
-        month_name = calendar.month_name[month_num]
-        months.insert(0, month_name)
-        attempts = Score.query.filter_by(user_id=user_id).count()
-        monthly_attempts.insert(0, attempts)
+    months = [calendar.month_name[month] for year, month in buckets]
+    monthly_attempts = [counts.get(f'{year:04d}-{month:02d}', 0) for year, month in buckets]
     
     return render_template('user_summary.html',
                          subjects=subject_names,
@@ -531,43 +1123,56 @@ def user_summary():
 
 # Route: Admin search functionality
 @app.route('/admin_search')
+@admin_required
 def admin_search():
-    if 'admin' not in session:
-        return redirect('/admin_login')
-    
     query = request.args.get('q', '')
+    page = max(request.args.get('page', 1, type=int), 1)
     
-    # Search across users, subjects, and quizzes
-    users = User.query.filter(or_(
-        User.username.ilike(f'%{query}%'),
-        User.full_name.ilike(f'%{query}%')
-    )).all()
+    # Ranked full-text matches, one page per section; fetch one extra row to detect more pages
+    limit = SEARCH_RESULTS_PER_PAGE + 1
+    offset = (page - 1) * SEARCH_RESULTS_PER_PAGE
+    users = search(User, query, limit, offset)
+    subjects = search(Subject, query, limit, offset)
+    questions = search(Question, query, limit, offset)
+    chapter_ids = search_ids('chapter', query, limit, offset)
     
-    subjects = Subject.query.filter(or_(
-        Subject.name.ilike(f'%{query}%'),
-        Subject.description.ilike(f'%{query}%')
-    )).all()
+    # Quizzes in the matching chapters, or held on the searched date
+    quiz_filters = []
+    if chapter_ids:
+        quiz_filters.append(Quiz.chapter_id.in_(chapter_ids[:SEARCH_RESULTS_PER_PAGE]))
+    try:
+        quiz_filters.append(Quiz.date_of_quiz == datetime.strptime(query.strip(), '%Y-%m-%d').date())
+    except ValueError:
+        pass
+    quizzes = []
+    if quiz_filters:
+        quizzes = Quiz.query.options(
+            joinedload(Quiz.chapter)
+        ).filter(or_(*quiz_filters)).order_by(Quiz.date_of_quiz, Quiz.id).limit(SEARCH_RESULTS_PER_PAGE).all()
     
-    chapters = Chapter.query.filter(Chapter.name.ilike(f'%{query}%')).all()
-    chapter_ids = [chapter.id for chapter in chapters]
-    quizzes = Quiz.query.filter(or_(
-        Quiz.chapter_id.in_(chapter_ids),
-        Quiz.date_of_quiz.ilike(f'%{query}%')
-    )).all()
+    has_more = any(len(results) > SEARCH_RESULTS_PER_PAGE
+                   for results in (users, subjects, questions, chapter_ids))
     
     return render_template('admin_search.html', 
-                         users=users, 
-                         subjects=subjects, 
+                         users=users[:SEARCH_RESULTS_PER_PAGE], 
+                         subjects=subjects[:SEARCH_RESULTS_PER_PAGE], 
+                         questions=questions[:SEARCH_RESULTS_PER_PAGE],
                          quizzes=quizzes,
-                         query=query)
+                         query=query,
+                         page=page,
+                         has_more=has_more)
+
+# Route: Request metrics in Prometheus text format
+@app.route('/metrics')
+def metrics():
+    if not app.config['METRICS_PUBLIC'] and not session.get('admin'):
+        abort(403)
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
 
 # Route: View question details
 @app.route('/view_question/<int:question_id>')
+@admin_required
 def view_question(question_id):
-    if 'admin' not in session:
-        flash('Please login as admin first!', 'error')
-        return redirect('/admin_login')
-    
     try:
         question = Question.query.get_or_404(question_id)
         return jsonify({
@@ -583,6 +1188,159 @@ def view_question(question_id):
         print(f"Error: {str(e)}")  # For debugging
         return jsonify({'error': 'Error fetching question details'}), 500
 
+# CLI: flask import-questions <quiz_id> <file>
+@app.cli.command('import-questions')
+@click.argument('quiz_id', type=int)
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(question_io.FORMATS), help='Defaults to the file extension')
+def import_questions_command(quiz_id, path, fmt):
+    """Bulk import questions into a quiz from CSV or JSON Lines."""
+    if not Quiz.query.get(quiz_id):
+        raise click.ClickException(f'Quiz {quiz_id} does not exist')
+    with open(path, 'rb') as stream:
+        imported, error_count, errors = question_io.import_questions(
+            quiz_id, stream, fmt or question_io.format_for(path)
+        )
+    quiz_cache.invalidate(quiz_id)
+    page_cache.bump('quizzes')
+    for error in errors:
+        click.echo(error, err=True)
+    click.echo(f'Imported {imported} questions, skipped {error_count} invalid rows')
+
+# CLI: flask export-questions <quiz_id> [file]
+@app.cli.command('export-questions')
+@click.argument('quiz_id', type=int)
+@click.argument('output', type=click.File('w'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(question_io.FORMATS), default='csv')
+def export_questions_command(quiz_id, output, fmt):
+    """Stream a quiz's questions to a file (or stdout) as CSV or JSON Lines."""
+    for chunk in question_io.export_questions(quiz_id, fmt):
+        output.write(chunk)
+
+# CLI: flask item-analysis [QUIZ_ID...]
+@app.cli.command('item-analysis')
+@click.argument('quiz_ids', type=int, nargs=-1)
+def item_analysis_command(quiz_ids):
+    """Recompute item statistics for the given quizzes, or for every quiz."""
+    if not quiz_ids:
+        quiz_ids = [quiz_id for quiz_id, in db.session.query(Quiz.id).order_by(Quiz.id)]
+    for quiz_id in quiz_ids:
+        started = time.perf_counter()
+        sheets = analytics.analyse_quiz(quiz_id)
+        click.echo(f'Quiz {quiz_id}: {sheets} responses in {time.perf_counter() - started:.2f}s')
+
+# CLI: flask regrade [QUIZ_ID...]
+@app.cli.command('regrade')
+@click.argument('quiz_ids', type=int, nargs=-1)
+def regrade_command(quiz_ids):
+    """Regrade stored answer sheets against the current answer keys, e.g. after a key correction."""
+    if not quiz_ids:
+        quiz_ids = [quiz_id for quiz_id, in db.session.query(Quiz.id).order_by(Quiz.id)]
+    total_changed = 0
+    for quiz_id in quiz_ids:
+        started = time.perf_counter()
+        sheets, changed = regrade_quiz(quiz_id)
+        total_changed += changed
+        click.echo(f'Quiz {quiz_id}: {sheets} responses, {changed} scores changed '
+                   f'in {time.perf_counter() - started:.2f}s')
+    if total_changed:
+        subject_stats.invalidate()
+        leaderboards.invalidate()
+        if app.config['PAGE_CACHE_BACKEND'] != 'sqlite':
+            click.echo('Running servers pick up the new scores in their analytics and leaderboards '
+                       'within five minutes', err=True)
+
+# CLI: flask build-assets [--no-vendor] [--force]
+@app.cli.command('build-assets')
+@click.option('--vendor/--no-vendor', default=True, help='Download missing CDN assets into static/vendor first')
+@click.option('--force', is_flag=True, help='Download vendor assets again even if present')
+def build_assets_command(vendor, force):
+    """Vendor, minify, fingerprint and pre-compress static files into static/dist."""
+    if vendor:
+        try:
+            for name in asset_pipeline.vendor(app.static_folder, force=force):
+                click.echo(f'Vendored {name}')
+        except OSError as e:
+            raise click.ClickException(f'Could not download vendor assets: {e}')
+    manifest = asset_pipeline.build(app.static_folder)
+    if asset_pipeline.brotli is None:
+        click.echo('brotli is not installed; built gzip variants only', err=True)
+    click.echo(f'Built {len(manifest)} assets; restart the app to serve them')
+
+def warm_templates():
+    names = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return f'{len(names)} templates'
+
+def warm_quizzes():
+    # The next quizzes to be taken, with their answer keys and API payloads
+    quiz_ids = [quiz_id for quiz_id, in db.session.query(Quiz.id).filter(
+        Quiz.date_of_quiz >= date.today()
+    ).order_by(Quiz.date_of_quiz, Quiz.id).limit(app.config['SERVER_WARM_QUIZZES'])]
+    for quiz_id in quiz_ids:
+        quiz = quiz_cache.get(quiz_id)
+        if quiz is not None and not quiz.get('sample_size'):
+            quiz_cache.answer_key(quiz)
+            quiz_cache.payload(quiz)
+    return f'{len(quiz_ids)} quizzes'
+
+def warm_rollups():
+    subjects = len(subject_stats.all())
+    boards = leaderboards.preload()
+    return f'{subjects} subject rollups and {boards} leaderboards'
+
+# CLI: flask serve [--host HOST] [--port PORT] [--workers N] [--no-warm]
+@app.cli.command('serve', with_appcontext=False)
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8000, show_default=True, type=int)
+@click.option('--workers', type=int, help='Worker processes (default SERVER_WORKERS)')
+@click.option('--warm/--no-warm', default=True, help='Fill caches and compile templates before forking')
+def serve_command(host, port, workers, warm):
+    """Run the app in pre-forked worker processes for production.
+
+    Analytics rollups and leaderboards live in each worker's memory: scores
+    submitted through one worker reach the others within five minutes.
+    """
+    workers = workers or app.config['SERVER_WORKERS']
+    if workers > 1:
+        # In-memory caches would only be invalidated in the worker handling an
+        # edit; the others would keep serving old questions and pages
+        shared = []
+        if app.config['QUIZ_CACHE_BACKEND'] != 'sqlite':
+            app.config['QUIZ_CACHE_BACKEND'] = 'sqlite'
+            quiz_cache.init_app(app)
+            shared.append('quiz')
+        if app.config['PAGE_CACHE_BACKEND'] != 'sqlite':
+            app.config['PAGE_CACHE_BACKEND'] = 'sqlite'
+            page_cache.init_app(app)
+            shared.append('page')
+        if shared:
+            click.echo(f"Using the sqlite {' and '.join(shared)} cache backend(s) so workers share invalidations",
+                       err=True)
+        # Each worker has its own hashing pool; together they should fill the
+        # cores once rather than once per worker
+        app.config['PASSWORD_HASH_WORKERS'] = max(1, app.config['PASSWORD_HASH_WORKERS'] // workers)
+        password_hasher.init_app(app)
+
+    with app.app_context():
+        conn = db.engine.raw_connection()
+        try:
+            version = migrations.current_version(conn)
+        finally:
+            conn.close()
+    if version < migrations.LATEST_VERSION:
+        click.echo('Database schema is out of date; run `python database_setup.py`', err=True)
+
+    server = PreforkServer(
+        app, host=host, port=port,
+        workers=workers,
+        warmers=[warm_templates, warm_quizzes, warm_rollups] if warm else [],
+        # Commit queued submissions and stop hashing processes as each worker exits
+        on_worker_exit=[submission_queue.close, lambda: password_hasher.shutdown(wait=True)]
+    )
+    server.serve()
+
 # Run the application
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,31 @@
+# ASGI entry point: serve the app from an event loop, e.g.
+#   pip install -r requirements.txt uvicorn
+#   uvicorn asgi:application --workers 4
+# Idle and slow connections are held by the loop, and each request runs the
+# (synchronous) Flask app on one of ASGI_THREADS threads per process.
+# asgiref's WsgiToAsgi would run every request on a single shared thread
+# (sync_to_async's thread_sensitive mode), serving one request at a time.
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from app import app
+
+executor = ThreadPoolExecutor(max_workers=app.config['ASGI_THREADS'], thread_name_prefix='asgi')
+
+
+class ConcurrentWsgiToAsgiInstance(WsgiToAsgiInstance):
+    """One request, run on the shared thread pool instead of asgiref's single thread."""
+
+    async def run_wsgi_app(self, body):
+        run = WsgiToAsgiInstance.run_wsgi_app.__wrapped__
+        await sync_to_async(run, thread_sensitive=False, executor=executor)(self, body)
+
+
+class ConcurrentWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await ConcurrentWsgiToAsgiInstance(self.wsgi_application)(scope, receive, send)
+
+
+application = ConcurrentWsgiToAsgi(app)
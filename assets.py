@@ -0,0 +1,234 @@
+# Static asset pipeline: vendor CDN files, minify, fingerprint and pre-compress
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import urllib.request
+from urllib.parse import urljoin, urlsplit
+
+from flask import request, send_from_directory, url_for, abort, current_app
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip variants are built without it
+    brotli = None
+
+# Third-party files served from static/vendor/ once vendored: path -> CDN URL.
+# Stylesheets are scanned for url() references (fonts) which are vendored too.
+VENDOR = {
+    'vendor/bootstrap/css/bootstrap.min.css':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css',
+    'vendor/bootstrap/js/bootstrap.bundle.min.js':
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'vendor/fontawesome/css/all.min.css':
+        'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css',
+    'vendor/jetbrains-mono/jetbrains-mono.css':
+        'https://fonts.googleapis.com/css2?family=JetBrains+Mono:wght@400;700&display=swap',
+    'vendor/chart.js/chart.umd.js':
+        'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js',
+}
+
+# Build output, relative to the static folder
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+# Extensions worth pre-compressing (fonts other than ttf/svg are already compressed)
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ttf', '.eot', '.json')
+
+# Google Fonts picks the font format from the user agent; ask for woff2
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def _fetch(url):
+    with urllib.request.urlopen(urllib.request.Request(url, headers={'User-Agent': USER_AGENT}), timeout=30) as r:
+        return r.read()
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def vendor(static_folder, force=False):
+    """Download VENDOR files (and the fonts their CSS uses) into the static folder.
+
+    Returns the relative paths written.
+    """
+    written = []
+    for name, url in VENDOR.items():
+        path = os.path.join(static_folder, name)
+        if os.path.exists(path) and not force:
+            continue
+        data = _fetch(url)
+        if name.endswith('.css'):
+            data = _vendor_css_references(static_folder, name, url, data.decode('utf-8'), written).encode('utf-8')
+        _write(path, data)
+        written.append(name)
+    return written
+
+
+def _vendor_css_references(static_folder, name, css_url, css, written):
+    # Relative references keep their layout (../webfonts/x.woff2); absolute
+    # ones are saved under fonts/ next to the stylesheet and rewritten
+    base = posixpath.dirname(name)
+
+    def replace(match):
+        reference = match.group(2).strip()
+        if reference.startswith(('data:', '#')):
+            return match.group(0)
+        parts = urlsplit(reference)
+        if parts.scheme:
+            local, suffix = posixpath.join('fonts', posixpath.basename(parts.path)), ''
+        else:
+            local, suffix = parts.path, reference[len(parts.path):]
+        target = posixpath.normpath(posixpath.join(base, local))
+        if target not in written:
+            _write(os.path.join(static_folder, target), _fetch(urljoin(css_url, reference)))
+            written.append(target)
+        return f'url({local}{suffix})'
+
+    return CSS_URL.sub(replace, css)
+
+
+def minify_css(css):
+    """Strip comments and collapse whitespace; good enough for hand-written CSS."""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+def _fingerprint(name, data):
+    root, extension = posixpath.splitext(name)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+
+
+def build(static_folder):
+    """Minify, fingerprint and pre-compress every static file into dist/.
+
+    Writes dist/manifest.json mapping original names to fingerprinted ones.
+    Non-CSS files are processed first so stylesheets can point their url()
+    references at the fingerprinted fonts and images.
+    """
+    dist = os.path.join(static_folder, DIST)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+
+    names = []
+    for directory, subdirectories, files in os.walk(static_folder):
+        subdirectories[:] = [d for d in subdirectories if os.path.join(directory, d) != dist]
+        for filename in files:
+            names.append(posixpath.join(*os.path.relpath(os.path.join(directory, filename), static_folder).split(os.sep)))
+    names.sort(key=lambda name: (name.endswith('.css'), name))
+
+    manifest = {}
+    for name in names:
+        with open(os.path.join(static_folder, name), 'rb') as f:
+            data = f.read()
+        if name.endswith('.css'):
+            css = _rewrite_css_references(name, data.decode('utf-8'), manifest)
+            if not name.endswith('.min.css'):
+                css = minify_css(css)
+            data = css.encode('utf-8')
+        hashed = _fingerprint(name, data)
+        path = os.path.join(dist, hashed)
+        _write(path, data)
+        if name.endswith(COMPRESSIBLE):
+            _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                _write(path + '.br', brotli.compress(data, quality=11))
+        manifest[name] = hashed
+
+    _write(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def _rewrite_css_references(name, css, manifest):
+    base = posixpath.dirname(name)
+
+    def replace(match):
+        reference = match.group(2).strip()
+        parts = urlsplit(reference)
+        if parts.scheme or reference.startswith(('data:', '#', '/')):
+            return match.group(0)
+        target = posixpath.normpath(posixpath.join(base, parts.path))
+        hashed = manifest.get(target)
+        if hashed is None:
+            return match.group(0)
+        # The fingerprinted stylesheet stays in the same directory under dist/
+        relative = posixpath.relpath(hashed, base or '.')
+        suffix = reference[len(parts.path):]
+        return f'url({relative}{suffix})'
+
+    return CSS_URL.sub(replace, css)
+
+
+class Assets:
+    """Serves the fingerprinted build with far-future cache headers.
+
+    When dist/manifest.json exists, url_for('static', filename=...) for a
+    built file points at its fingerprinted copy, which is served with an
+    immutable Cache-Control and its pre-compressed .br or .gz variant when
+    the client accepts it. Templates use asset_url(), which also falls back
+    to the CDN for vendor files that have not been downloaded yet.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_age = app.config.get('ASSET_MAX_AGE', 31536000)
+        self.dist_folder = os.path.join(app.static_folder, DIST)
+        self.load_manifest()
+        app.url_defaults(self._fingerprinted)
+        app.add_url_rule(f'{app.static_url_path}/{DIST}/<path:filename>', 'assets', self.serve)
+        app.jinja_env.globals['asset_url'] = self.url
+
+    def load_manifest(self):
+        """Read dist/manifest.json; without it files are served unfingerprinted."""
+        self.manifest = {}
+        path = os.path.join(self.dist_folder, MANIFEST)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+
+    def _fingerprinted(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.manifest:
+            values['filename'] = f"{DIST}/{self.manifest[values['filename']]}"
+
+    def url(self, filename):
+        """URL for a static file, preferring the build, then static/, then the CDN."""
+        if filename not in self.manifest and filename in VENDOR and not os.path.exists(
+                os.path.join(current_app.static_folder, filename)):
+            return VENDOR[filename]
+        return url_for('static', filename=filename)
+
+    def serve(self, filename):
+        path = safe_join(self.dist_folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[candidate] and os.path.isfile(path + suffix):
+                encoding = candidate
+                filename += suffix
+                break
+
+        response = send_from_directory(self.dist_folder, filename, mimetype=mimetype, max_age=self.max_age)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = f'public, max-age={self.max_age}, immutable'
+        return response
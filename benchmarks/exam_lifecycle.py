@@ -0,0 +1,417 @@
+# Benchmark: the exam lifecycle under load, against a seeded synthetic database
+#
+# Seeds a scratch database, then drives the app through each scenario (login
+# storm, dashboard browsing, simultaneous quiz submissions, admin summary and
+# search) with concurrent clients, either in process through the Flask test
+# client or over HTTP against a local pre-forked server. Reports p50/p95/p99
+# latency, throughput and (test client only) SQL queries per request, saves the
+# results under benchmarks/results/ and compares them with the previous run.
+#
+# Usage: python benchmarks/exam_lifecycle.py [--mode client|server] [--clients 8]
+#            [--requests 200] [--users 500] [--scenario dashboard ...]
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from glob import glob
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+sys.path.insert(0, ROOT)
+
+# Point the app at a scratch database before it is imported
+SCRATCH_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(SCRATCH_DIR, 'bench.db')
+
+from werkzeug.security import generate_password_hash
+
+import app as quizmaster
+from instrumentation import query_budget
+from models import db, User, Subject, Chapter, Quiz, Question, Score
+from search import ensure_search_index
+from server import PreforkServer
+
+PASSWORD = 'password'
+SEARCH_TERMS = ('subject', 'chapter', 'algebra', 'user 1', 'question 4')
+
+
+# ---------------------------------------------------------------------------
+# Seeding
+
+def seed(args):
+    """Fill the scratch database; returns {quiz_id: [question ids]} for open quizzes."""
+    rng = random.Random(args.seed)
+    today = date.today()
+    with quizmaster.app.app_context():
+        db.create_all()
+        hashed = generate_password_hash(PASSWORD, method=quizmaster.password_hasher.hash_method)
+
+        def insert(model, rows):
+            db.session.execute(model.__table__.insert(), rows)
+
+        insert(User, [{'username': f'user{i}', 'password': hashed, 'full_name': f'User {i}',
+                       'qualification': 'Graduate'} for i in range(args.users)])
+        insert(Subject, [{'name': f'Subject {s}', 'description': f'Algebra and more, part {s}'}
+                         for s in range(args.subjects)])
+        subject_ids = [row[0] for row in db.session.query(Subject.id)]
+        insert(Chapter, [{'subject_id': subject_id, 'name': f'Chapter {c}'}
+                         for subject_id in subject_ids for c in range(args.chapters)])
+        chapter_ids = [row[0] for row in db.session.query(Chapter.id)]
+
+        # Half of each chapter's quizzes are in the past (with score history),
+        # the rest are upcoming and open for the submission scenario
+        quizzes = []
+        for chapter_id in chapter_ids:
+            for q in range(args.quizzes):
+                offset = (q - args.quizzes // 2) * 7
+                quizzes.append({'chapter_id': chapter_id, 'date_of_quiz': today + timedelta(days=offset),
+                                'time_duration': '30', 'question_count': args.questions})
+        insert(Quiz, quizzes)
+        quiz_rows = db.session.query(Quiz.id, Quiz.date_of_quiz).order_by(Quiz.id).all()
+        insert(Question, [
+            {'quiz_id': quiz_id, 'question_statement': f'Question {n} of quiz {quiz_id}',
+             'option1': 'A', 'option2': 'B', 'option3': 'C', 'option4': 'D',
+             'correct_option': str(rng.randint(1, 4))}
+            for quiz_id, _ in quiz_rows for n in range(args.questions)
+        ])
+
+        past = [quiz_id for quiz_id, day in quiz_rows if day < today]
+        scores = []
+        for user_id in range(1, args.users + 1):
+            for quiz_id in rng.sample(past, min(args.scores, len(past))):
+                scores.append({'quiz_id': quiz_id, 'user_id': user_id,
+                               'total_scored': rng.randint(0, args.questions),
+                               'attempted_at': datetime.now() - timedelta(days=rng.randint(1, 365))})
+        insert(Score, scores)
+        db.session.commit()
+        ensure_search_index(db.engine)
+
+        open_quizzes = {}
+        for quiz_id, question_id in db.session.query(Question.quiz_id, Question.id).join(Quiz).filter(
+                Quiz.date_of_quiz >= today).order_by(Question.quiz_id, Question.id):
+            open_quizzes.setdefault(quiz_id, []).append(question_id)
+        db.session.remove()
+        db.engine.dispose()
+    return open_quizzes
+
+
+# ---------------------------------------------------------------------------
+# Clients: the same small interface in process and over HTTP
+
+class TestClient:
+    """Flask test client that also counts the SQL each request issues."""
+
+    def __init__(self):
+        self.client = quizmaster.app.test_client()
+
+    def request(self, method, path, data=None):
+        with query_budget(float('inf')) as stats:
+            response = self.client.open(path, method=method, data=data)
+        return response.status_code, stats.queries
+
+
+class HTTPClient:
+    """Minimal cookie-keeping HTTP client; redirects are not followed."""
+
+    def __init__(self, port):
+        self.port = port
+        self.cookies = SimpleCookie()
+
+    def request(self, method, path, data=None):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        headers = {}
+        body = None
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={m.value}' for k, m in self.cookies.items())
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            for header in response.headers.get_all('Set-Cookie') or []:
+                self.cookies.load(header)
+            return response.status, None
+        finally:
+            connection.close()
+
+
+# ---------------------------------------------------------------------------
+# Scenarios: setup(ctx, client, n) logs client n in untimed; step(ctx, client, n, i)
+# issues one timed request and returns (status, queries)
+
+def login_as(client, n, users):
+    client.request('POST', '/login', {'username': f'user{n % users}', 'password': PASSWORD})
+
+
+def login_storm_step(ctx, client, n, i):
+    user = (n + i * ctx['clients']) % ctx['users']
+    return client.request('POST', '/login', {'username': f'user{user}', 'password': PASSWORD})
+
+
+def browse_step(ctx, client, n, i):
+    path = ('/user_dashboard', '/view_scores', '/user_summary')[i % 3]
+    return client.request('GET', path)
+
+
+def submit_step(ctx, client, n, i):
+    quiz_ids = ctx['quiz_ids']
+    quiz_id = quiz_ids[i % len(quiz_ids)]
+    rng = random.Random(n * 100003 + i)
+    form = {f'question_{question_id}': str(rng.randint(1, 4))
+            for question_id in ctx['open_quizzes'][quiz_id]}
+    return client.request('POST', f'/attempt_quiz/{quiz_id}', form)
+
+
+def admin_summary_step(ctx, client, n, i):
+    return client.request('GET', '/admin_summary')
+
+
+def admin_search_step(ctx, client, n, i):
+    term = SEARCH_TERMS[(n + i) % len(SEARCH_TERMS)]
+    return client.request('GET', '/admin_search?' + urlencode({'q': term}))
+
+
+def login_user(ctx, client, n):
+    login_as(client, n, ctx['users'])
+
+
+def login_submitter(ctx, client, n):
+    # Submitters are users nobody else logs in as, so every (user, quiz) is fresh
+    login_as(client, ctx['users'] - 1 - n, ctx['users'])
+
+
+def login_admin(ctx, client, n):
+    client.request('POST', '/admin_login', {'username': 'admin', 'password': 'admin123'})
+
+
+# name: (setup, step, at most this many requests per client or None)
+SCENARIOS = {
+    'login_storm': (None, login_storm_step, None),
+    'dashboard': (login_user, browse_step, None),
+    'submit_quiz': (login_submitter, submit_step, 'quizzes'),
+    'admin_summary': (login_admin, admin_summary_step, None),
+    'admin_search': (login_admin, admin_search_step, None),
+}
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_scenario(name, make_client, ctx, requests):
+    setup, step, limit = SCENARIOS[name]
+    per_client = max(1, requests // ctx['clients'])
+    if limit == 'quizzes':
+        per_client = min(per_client, len(ctx['quiz_ids']))
+    clients = [make_client() for _ in range(ctx['clients'])]
+    if setup:
+        for n, client in enumerate(clients):
+            setup(ctx, client, n)
+
+    latencies = []
+    queries = []
+    errors = [0]
+    lock = threading.Lock()
+    start = threading.Barrier(ctx['clients'] + 1)
+
+    def worker(n, client):
+        times = []
+        counts = []
+        failed = 0
+        start.wait()
+        for i in range(per_client):
+            started = time.perf_counter()
+            status, count = step(ctx, client, n, i)
+            times.append(time.perf_counter() - started)
+            if status >= 400:
+                failed += 1
+            if count is not None:
+                counts.append(count)
+        with lock:
+            latencies.extend(times)
+            queries.extend(counts)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(n, client)) for n, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'queries_per_request': sum(queries) / len(queries) if queries else None,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Results
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def previous_result(config):
+    """The most recent saved run made with the same settings, if any."""
+    for path in sorted(glob(os.path.join(RESULTS_DIR, '*.json')), reverse=True):
+        with open(path) as f:
+            result = json.load(f)
+        if result.get('config') == config:
+            return path, result
+    return None, None
+
+
+def compare(current, previous, threshold):
+    """Lines describing scenarios that got slower or issue more queries."""
+    regressions = []
+    for name, now in current.items():
+        before = previous.get(name)
+        if not before:
+            continue
+        if before['p95_ms'] and now['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f'{name}: p95 {before["p95_ms"]:.1f} -> {now["p95_ms"]:.1f} ms')
+        if before['throughput'] and now['throughput'] < before['throughput'] * (1 - threshold):
+            regressions.append(f'{name}: throughput {before["throughput"]:.1f} -> {now["throughput"]:.1f} req/s')
+        if (before['queries_per_request'] is not None and now['queries_per_request'] is not None
+                # Cache warm-up varies with thread timing, so allow some slack
+                and now['queries_per_request'] > before['queries_per_request'] + 0.5):
+            regressions.append(f'{name}: queries/request {before["queries_per_request"]:.2f} '
+                               f'-> {now["queries_per_request"]:.2f}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exam lifecycle load test')
+    parser.add_argument('--mode', choices=('client', 'server'), default='client',
+                        help='in-process test client, or HTTP against local pre-forked workers')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='server processes')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                        help='run only these scenarios (repeatable)')
+    parser.add_argument('--subjects', type=int, default=5)
+    parser.add_argument('--chapters', type=int, default=4, help='per subject')
+    parser.add_argument('--quizzes', type=int, default=6, help='per chapter')
+    parser.add_argument('--questions', type=int, default=20, help='per quiz')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--scores', type=int, default=10, help='past attempts per user')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative change in p95 or throughput reported as a regression')
+    parser.add_argument('--no-save', action='store_true', help='do not write a results file')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    app = quizmaster.app
+    app.config['WTF_CSRF_ENABLED'] = False
+    # Slow request and query budget warnings would drown the report
+    app.config['SLOW_REQUEST_SECONDS'] = float('inf')
+    app.config['QUERY_BUDGETS'] = {}
+    # Keep benchmark sessions out of the instance folder
+    app.config['SESSION_DB_PATH'] = os.path.join(SCRATCH_DIR, 'sessions.db')
+    quizmaster.session_store.init_app(app)
+    # Rate limiting would turn the login storm into a stream of 429s
+    quizmaster.login_limiter.limit = float('inf')
+
+    started = time.perf_counter()
+    open_quizzes = seed(args)
+    print(f'Seeded in {time.perf_counter() - started:.1f}s: {args.users} users, '
+          f'{args.subjects * args.chapters * args.quizzes} quizzes, {len(open_quizzes)} open')
+
+    ctx = {
+        'clients': args.clients,
+        'users': args.users,
+        'open_quizzes': open_quizzes,
+        'quiz_ids': sorted(open_quizzes),
+    }
+    # Browsing users come from the front of the table, submitters from the back
+    if args.clients * 2 > args.users:
+        parser.error('--users must be at least twice --clients')
+
+    server = None
+    if args.mode == 'server':
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        # The same preloaded, pre-forked server as `flask serve`
+        server = PreforkServer(
+            app, port=0, workers=args.workers,
+            warmers=[quizmaster.warm_templates, quizmaster.warm_quizzes, quizmaster.warm_rollups],
+            on_worker_exit=[lambda: quizmaster.password_hasher.shutdown(wait=True)]
+        )
+        port = server.start()
+        make_client = lambda: HTTPClient(port)
+    else:
+        make_client = TestClient
+
+    results = {}
+    try:
+        print(f'{args.mode} mode, {args.clients} clients, {args.requests} requests per scenario')
+        print(f'{"scenario":<16}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"errors":>8}')
+        for name in args.scenario or SCENARIOS:
+            result = run_scenario(name, make_client, ctx, args.requests)
+            results[name] = result
+            queries = result['queries_per_request']
+            print(f'{name:<16}{result["throughput"]:>9.1f}{result["p50_ms"]:>9.1f}'
+                  f'{result["p95_ms"]:>9.1f}{result["p99_ms"]:>9.1f}'
+                  f'{"-" if queries is None else f"{queries:.1f}":>9}{result["errors"]:>8}')
+    finally:
+        if server is not None:
+            server.stop()
+        quizmaster.password_hasher.shutdown()
+
+    config = {key: getattr(args, key) for key in (
+        'mode', 'workers', 'clients', 'requests', 'subjects', 'chapters',
+        'quizzes', 'questions', 'users', 'scores', 'seed')}
+    if args.mode == 'client':
+        config['workers'] = None
+    config['scenarios'] = sorted(results)
+
+    previous_path, previous = previous_result(config)
+    regressions = []
+    if previous:
+        regressions = compare(results, previous['results'], args.threshold)
+        print(f'\nCompared with {os.path.basename(previous_path)} ({previous["revision"]}):')
+        for line in regressions or ['no regressions']:
+            print(f'  {line}')
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        revision = git_revision()
+        path = os.path.join(RESULTS_DIR, f'{datetime.now():%Y%m%d-%H%M%S}-{revision}.json')
+        with open(path, 'w') as f:
+            json.dump({'revision': revision, 'created': datetime.now().isoformat(),
+                       'config': config, 'results': results}, f, indent=2)
+        print(f'Saved {os.path.relpath(path, ROOT)}')
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
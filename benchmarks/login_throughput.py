@@ -0,0 +1,93 @@
+# Benchmark: concurrent login throughput with hashing inline vs on the process pool
+#
+# Usage: python benchmarks/login_throughput.py [--duration 5] [--threads 16] [--users 200]
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Point the app at a scratch database before it is imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from werkzeug.security import generate_password_hash
+
+import app as quizmaster
+from models import db, User
+
+
+def seed(users):
+    with quizmaster.app.app_context():
+        db.create_all()
+        hashed = generate_password_hash('password', method=quizmaster.password_hasher.hash_method)
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'user{i}', 'password': hashed, 'full_name': f'User {i}'}
+            for i in range(users)
+        ])
+        db.session.commit()
+
+
+def run(workers, duration, threads, users):
+    app = quizmaster.app
+    app.config['PASSWORD_HASH_WORKERS'] = workers
+    quizmaster.password_hasher.shutdown()
+    quizmaster.password_hasher.init_app(app)
+    # Rate limiting is not what is being measured here
+    quizmaster.login_limiter.limit = float('inf')
+
+    completed = []
+    latencies = []
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def worker(offset):
+        client = app.test_client()
+        done = 0
+        times = []
+        i = offset
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            response = client.post('/login', data={'username': f'user{i % users}', 'password': 'password'})
+            times.append(time.perf_counter() - started)
+            if response.status_code == 302:
+                done += 1
+            i += threads
+        with lock:
+            completed.append(done)
+            latencies.extend(times)
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+    return sum(completed) / duration, p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login throughput, inline vs pooled password hashing')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--users', type=int, default=200)
+    args = parser.parse_args()
+
+    quizmaster.app.config['WTF_CSRF_ENABLED'] = False
+    seed(args.users)
+
+    print(f'{args.threads} concurrent clients, {args.duration}s per run, '
+          f'{quizmaster.password_hasher.hash_method}')
+    print(f'{"hashing":<22}{"logins/s":>10}{"p95 ms":>10}')
+    for label, workers in (('inline', 0), (f'pool ({os.cpu_count()} workers)', os.cpu_count())):
+        rate, p95 = run(workers, args.duration, args.threads, args.users)
+        print(f'{label:<22}{rate:>10.1f}{p95 * 1000:>10.1f}')
+    quizmaster.password_hasher.shutdown()
+
+
+if __name__ == '__main__':
+    main()
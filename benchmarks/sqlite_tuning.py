@@ -0,0 +1,106 @@
+# Benchmark: concurrent read/write throughput with default vs tuned SQLite settings
+#
+# Usage: python benchmarks/sqlite_tuning.py [--duration 5] [--readers 8] [--writers 4]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool, QueuePool
+
+from database import set_pragmas
+
+SCHEMA = (
+    'CREATE TABLE score (id INTEGER PRIMARY KEY, quiz_id INTEGER, user_id INTEGER, total_scored INTEGER)',
+    'CREATE INDEX ix_score_user ON score (user_id)'
+)
+USERS = 1000
+
+
+def make_engine(path, tuned):
+    url = f'sqlite:///{path}'
+    if tuned:
+        set_pragmas({})
+        return create_engine(url, poolclass=QueuePool, pool_size=16, max_overflow=16,
+                             connect_args={'check_same_thread': False, 'timeout': 5})
+    # Baseline: a fresh connection per use and SQLite's default settings
+    set_pragmas({}, defaults=False)
+    return create_engine(url, poolclass=NullPool)
+
+
+def run(tuned, duration, readers, writers):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = make_engine(path, tuned)
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text('INSERT INTO score (quiz_id, user_id, total_scored) VALUES (:q, :u, :s)'),
+                     [{'q': i % 50, 'u': i % USERS, 's': i % 10} for i in range(20000)])
+
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def reader():
+        done = errors = 0
+        while time.monotonic() < stop:
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text(
+                        'SELECT COUNT(*), AVG(total_scored), MAX(total_scored) FROM score WHERE user_id = :u'
+                    ), {'u': random.randrange(USERS)}).fetchone()
+                done += 1
+            except OperationalError:
+                errors += 1
+        with lock:
+            counts['reads'] += done
+            counts['errors'] += errors
+
+    def writer():
+        done = errors = 0
+        while time.monotonic() < stop:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text('INSERT INTO score (quiz_id, user_id, total_scored) VALUES (:q, :u, :s)'),
+                                 {'q': random.randrange(50), 'u': random.randrange(USERS), 's': random.randrange(10)})
+                done += 1
+            except OperationalError:
+                errors += 1
+        with lock:
+            counts['writes'] += done
+            counts['errors'] += errors
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite read/write throughput, default vs tuned settings')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f'{args.readers} readers, {args.writers} writers, {args.duration}s per run')
+    print(f'{"settings":<10}{"reads/s":>12}{"writes/s":>12}{"errors":>10}')
+    for label, tuned in (('default', False), ('tuned', True)):
+        counts = run(tuned, args.duration, args.readers, args.writers)
+        print(f'{label:<10}{counts["reads"] / args.duration:>12.0f}'
+              f'{counts["writes"] / args.duration:>12.0f}{counts["errors"]:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# SQLite engine configuration: per-connection pragmas and connection pooling
+import os
+import sqlite3
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool, QueuePool
+
+from models import db
+
+# Applied to every new SQLite connection; override with app.config['SQLITE_PRAGMAS']
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',          # Readers no longer block the writer
+    'busy_timeout': 5000,           # Milliseconds to wait for a lock before "database is locked"
+    'synchronous': 'NORMAL',        # Safe with WAL, avoids an fsync per commit
+    'mmap_size': 256 * 1024 * 1024,  # Bytes of the file memory-mapped for reads
+    'cache_size': -64 * 1024,       # Page cache per connection (negative = KiB)
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON'            # Enforce ON DELETE CASCADE between tables
+}
+
+_pragmas = dict(DEFAULT_PRAGMAS)
+
+
+@event.listens_for(Engine, 'connect')
+def _apply_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in _pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+@event.listens_for(Pool, 'checkin')
+def _reset_row_factory(dbapi_connection, connection_record):
+    # get_db_connection() hands out connections with sqlite3.Row rows
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.row_factory = None
+
+
+def set_pragmas(pragmas, defaults=True):
+    """Set the pragmas applied to SQLite connections opened from now on."""
+    _pragmas.clear()
+    if defaults:
+        _pragmas.update(DEFAULT_PRAGMAS)
+    _pragmas.update(pragmas)
+
+
+def init_database(app):
+    """Configure pooling and pragmas for the app's SQLite database, then bind db."""
+    set_pragmas(app.config.get('SQLITE_PRAGMAS', {}))
+
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
+    if uri.startswith('sqlite') and ':memory:' not in uri and uri.rstrip('/') != 'sqlite:':
+        options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        options.setdefault('poolclass', QueuePool)
+        options.setdefault('pool_size', app.config.get('SQLITE_POOL_SIZE', 10))
+        options.setdefault('max_overflow', app.config.get('SQLITE_POOL_OVERFLOW', 20))
+        options.setdefault('pool_timeout', 30)
+        connect_args = options.setdefault('connect_args', {})
+        # Pooled connections move between request threads
+        connect_args.setdefault('check_same_thread', False)
+        connect_args.setdefault('timeout', _pragmas.get('busy_timeout', 5000) / 1000)
+
+    db.init_app(app)
+
+
+class LocalConnections:
+    """Per-thread sqlite3 connections to a small local file (caches, sessions, jobs).
+
+    Calling the object returns this thread's connection, opening it on first
+    use and again in a forked worker process, since a connection must not be
+    shared across a fork. New connections use WAL with synchronous=NORMAL and
+    run the schema statements, which should be idempotent (IF NOT EXISTS).
+    """
+
+    def __init__(self, path, schema=(), isolation_level='', row_factory=None):
+        self.path = path
+        self.schema = list(schema)
+        self.isolation_level = isolation_level
+        self.row_factory = row_factory
+        self._local = threading.local()
+
+    def __call__(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=self.isolation_level)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.schema:
+                conn.execute(statement)
+            conn.commit()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+def get_db_connection():
+    """Borrow a raw sqlite3 connection from the engine's pool.
+
+    Rows come back as sqlite3.Row. Call close() to return the connection
+    to the pool. Must be called inside an application context.
+    """
+    conn = db.engine.raw_connection()
+    driver_connection = getattr(conn, 'driver_connection', None) or conn.connection
+    driver_connection.row_factory = sqlite3.Row
+    return conn
@@ -1,12 +1,34 @@
 from flask import Flask
+from sqlalchemy import inspect
 from models import db
+from database import init_database
+from search import ensure_search_index
+import migrations
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///quizmaster.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db.init_app(app)
+init_database(app)
 
 with app.app_context():
+    fresh = not inspect(db.engine).has_table('user')
     db.create_all()
+
+    conn = db.engine.raw_connection()
+    try:
+        if fresh:
+            # Tables were just created from the current models
+            migrations.stamp(conn, migrations.LATEST_VERSION)
+        else:
+            # Upgrade an existing database in place
+            for description in migrations.upgrade(conn):
+                print(f"Applied migration: {description}")
+    finally:
+        conn.close()
+
+    # Full-text search index for admin_search, kept in sync by triggers
+    for table in ensure_search_index(db.engine):
+        print(f"Built search index for {table}")
+
     print("Database Created Successfully!")
@@ -0,0 +1,90 @@
+# Streaming result exports (CSV and gzipped JSON Lines), run by the job queue
+import csv
+import gzip
+import json
+import os
+
+from database import get_db_connection
+
+FIELDS = ['score_id', 'user_id', 'username', 'full_name', 'subject', 'chapter',
+          'quiz_id', 'quiz_date', 'score', 'questions', 'attempted_at']
+
+# Format -> file extension of the artefact
+FORMATS = {'csv': 'csv', 'jsonl': 'jsonl.gz'}
+SCOPES = ('quiz', 'subject')
+
+# Scores read per query
+CHUNK_SIZE = 5000
+
+_SELECT = '''
+    SELECT score.id, user.id, user.username, user.full_name, subject.name, chapter.name,
+           quiz.id, quiz.date_of_quiz, score.total_scored,
+           MIN(quiz.question_count, COALESCE(quiz.sample_size, quiz.question_count)),
+           score.attempted_at
+    FROM score
+    JOIN user ON user.id = score.user_id
+    JOIN quiz ON quiz.id = score.quiz_id
+    JOIN chapter ON chapter.id = quiz.chapter_id
+    JOIN subject ON subject.id = chapter.subject_id
+'''
+_FILTERS = {'quiz': 'quiz.id = ?', 'subject': 'subject.id = ?'}
+
+
+def filename_for(scope, scope_id, fmt, job_id):
+    return f'{scope}_{scope_id}_results_{job_id}.{FORMATS[fmt]}'
+
+
+def export_results(path, scope, scope_id, fmt, progress=None, chunk_size=CHUNK_SIZE):
+    """Write every score in a quiz or subject to path; returns the rows written.
+
+    Scores are read in keyset-paged chunks over score.id with one joined
+    query each, so memory stays flat however large the cohort is.
+    progress(done, total) is called after each chunk. The file is written
+    under a temporary name, renamed when complete and removed on failure.
+    """
+    where = _FILTERS[scope]
+    conn = get_db_connection()
+    try:
+        total = conn.execute(
+            f'SELECT COUNT(*) FROM ({_SELECT} WHERE {where})', (scope_id,)
+        ).fetchone()[0]
+        if progress:
+            progress(0, total)
+
+        partial = path + '.part'
+        if fmt == 'csv':
+            output = open(partial, 'w', encoding='utf-8', newline='')
+            writer = csv.writer(output)
+            writer.writerow(FIELDS)
+            write = writer.writerows
+        else:
+            output = gzip.open(partial, 'wt', encoding='utf-8')
+            write = lambda rows: output.writelines(
+                json.dumps(dict(zip(FIELDS, row)), separators=(',', ':')) + '\n' for row in rows
+            )
+
+        done = 0
+        last_id = 0
+        try:
+            with output:
+                while True:
+                    rows = conn.execute(
+                        f'{_SELECT} WHERE {where} AND score.id > ? ORDER BY score.id LIMIT ?',
+                        (scope_id, last_id, chunk_size)
+                    ).fetchall()
+                    if not rows:
+                        break
+                    write([tuple(row) for row in rows])
+                    done += len(rows)
+                    last_id = rows[-1][0]
+                    if progress:
+                        progress(done, total)
+            os.replace(partial, path)
+        except BaseException:
+            # Do not leave a half-written file behind
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return done
+    finally:
+        conn.close()
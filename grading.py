@@ -0,0 +1,177 @@
+# Compiled answer keys and bulk grading
+from array import array
+
+from database import get_db_connection
+from models import Question
+
+# Option codes are stored one byte per question: 1-4 for an answer, 0 for none
+NO_ANSWER = 0
+VALID_OPTIONS = {'1': 1, '2': 2, '3': 3, '4': 4}
+
+# Key code for a question whose stored correct option is not 1-4; never matches
+UNGRADABLE = 255
+
+# Answer sheets read per query while regrading a quiz
+REGRADE_CHUNK_SIZE = 20000
+
+# Maps an XOR-ed byte to 1 if it was zero (answer matched the key), else 0
+_MATCH_TABLE = bytes([1] + [0] * 255)
+
+
+class AnswerKey:
+    """Question ids and correct option codes for one quiz, in question order."""
+
+    __slots__ = ('quiz_id', 'question_ids', 'correct')
+
+    def __init__(self, quiz_id, question_ids, correct):
+        self.quiz_id = quiz_id
+        self.question_ids = array('q', question_ids)
+        self.correct = bytes(correct)
+
+    @classmethod
+    def from_questions(cls, quiz_id, questions):
+        """Build a key from question dicts or Question rows."""
+        question_ids = []
+        correct = []
+        for question in questions:
+            if isinstance(question, dict):
+                question_id, option = question['id'], question['correct_option']
+            else:
+                question_id, option = question.id, question.correct_option
+            question_ids.append(question_id)
+            correct.append(VALID_OPTIONS.get(str(option), UNGRADABLE))
+        return cls(quiz_id, question_ids, correct)
+
+    def __len__(self):
+        return len(self.correct)
+
+    def pack(self, form):
+        """Pack submitted answers (form fields question_<id>) into option codes."""
+        return bytes(
+            VALID_OPTIONS.get(form.get(f'question_{question_id}'), NO_ANSWER)
+            for question_id in self.question_ids
+        )
+
+    def packed_ids(self):
+        """Question ids as bytes, stored with a packed submission."""
+        return self.question_ids.tobytes()
+
+    def unpack(self, packed):
+        """Return {question_id: option string} for the answered questions."""
+        return {
+            question_id: str(code)
+            for question_id, code in zip(self.question_ids, packed)
+            if code != NO_ANSWER
+        }
+
+    def grade(self, packed):
+        """Grade one packed submission.
+
+        Returns (score, correctness) where correctness holds one byte per
+        question, 1 if it was answered correctly and 0 otherwise.
+        """
+        return grade_batch(self, [packed])[0]
+
+
+def unpack_answers(question_ids, answers):
+    """Return {question_id: option string} from stored packed ids and answers."""
+    ids = array('q')
+    ids.frombytes(question_ids)
+    return {
+        question_id: str(code)
+        for question_id, code in zip(ids, answers)
+        if code != NO_ANSWER
+    }
+
+
+def _xor(left, right):
+    size = len(left)
+    value = int.from_bytes(left, 'big') ^ int.from_bytes(right, 'big')
+    return value.to_bytes(size, 'big')
+
+
+def grade_batch(key, submissions):
+    """Grade many packed submissions against one key in a single pass.
+
+    All submissions are concatenated and compared against the key repeated
+    once per submission, so the comparison runs over one byte string rather
+    than a Python loop per question. Unanswered questions never match since
+    the key never holds NO_ANSWER.
+    """
+    size = len(key)
+    if not submissions:
+        return []
+    if size == 0:
+        return [(0, b'') for _ in submissions]
+
+    joined = b''.join(packed.ljust(size, b'\0')[:size] for packed in submissions)
+    matches = _xor(joined, key.correct * len(submissions)).translate(_MATCH_TABLE)
+
+    results = []
+    for start in range(0, len(matches), size):
+        correctness = matches[start:start + size]
+        results.append((correctness.count(1), correctness))
+    return results
+
+
+def regrade_quiz(quiz_id, chunk_size=REGRADE_CHUNK_SIZE):
+    """Regrade a quiz's stored answer sheets against its current answer key.
+
+    Run after correcting a question's correct option. Sheets are read in
+    keyset-paged chunks and graded with grade_batch() per question layout
+    (sheets from before questions were added or removed, or drawn from a
+    bank, list different questions); only scores that change are updated.
+    Questions since deleted earn no marks. Scores without an answer sheet
+    are left alone. Returns (sheets regraded, scores changed); callers must
+    invalidate the rollups when any changed.
+    """
+    correct_codes = {
+        question_id: VALID_OPTIONS.get(str(option), UNGRADABLE)
+        for question_id, option in Question.query.with_entities(
+            Question.id, Question.correct_option
+        ).filter_by(quiz_id=quiz_id)
+    }
+    keys = {}  # question_ids blob -> AnswerKey for that layout
+
+    sheets = 0
+    changed = 0
+    last_id = 0
+    conn = get_db_connection()
+    try:
+        while True:
+            rows = conn.execute(
+                'SELECT score.id, score.total_scored, answer_sheet.question_ids, answer_sheet.answers '
+                'FROM score JOIN answer_sheet ON answer_sheet.score_id = score.id '
+                'WHERE score.quiz_id = ? AND score.id > ? ORDER BY score.id LIMIT ?',
+                (quiz_id, last_id, chunk_size)
+            ).fetchall()
+            if not rows:
+                break
+            # question_ids blob -> [(score id, stored total, answers), ...]
+            layouts = {}
+            for score_id, total_scored, question_ids, answers in rows:
+                layouts.setdefault(question_ids, []).append((score_id, total_scored, answers))
+
+            updates = []
+            for question_ids, group in layouts.items():
+                key = keys.get(question_ids)
+                if key is None:
+                    ids = array('q')
+                    ids.frombytes(question_ids)
+                    key = keys[question_ids] = AnswerKey(
+                        quiz_id, ids, [correct_codes.get(question_id, UNGRADABLE) for question_id in ids]
+                    )
+                results = grade_batch(key, [answers for _, _, answers in group])
+                for (score_id, total_scored, _), (score, _) in zip(group, results):
+                    if score != total_scored:
+                        updates.append((score, score_id))
+
+            if updates:
+                conn.executemany('UPDATE score SET total_scored = ? WHERE id = ?', updates)
+                conn.commit()
+            sheets += len(rows)
+            changed += len(updates)
+            last_id = rows[-1][0]
+    finally:
+        conn.close()
+    return sheets, changed
@@ -0,0 +1,192 @@
+# Per-request query counting and timing, exposed in Prometheus text format
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import request, request_started, request_finished, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds of the histogram buckets
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Statements kept per request for the slow-request log
+MAX_LOGGED_STATEMENTS = 50
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a request or block issues more queries than allowed."""
+
+
+class RequestStats:
+    """Counters for the request (or query_budget block) currently running.
+
+    Stats nest: when a request runs inside a query_budget block (as with the
+    test client) its counts are added to the enclosing block when it ends.
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_started = None
+        self.statements = []
+
+    def close(self):
+        """Make the enclosing stats current again and fold these counts into them."""
+        _current.set(self.parent)
+        if self.parent is not None:
+            self.parent.queries += self.queries
+            self.parent.db_time += self.db_time
+            room = MAX_LOGGED_STATEMENTS - len(self.parent.statements)
+            self.parent.statements.extend(self.statements[:max(room, 0)])
+
+
+_current = ContextVar('request_stats', default=None)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started
+        if len(stats.statements) < MAX_LOGGED_STATEMENTS:
+            stats.statements.append(statement)
+
+
+class Histogram:
+    """Prometheus-style histogram with one series per endpoint."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, endpoint, value):
+        counts, total, count = self.series.get(endpoint) or ([0] * len(self.buckets), 0.0, 0)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self.series[endpoint] = (counts, total + value, count + 1)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for endpoint, (counts, total, count) in sorted(self.series.items()):
+            label = f'endpoint="{endpoint}"'
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {count}')
+        return lines
+
+
+class RequestMetrics:
+    """Records query count, DB time, render time and wall time per endpoint.
+
+    Requests slower than SLOW_REQUEST_SECONDS are logged with their SQL.
+    QUERY_BUDGETS maps endpoint names to a maximum query count; with
+    ENFORCE_QUERY_BUDGETS set (e.g. in tests) a request over budget raises
+    QueryBudgetExceeded, otherwise it is logged.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.duration = Histogram('quizmaster_request_duration_seconds',
+                                  'Wall time per request', TIME_BUCKETS)
+        self.db_time = Histogram('quizmaster_request_db_seconds',
+                                 'Time spent in SQL per request', TIME_BUCKETS)
+        self.render_time = Histogram('quizmaster_request_render_seconds',
+                                     'Template render time per request', TIME_BUCKETS)
+        self.queries = Histogram('quizmaster_request_queries',
+                                 'SQL statements per request', QUERY_BUCKETS)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        request_started.connect(self._request_started, app)
+        request_finished.connect(self._request_finished, app)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._rendered, app)
+
+    def _request_started(self, sender, **extra):
+        _current.set(RequestStats(parent=_current.get()))
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+
+    def _rendered(self, sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None and stats.render_started is not None:
+            stats.render_time += time.perf_counter() - stats.render_started
+            stats.render_started = None
+
+    def _request_finished(self, sender, response, **extra):
+        stats = _current.get()
+        if stats is None:
+            return
+        stats.close()
+        endpoint = request.endpoint or 'unmatched'
+        wall_time = time.perf_counter() - stats.started
+
+        with self._lock:
+            self.duration.observe(endpoint, wall_time)
+            self.db_time.observe(endpoint, stats.db_time)
+            self.render_time.observe(endpoint, stats.render_time)
+            self.queries.observe(endpoint, stats.queries)
+
+        config = self.app.config
+        if wall_time >= config.get('SLOW_REQUEST_SECONDS', 0.5):
+            self.app.logger.warning(
+                'Slow request %s %s: %.3fs total, %d queries in %.3fs, render %.3fs\n%s',
+                request.method, request.path, wall_time, stats.queries, stats.db_time,
+                stats.render_time, '\n'.join(stats.statements)
+            )
+
+        budget = config.get('QUERY_BUDGETS', {}).get(endpoint)
+        if budget is not None and stats.queries > budget:
+            message = f'{endpoint} issued {stats.queries} queries (budget {budget})'
+            if config.get('ENFORCE_QUERY_BUDGETS'):
+                raise QueryBudgetExceeded(message + ':\n' + '\n'.join(stats.statements))
+            self.app.logger.warning(message)
+
+    def render(self):
+        """All histograms in Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+            for histogram in (self.duration, self.db_time, self.render_time, self.queries):
+                lines.extend(histogram.render())
+        return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def query_budget(max_queries):
+    """Fail with QueryBudgetExceeded if the block issues more than max_queries.
+
+    For use in tests, e.g. around a test client request.
+    """
+    stats = RequestStats(parent=_current.get())
+    _current.set(stats)
+    try:
+        yield stats
+    finally:
+        stats.close()
+    if stats.queries > max_queries:
+        raise QueryBudgetExceeded(
+            f'{stats.queries} queries issued (budget {max_queries}):\n' + '\n'.join(stats.statements)
+        )
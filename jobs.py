@@ -0,0 +1,174 @@
+# Background jobs: a queue in a local SQLite file, run by worker threads in each process
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from database import LocalConnections
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS job ('
+    'id INTEGER PRIMARY KEY, kind TEXT NOT NULL, params TEXT NOT NULL, '
+    "status TEXT NOT NULL DEFAULT 'queued', progress INTEGER NOT NULL DEFAULT 0, total INTEGER, "
+    'artefact TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL, '
+    'heartbeat REAL, pid INTEGER)',
+    'CREATE INDEX IF NOT EXISTS ix_job_status ON job (status, id)',
+]
+
+class Job:
+    """A claimed job as seen by its handler."""
+
+    def __init__(self, queue, id, kind, params):
+        self.queue = queue
+        self.id = id
+        self.kind = kind
+        self.params = params
+        self._reported = 0.0
+
+    def progress(self, done, total=None):
+        """Record how far the job has got; writes at most once a second."""
+        now = time.time()
+        if now - self._reported < 1 and done != total:
+            return
+        self._reported = now
+        self.queue._update(self.id, progress=done, total=total, heartbeat=now)
+
+
+class JobQueue:
+    """Runs slow admin tasks (exports, reports) outside the request.
+
+    submit() stores a job row in JOB_DB_PATH and returns its id at once.
+    Each process starts JOB_WORKERS threads the first time the queue is
+    used; they claim queued jobs one at a time with an immediate
+    transaction, so every worker process can share the same file without a
+    job running twice. Handlers report progress through the Job they
+    receive, which also serves as a heartbeat: a running job whose worker
+    has not reported for JOB_STALE_SECONDS (say, the process was killed)
+    is queued again.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.path = None
+        self.handlers = {}
+        self._connect = None
+        self._workers_pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.path = app.config.get('JOB_DB_PATH') or os.path.join(app.instance_path, 'jobs.db')
+        self._connect = LocalConnections(self.path, SCHEMA, isolation_level=None, row_factory=sqlite3.Row)
+        self.workers = app.config.get('JOB_WORKERS', 2)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', 1)
+        self.stale_seconds = app.config.get('JOB_STALE_SECONDS', 300)
+
+    def task(self, kind):
+        """Register handler(job) for a kind of job; its return value is stored as the artefact."""
+        def decorator(handler):
+            self.handlers[kind] = handler
+            return handler
+        return decorator
+
+    def submit(self, kind, params):
+        """Queue a job and return its id."""
+        if kind not in self.handlers:
+            raise ValueError(f'Unknown job kind: {kind}')
+        job_id = self._connect().execute(
+            'INSERT INTO job (kind, params, created_at) VALUES (?, ?, ?)',
+            (kind, json.dumps(params), time.time())
+        ).lastrowid
+        self._start_workers()
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id):
+        """The job as a dict, or None."""
+        self._start_workers()
+        row = self._connect().execute('SELECT * FROM job WHERE id = ?', (job_id,)).fetchone()
+        return _as_dict(row) if row is not None else None
+
+    def recent(self, limit=10):
+        """The newest jobs first, as dicts."""
+        self._start_workers()
+        rows = self._connect().execute('SELECT * FROM job ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        return [_as_dict(row) for row in rows]
+
+    def _update(self, job_id, **fields):
+        assignments = ', '.join(f'{name} = COALESCE(?, {name})' for name in fields)
+        self._connect().execute(f'UPDATE job SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+    def _claim(self):
+        # Requeue jobs whose worker went quiet, then take the oldest queued one
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                "UPDATE job SET status = 'queued', pid = NULL WHERE status = 'running' AND heartbeat < ?",
+                (now - self.stale_seconds,)
+            )
+            row = conn.execute(
+                "SELECT id, kind, params FROM job WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE job SET status = 'running', started_at = ?, heartbeat = ?, pid = ? WHERE id = ?",
+                    (now, now, os.getpid(), row['id'])
+                )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        return Job(self, row['id'], row['kind'], json.loads(row['params']))
+
+    def _start_workers(self):
+        # Worker threads per process, started on first use (and again after a fork)
+        if self._workers_pid == os.getpid() or not self.workers:
+            return
+        with self._lock:
+            if self._workers_pid == os.getpid():
+                return
+            self._workers_pid = os.getpid()
+            for number in range(self.workers):
+                threading.Thread(target=self._work_forever, name=f'job-worker-{number}', daemon=True).start()
+
+    def _work_forever(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error:
+                job = None  # Busy database; try again after the poll interval
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        try:
+            with self.app.app_context():
+                artefact = self.handlers[job.kind](job)
+        except Exception as e:
+            print(f"Error: {str(e)}")  # For debugging
+            self._finish(job.id, 'failed', error=str(e) or e.__class__.__name__)
+        else:
+            self._finish(job.id, 'done', artefact=artefact)
+
+    def _finish(self, job_id, status, artefact=None, error=None):
+        self._connect().execute(
+            'UPDATE job SET status = ?, artefact = ?, error = ?, finished_at = ?, pid = NULL WHERE id = ?',
+            (status, artefact, error, time.time(), job_id)
+        )
+
+
+def _as_dict(row):
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    return job
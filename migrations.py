@@ -0,0 +1,264 @@
+# Versioned schema migrations, tracked with SQLite's PRAGMA user_version
+#
+# Each migration takes a raw sqlite3 connection and brings a database from the
+# previous version to its own. Migrations are snapshots of the schema at the
+# time they were written, so they use plain SQL rather than the current models.
+# A database created from scratch by db.create_all() is stamped with the latest
+# version and skips them.
+from search import INDEXED
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+
+def _add_score_attempted_at(conn):
+    if 'attempted_at' not in _columns(conn, 'score'):
+        conn.execute('ALTER TABLE score ADD COLUMN attempted_at DATETIME')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_score_user_attempted ON score (user_id, attempted_at)')
+
+
+def _add_quiz_question_count(conn):
+    if 'question_count' not in _columns(conn, 'quiz'):
+        conn.execute('ALTER TABLE quiz ADD COLUMN question_count INTEGER NOT NULL DEFAULT 0')
+        conn.execute(
+            'UPDATE quiz SET question_count = '
+            '(SELECT COUNT(*) FROM question WHERE question.quiz_id = quiz.id)'
+        )
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_quiz_date_of_quiz ON quiz (date_of_quiz)')
+
+
+def _add_constraints(conn):
+    # SQLite cannot add foreign key actions or table constraints in place, so
+    # each child table is rebuilt (create new, copy, drop old, rename) with
+    # foreign key enforcement off. Rows whose parent is already gone are
+    # dropped, and only the first score per (quiz, user) is kept.
+    conn.executescript('''
+        PRAGMA foreign_keys=OFF;
+        BEGIN;
+
+        CREATE TABLE new_chapter (
+            id INTEGER NOT NULL,
+            subject_id INTEGER,
+            name VARCHAR(200) NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(subject_id) REFERENCES subject (id) ON DELETE CASCADE
+        );
+        INSERT INTO new_chapter (id, subject_id, name)
+            SELECT id, subject_id, name FROM chapter
+            WHERE subject_id IN (SELECT id FROM subject);
+        DROP TABLE chapter;
+        ALTER TABLE new_chapter RENAME TO chapter;
+        CREATE INDEX ix_chapter_subject_name ON chapter (subject_id, name);
+
+        CREATE TABLE new_quiz (
+            id INTEGER NOT NULL,
+            chapter_id INTEGER,
+            date_of_quiz DATE,
+            time_duration VARCHAR(10),
+            question_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (id),
+            FOREIGN KEY(chapter_id) REFERENCES chapter (id) ON DELETE CASCADE
+        );
+        INSERT INTO new_quiz (id, chapter_id, date_of_quiz, time_duration, question_count)
+            SELECT id, chapter_id, date_of_quiz, time_duration, question_count FROM quiz
+            WHERE chapter_id IN (SELECT id FROM chapter);
+        DROP TABLE quiz;
+        ALTER TABLE new_quiz RENAME TO quiz;
+        CREATE INDEX ix_quiz_chapter_id ON quiz (chapter_id);
+        CREATE INDEX ix_quiz_date_of_quiz ON quiz (date_of_quiz);
+
+        CREATE TABLE new_question (
+            id INTEGER NOT NULL,
+            quiz_id INTEGER,
+            question_statement TEXT NOT NULL,
+            option1 VARCHAR(200) NOT NULL,
+            option2 VARCHAR(200) NOT NULL,
+            option3 VARCHAR(200) NOT NULL,
+            option4 VARCHAR(200) NOT NULL,
+            correct_option VARCHAR(200) NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(quiz_id) REFERENCES quiz (id) ON DELETE CASCADE
+        );
+        INSERT INTO new_question (id, quiz_id, question_statement, option1, option2, option3, option4, correct_option)
+            SELECT id, quiz_id, question_statement, option1, option2, option3, option4, correct_option FROM question
+            WHERE quiz_id IN (SELECT id FROM quiz);
+        DROP TABLE question;
+        ALTER TABLE new_question RENAME TO question;
+        CREATE INDEX ix_question_quiz_id ON question (quiz_id);
+
+        CREATE TABLE new_score (
+            id INTEGER NOT NULL,
+            quiz_id INTEGER,
+            user_id INTEGER,
+            total_scored INTEGER,
+            attempted_at DATETIME,
+            PRIMARY KEY (id),
+            CONSTRAINT uq_score_quiz_user UNIQUE (quiz_id, user_id),
+            FOREIGN KEY(quiz_id) REFERENCES quiz (id) ON DELETE CASCADE,
+            FOREIGN KEY(user_id) REFERENCES user (id) ON DELETE CASCADE
+        );
+        INSERT INTO new_score (id, quiz_id, user_id, total_scored, attempted_at)
+            SELECT id, quiz_id, user_id, total_scored, attempted_at FROM score
+            WHERE quiz_id IN (SELECT id FROM quiz)
+              AND user_id IN (SELECT id FROM user)
+              AND id IN (SELECT MIN(id) FROM score GROUP BY quiz_id, user_id);
+        DROP TABLE score;
+        ALTER TABLE new_score RENAME TO score;
+        CREATE INDEX ix_score_user_attempted ON score (user_id, attempted_at);
+
+        CREATE TABLE new_answer_sheet (
+            id INTEGER NOT NULL,
+            score_id INTEGER NOT NULL,
+            question_ids BLOB NOT NULL,
+            answers BLOB NOT NULL,
+            PRIMARY KEY (id),
+            UNIQUE (score_id),
+            FOREIGN KEY(score_id) REFERENCES score (id) ON DELETE CASCADE
+        );
+        INSERT INTO new_answer_sheet (id, score_id, question_ids, answers)
+            SELECT id, score_id, question_ids, answers FROM answer_sheet
+            WHERE score_id IN (SELECT id FROM score);
+        DROP TABLE answer_sheet;
+        ALTER TABLE new_answer_sheet RENAME TO answer_sheet;
+
+        UPDATE quiz SET question_count =
+            (SELECT COUNT(*) FROM question WHERE question.quiz_id = quiz.id);
+
+        COMMIT;
+        PRAGMA foreign_keys=ON;
+    ''')
+
+    # Dropping the old tables dropped their search triggers and may have removed
+    # indexed rows; rebuild any existing search index (ensure_search_index
+    # recreates the triggers afterwards)
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for table in INDEXED:
+        if f'{table}_fts' in existing:
+            conn.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+    conn.commit()
+
+
+def _add_attempt(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS attempt (
+            id INTEGER NOT NULL,
+            quiz_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            started_at DATETIME NOT NULL,
+            expires_at DATETIME NOT NULL,
+            PRIMARY KEY (id),
+            CONSTRAINT uq_attempt_quiz_user UNIQUE (quiz_id, user_id),
+            FOREIGN KEY(quiz_id) REFERENCES quiz (id) ON DELETE CASCADE,
+            FOREIGN KEY(user_id) REFERENCES user (id) ON DELETE CASCADE
+        )
+    ''')
+    conn.commit()
+
+
+def _add_item_stat(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS item_stat (
+            id INTEGER NOT NULL,
+            quiz_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            responses INTEGER NOT NULL,
+            p_value FLOAT,
+            discrimination FLOAT,
+            unanswered INTEGER NOT NULL,
+            chose_option1 INTEGER NOT NULL,
+            chose_option2 INTEGER NOT NULL,
+            chose_option3 INTEGER NOT NULL,
+            chose_option4 INTEGER NOT NULL,
+            computed_at DATETIME NOT NULL,
+            PRIMARY KEY (id),
+            UNIQUE (question_id),
+            FOREIGN KEY(quiz_id) REFERENCES quiz (id) ON DELETE CASCADE,
+            FOREIGN KEY(question_id) REFERENCES question (id) ON DELETE CASCADE
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_item_stat_quiz_id ON item_stat (quiz_id)')
+    conn.commit()
+
+
+def _add_quiz_sample_size(conn):
+    if 'sample_size' not in _columns(conn, 'quiz'):
+        conn.execute('ALTER TABLE quiz ADD COLUMN sample_size INTEGER')
+    conn.commit()
+
+
+def _add_attempt_expired_at(conn):
+    if 'expired_at' not in _columns(conn, 'attempt'):
+        conn.execute('ALTER TABLE attempt ADD COLUMN expired_at DATETIME')
+    conn.commit()
+
+
+def _add_attempt_draw(conn):
+    # expires_at becomes nullable (attempts at untimed sampled quizzes store
+    # only their draw), which SQLite can only do by rebuilding the table
+    if 'question_ids' in _columns(conn, 'attempt'):
+        return
+    conn.executescript('''
+        PRAGMA foreign_keys=OFF;
+        BEGIN;
+
+        CREATE TABLE new_attempt (
+            id INTEGER NOT NULL,
+            quiz_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            started_at DATETIME NOT NULL,
+            expires_at DATETIME,
+            expired_at DATETIME,
+            question_ids BLOB,
+            option_orders BLOB,
+            PRIMARY KEY (id),
+            CONSTRAINT uq_attempt_quiz_user UNIQUE (quiz_id, user_id),
+            FOREIGN KEY(quiz_id) REFERENCES quiz (id) ON DELETE CASCADE,
+            FOREIGN KEY(user_id) REFERENCES user (id) ON DELETE CASCADE
+        );
+        INSERT INTO new_attempt (id, quiz_id, user_id, started_at, expires_at, expired_at)
+            SELECT id, quiz_id, user_id, started_at, expires_at, expired_at FROM attempt;
+        DROP TABLE attempt;
+        ALTER TABLE new_attempt RENAME TO attempt;
+
+        COMMIT;
+        PRAGMA foreign_keys=ON;
+    ''')
+
+
+# (version, description, function), in order
+MIGRATIONS = [
+    (1, 'Add score.attempted_at', _add_score_attempted_at),
+    (2, 'Add quiz.question_count', _add_quiz_question_count),
+    (3, 'Add foreign key indexes, cascading deletes and unique scores', _add_constraints),
+    (4, 'Add attempt table for server-side quiz timers', _add_attempt),
+    (5, 'Add item_stat table for question analytics', _add_item_stat),
+    (6, 'Add quiz.sample_size for randomised quizzes', _add_quiz_sample_size),
+    (7, 'Add attempt.expired_at so one process submits each expired attempt', _add_attempt_expired_at),
+    (8, "Store each attempt's drawn questions so bank edits do not change it", _add_attempt_draw),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def stamp(conn, version):
+    conn.execute(f'PRAGMA user_version = {int(version)}')
+    conn.commit()
+
+
+def upgrade(conn):
+    """Apply pending migrations in order; returns the descriptions applied."""
+    applied = []
+    version = current_version(conn)
+    for target, description, migrate in MIGRATIONS:
+        if target <= version:
+            continue
+        migrate(conn)
+        conn.commit()
+        stamp(conn, target)
+        applied.append(description)
+    return applied
@@ -1,5 +1,6 @@
 # Import SQLAlchemy for database operations
 from flask_sqlalchemy import SQLAlchemy
+from datetime import datetime
 
 # Initialize SQLAlchemy instance
 db = SQLAlchemy()
@@ -22,23 +23,29 @@ class Subject(db.Model):
 class Chapter(db.Model):
     """Chapter model for organizing subjects into chapters"""
     id = db.Column(db.Integer, primary_key=True)
-    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'))
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id', ondelete='CASCADE'))
     name = db.Column(db.String(200), nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_chapter_subject_name', 'subject_id', 'name'),
+    )
+
 class Quiz(db.Model):
     """Quiz model for storing quiz information"""
     id = db.Column(db.Integer, primary_key=True)
-    chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id'))
-    date_of_quiz = db.Column(db.String(20))
+    chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id', ondelete='CASCADE'), index=True)
+    date_of_quiz = db.Column(db.Date, index=True)
     time_duration = db.Column(db.String(10))
+    question_count = db.Column(db.Integer, nullable=False, default=0)
+    sample_size = db.Column(db.Integer)  # Questions drawn per attempt; None = all, in order
     
-    # Add relationship
-    chapter = db.relationship('Chapter', backref='quizzes')
+    # Add relationship (child rows are removed by ON DELETE CASCADE in the database)
+    chapter = db.relationship('Chapter', backref=db.backref('quizzes', passive_deletes=True))
 
 class Question(db.Model):
     """Question model for storing quiz questions"""
     id = db.Column(db.Integer, primary_key=True)
-    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'))
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'), index=True)
     question_statement = db.Column(db.Text, nullable=False)
     option1 = db.Column(db.String(200), nullable=False)
     option2 = db.Column(db.String(200), nullable=False)
@@ -49,6 +56,57 @@ class Question(db.Model):
 class Score(db.Model):
     """Score model for storing user quiz scores"""
     id = db.Column(db.Integer, primary_key=True)
-    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'))
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'))
     total_scored = db.Column(db.Integer)
+    attempted_at = db.Column(db.DateTime, default=datetime.now)
+
+    # Add relationships
+    quiz = db.relationship('Quiz', backref=db.backref('scores', passive_deletes=True))
+    user = db.relationship('User', backref=db.backref('scores', passive_deletes=True))
+    answer_sheet = db.relationship('AnswerSheet', backref='score', uselist=False,
+                                   cascade='all, delete-orphan', passive_deletes=True)
+
+    # The unique constraint also serves lookups by quiz_id
+    __table_args__ = (
+        db.UniqueConstraint('quiz_id', 'user_id', name='uq_score_quiz_user'),
+        db.Index('ix_score_user_attempted', 'user_id', 'attempted_at'),
+    )
+
+class Attempt(db.Model):
+    """When a user started a quiz, when their time runs out and what they were given"""
+    id = db.Column(db.Integer, primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    expires_at = db.Column(db.DateTime)  # None for quizzes without a time limit
+    expired_at = db.Column(db.DateTime)  # Claimed by the process submitting it on expiry
+    # A sampled quiz's draw: array('q') of question ids and four option codes per question
+    question_ids = db.Column(db.LargeBinary)
+    option_orders = db.Column(db.LargeBinary)
+
+    __table_args__ = (
+        db.UniqueConstraint('quiz_id', 'user_id', name='uq_attempt_quiz_user'),
+    )
+
+class ItemStat(db.Model):
+    """Item analysis for one question, precomputed by analytics.analyse_quiz"""
+    id = db.Column(db.Integer, primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'), nullable=False, index=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id', ondelete='CASCADE'), nullable=False, unique=True)
+    responses = db.Column(db.Integer, nullable=False)
+    p_value = db.Column(db.Float)  # Share answering correctly
+    discrimination = db.Column(db.Float)  # Point-biserial correlation with total score
+    unanswered = db.Column(db.Integer, nullable=False)
+    chose_option1 = db.Column(db.Integer, nullable=False)
+    chose_option2 = db.Column(db.Integer, nullable=False)
+    chose_option3 = db.Column(db.Integer, nullable=False)
+    chose_option4 = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+class AnswerSheet(db.Model):
+    """Answers chosen in one attempt, packed one byte per question"""
+    id = db.Column(db.Integer, primary_key=True)
+    score_id = db.Column(db.Integer, db.ForeignKey('score.id', ondelete='CASCADE'), unique=True, nullable=False)
+    question_ids = db.Column(db.LargeBinary, nullable=False)  # array('q') of question ids
+    answers = db.Column(db.LargeBinary, nullable=False)  # option code per question, 0 = unanswered
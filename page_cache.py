@@ -0,0 +1,110 @@
+# Rendered-page cache for catalogue pages, with generation-based invalidation and ETags
+import hashlib
+import os
+import uuid
+from datetime import date
+from functools import wraps
+
+from flask import request, session, make_response, Response
+
+from quiz_cache import MemoryBackend, SQLiteBackend
+
+
+class PageCache:
+    """Caches whole GET responses keyed by path, query string and role.
+
+    Each cached view names the generations its content depends on, e.g.
+    'subject:{subject_id}' (formatted with the view's arguments). Admin
+    routes that change that data call bump(), which gives the generation a
+    new token so every page built from it misses from then on. Responses
+    carry an ETag, and a matching If-None-Match gets an empty 304.
+
+    Pages are never served from or stored to the cache while flash messages
+    are pending, since base.html renders them into the page.
+    """
+
+    def __init__(self, app=None):
+        self.pages = None
+        self.generations = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PAGE_CACHE_ENABLED', True)
+        size = app.config.get('PAGE_CACHE_SIZE', 1024)
+        ttl = app.config.get('PAGE_CACHE_TTL', 300)
+        if app.config.get('PAGE_CACHE_BACKEND', 'memory') == 'sqlite':
+            path = app.config.get('PAGE_CACHE_PATH') or os.path.join(app.instance_path, 'page_cache.db')
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.pages = SQLiteBackend(path, max_entries=size, ttl=ttl, table='pages')
+            self.generations = SQLiteBackend(path, max_entries=size * 4, ttl=86400, table='generations')
+        else:
+            self.pages = MemoryBackend(max_entries=size, ttl=ttl)
+            self.generations = MemoryBackend(max_entries=size * 4, ttl=86400)
+
+    def generation(self, name):
+        """Current token for a generation, creating one if it has none yet."""
+        key = f'gen:{name}'
+        token = self.generations.get(key)
+        if token is None:
+            token = uuid.uuid4().hex
+            self.generations.set(key, token)
+        return token
+
+    def bump(self, *names):
+        """Invalidate every page depending on any of the named generations."""
+        for name in names:
+            self.generations.set(f'gen:{name}', uuid.uuid4().hex)
+
+    def _key(self, depends_on, view_args, per_session):
+        if session.get('admin'):
+            role = 'admin'
+        elif 'user_id' in session:
+            role = 'user'
+        else:
+            role = 'anonymous'
+        tokens = [self.generation(name.format(**view_args)) for name in depends_on]
+        parts = [request.endpoint, role, request.full_path, date.today().isoformat()] + tokens
+        if per_session:
+            parts.append(session.sid)
+        return 'page:' + hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+    def cached(self, *depends_on, per_session=False):
+        """Decorator caching a view's 200 responses.
+
+        Set per_session for pages embedding per-session values such as CSRF
+        tokens; those are cached separately for each session.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                if (not self.enabled or request.method != 'GET' or '_flashes' in session
+                        or (per_session and getattr(session, 'sid', None) is None)):
+                    return view(*args, **kwargs)
+
+                key = self._key(depends_on, kwargs, per_session)
+                entry = self.pages.get(key)
+                if entry is not None:
+                    response = Response(entry['body'], mimetype=entry['mimetype'])
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or '_flashes' in session:
+                        return response
+                    body = response.get_data(as_text=True)
+                    entry = {
+                        'body': body,
+                        'mimetype': response.mimetype,
+                        'etag': hashlib.sha1(body.encode()).hexdigest(),
+                    }
+                    self.pages.set(key, entry)
+
+                response.set_etag(entry['etag'])
+                # Browsers may keep the page but must revalidate it each time
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response.make_conditional(request)
+            return wrapped
+        return decorator
+
+    def clear(self):
+        self.pages.clear()
+        self.generations.clear()
@@ -0,0 +1,155 @@
+# Password hashing on a bounded process pool, with per-username login rate limiting
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from database import LocalConnections
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when too many hashing jobs are already waiting."""
+
+
+class PasswordHasher:
+    """Runs PBKDF2 hashing and checks on worker processes.
+
+    Hashing is CPU-bound, so it is moved off the request threads onto a
+    process pool that can use every core. At most max_pending jobs may be
+    queued; beyond that callers wait up to queue_timeout seconds and then
+    get PasswordServiceBusy. With workers = 0 hashing runs inline.
+    """
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+        self.iterations = app.config.get('PASSWORD_HASH_ITERATIONS', 260000)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', 64)
+        self.queue_timeout = app.config.get('PASSWORD_HASH_QUEUE_TIMEOUT', 10)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    @property
+    def hash_method(self):
+        return f'{self.method}:{self.iterations}'
+
+    def _get_executor(self):
+        # Created on first use, and again in a forked worker process
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _run(self, func, *args, **kwargs):
+        if not self.workers:
+            return func(*args, **kwargs)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise PasswordServiceBusy()
+        try:
+            return self._get_executor().submit(func, *args, **kwargs).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, method=self.hash_method)
+
+    def verify(self, hashed, password):
+        return self._run(check_password_hash, hashed, password)
+
+    def needs_rehash(self, hashed):
+        """True if hashed was made with a different method or cost than configured."""
+        method = hashed.split('$', 1)[0]
+        return method != self.hash_method
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            if self._executor is not None and self._executor_pid == os.getpid():
+                self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+class LoginRateLimiter:
+    """Allows at most `limit` login attempts per username in a sliding window."""
+
+    def __init__(self, limit=5, window=60):
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._attempts = defaultdict(deque)
+
+    def allow(self, username):
+        """Record an attempt; False if the username is over its limit."""
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts[username]
+            while attempts and attempts[0] <= now - self.window:
+                attempts.popleft()
+            if len(attempts) >= self.limit:
+                return False
+            attempts.append(now)
+            # Keep the table from growing with one-off usernames
+            if len(self._attempts) > 10000:
+                for name in [name for name, times in self._attempts.items()
+                             if not times or times[-1] <= now - self.window]:
+                    del self._attempts[name]
+            return True
+
+    def reset(self, username):
+        with self._lock:
+            self._attempts.pop(username, None)
+
+
+class SQLiteRateLimiter:
+    """LoginRateLimiter with its attempts in a local SQLite file.
+
+    Every worker process counts against the same table, so the limit holds
+    for the whole server rather than per process. Each check is one
+    immediate transaction; expired attempts of other usernames are deleted
+    every thousand checks.
+    """
+
+    def __init__(self, path, limit=5, window=60):
+        self.path = path
+        self.limit = limit
+        self.window = window
+        self._checks = 0
+        self._connect = LocalConnections(path, [
+            'CREATE TABLE IF NOT EXISTS login_attempt (username TEXT NOT NULL, at REAL NOT NULL)',
+            'CREATE INDEX IF NOT EXISTS ix_login_attempt_username ON login_attempt (username, at)',
+        ], isolation_level=None)
+
+    def allow(self, username):
+        """Record an attempt; False if the username is over its limit."""
+        now = time.time()
+        conn = self._connect()
+        self._checks += 1
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if self._checks % 1000 == 0:
+                conn.execute('DELETE FROM login_attempt WHERE at <= ?', (now - self.window,))
+            else:
+                conn.execute('DELETE FROM login_attempt WHERE username = ? AND at <= ?',
+                             (username, now - self.window))
+            attempts = conn.execute('SELECT COUNT(*) FROM login_attempt WHERE username = ?',
+                                    (username,)).fetchone()[0]
+            allowed = attempts < self.limit
+            if allowed:
+                conn.execute('INSERT INTO login_attempt (username, at) VALUES (?, ?)', (username, now))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed
+
+    def reset(self, username):
+        self._connect().execute('DELETE FROM login_attempt WHERE username = ?', (username,))
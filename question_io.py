@@ -0,0 +1,119 @@
+# Streaming bulk import and export of quiz questions (CSV and JSON Lines)
+import csv
+import io
+import json
+
+from models import db, Quiz, Question
+
+FIELDS = ['question_statement', 'option1', 'option2', 'option3', 'option4', 'correct_option']
+FORMATS = ('csv', 'jsonl')
+
+# Rows inserted per executemany/transaction
+BATCH_SIZE = 1000
+
+# Validation errors reported back to the caller; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+def format_for(filename, default='csv'):
+    """Pick the import format from a file name's extension."""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension == 'csv':
+        return 'csv'
+    return default
+
+
+def iter_rows(stream, fmt):
+    """Yield (line number, row dict) from a binary stream without reading it all."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_num, row if isinstance(row, dict) else None
+
+
+def validate(row):
+    """Return a dict of cleaned Question fields, or raise ValueError."""
+    if row is None:
+        raise ValueError('not a valid record')
+    values = {field: str(row.get(field) or '').strip() for field in FIELDS}
+    missing = [field for field in FIELDS if not values[field]]
+    if missing:
+        raise ValueError(f'missing {", ".join(missing)}')
+    if values['correct_option'] not in ('1', '2', '3', '4'):
+        raise ValueError('correct_option must be a number between 1 and 4')
+    return values
+
+
+def import_questions(quiz_id, stream, fmt, batch_size=BATCH_SIZE):
+    """Validate and insert questions from a stream in batched transactions.
+
+    Invalid rows are skipped. Returns (imported count, error count, the first
+    MAX_REPORTED_ERRORS error messages).
+    """
+    insert = Question.__table__.insert()
+    imported = 0
+    error_count = 0
+    errors = []
+    batch = []
+
+    def flush():
+        db.session.execute(insert, batch)
+        Quiz.query.filter_by(id=quiz_id).update({Quiz.question_count: Quiz.question_count + len(batch)})
+        db.session.commit()
+
+    for line_num, row in iter_rows(stream, fmt):
+        try:
+            values = validate(row)
+        except ValueError as e:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(f'Line {line_num}: {e}')
+            continue
+        values['quiz_id'] = quiz_id
+        batch.append(values)
+        if len(batch) >= batch_size:
+            flush()
+            imported += len(batch)
+            batch = []
+
+    if batch:
+        flush()
+        imported += len(batch)
+    return imported, error_count, errors
+
+
+def export_questions(quiz_id, fmt):
+    """Yield a quiz's questions as CSV or JSON Lines text, a chunk at a time."""
+    rows = db.session.query(
+        *[getattr(Question, field) for field in FIELDS]
+    ).filter(
+        Question.quiz_id == quiz_id
+    ).order_by(Question.id).yield_per(500)
+
+    if fmt == 'jsonl':
+        for row in rows:
+            yield json.dumps(dict(zip(FIELDS, row))) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % 500 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,286 @@
+# Read-through cache for quiz content (quiz details plus its questions)
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from database import LocalConnections
+from grading import AnswerKey
+from models import db, Chapter, Quiz, Question
+
+# Display order of option codes for questions that are not shuffled
+DEFAULT_OPTION_ORDER = [1, 2, 3, 4]
+
+
+class MemoryBackend:
+    """In-process LRU store with a size bound and per-entry TTL."""
+
+    def __init__(self, max_entries=512, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteBackend:
+    """Local-file store shared by every worker process on one machine.
+
+    Values are stored as JSON. When the size bound is exceeded the entries
+    written longest ago are evicted first.
+    """
+
+    def __init__(self, path, max_entries=512, ttl=600, table='cache'):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.table = table
+        self._connect = LocalConnections(path, [
+            f'CREATE TABLE IF NOT EXISTS {table} ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+            'expires REAL NOT NULL, written REAL NOT NULL)'
+        ])
+
+    def get(self, key):
+        row = self._connect().execute(
+            f'SELECT value, expires FROM {self.table} WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            f'INSERT OR REPLACE INTO {self.table} (key, value, expires, written) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value), now + self.ttl, now)
+        )
+        conn.execute(
+            f'DELETE FROM {self.table} WHERE key IN ('
+            f'SELECT key FROM {self.table} ORDER BY written DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+        conn.commit()
+
+    def delete(self, key):
+        conn = self._connect()
+        conn.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+        conn.commit()
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute(f'DELETE FROM {self.table}')
+        conn.commit()
+
+
+class QuizCache:
+    """Quiz content keyed by quiz id, loaded from the database on a miss.
+
+    Cached values are plain dicts shared between requests and must not be
+    modified by callers. Routes that change a quiz's questions call
+    invalidate() so the next read reloads it.
+
+    Quizzes with a sample_size cache only their bank's question ids; pass
+    them through for_user() to get the questions a user is given.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.answer_keys = None
+        self.payloads = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.secret = app.config.get('SECRET_KEY') or ''
+        size = app.config.get('QUIZ_CACHE_SIZE', 512)
+        ttl = app.config.get('QUIZ_CACHE_TTL', 600)
+        if app.config.get('QUIZ_CACHE_BACKEND', 'memory') == 'sqlite':
+            path = app.config.get('QUIZ_CACHE_PATH') or os.path.join(app.instance_path, 'quiz_cache.db')
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.backend = SQLiteBackend(path, max_entries=size, ttl=ttl)
+        else:
+            self.backend = MemoryBackend(max_entries=size, ttl=ttl)
+        # Compiled answer keys are process-local objects and always kept in memory
+        self.answer_keys = MemoryBackend(max_entries=size, ttl=ttl)
+        self.payloads = MemoryBackend(max_entries=size, ttl=ttl)
+
+    def _key(self, quiz_id):
+        return f'quiz:{quiz_id}'
+
+    def _load(self, quiz_id):
+        row = db.session.query(Quiz, Chapter).outerjoin(
+            Chapter, Quiz.chapter_id == Chapter.id
+        ).filter(Quiz.id == quiz_id).first()
+        if row is None:
+            return None
+        quiz, chapter = row
+
+        content = {
+            'id': quiz.id,
+            'chapter_id': quiz.chapter_id,
+            'chapter_name': chapter.name if chapter else '',
+            'subject_id': chapter.subject_id if chapter else None,
+            'date_of_quiz': quiz.date_of_quiz.isoformat() if quiz.date_of_quiz else None,
+            'time_duration': quiz.time_duration,
+            'sample_size': quiz.sample_size,
+            'loaded_at': time.time(),
+        }
+        if quiz.sample_size:
+            # Only the ids (read from the quiz_id index); attempts load what they draw
+            content['question_ids'] = [question_id for question_id, in db.session.query(
+                Question.id
+            ).filter(Question.quiz_id == quiz_id).order_by(Question.id)]
+            content['questions'] = []
+        else:
+            questions = Question.query.filter_by(quiz_id=quiz_id).order_by(Question.id).all()
+            content['questions'] = [_question_dict(question) for question in questions]
+        return content
+
+    def get(self, quiz_id):
+        """Return the content dict for a quiz, or None if it does not exist."""
+        key = self._key(quiz_id)
+        content = self.backend.get(key)
+        if content is None:
+            content = self._load(quiz_id)
+            if content is not None:
+                self.backend.set(key, content)
+        return content
+
+    def draw(self, quiz, user_id):
+        """Draw a user's questions from a sampled quiz's bank.
+
+        sample_size ids are drawn by a generator seeded with the quiz and
+        user, and each gets an option order to display its options in;
+        option codes are unchanged. Returns (question ids, option orders)
+        packed for Attempt: an array('q') of ids and four codes per id.
+        """
+        seed = hashlib.sha256(f"{self.secret}:{quiz['id']}:{user_id}".encode()).digest()
+        rng = random.Random(seed)
+        bank = quiz['question_ids']
+        question_ids = rng.sample(bank, min(quiz['sample_size'], len(bank)))
+        option_orders = bytes(code for _ in question_ids for code in rng.sample((1, 2, 3, 4), 4))
+        return array('q', question_ids).tobytes(), option_orders
+
+    def for_user(self, quiz, user_id, drawn=None):
+        """The content dict as given to one user.
+
+        Unsampled quizzes are returned unchanged. For the others only the
+        questions drawn for the user are loaded, in the order drawn, each
+        with its option_order. drawn is the pair stored with the user's
+        attempt; without it the draw is made again from the current bank.
+        """
+        if not quiz.get('sample_size'):
+            return quiz
+        packed_ids, option_orders = drawn or self.draw(quiz, user_id)
+        question_ids = array('q')
+        question_ids.frombytes(packed_ids)
+        orders = {
+            question_id: list(option_orders[index * 4:index * 4 + 4])
+            for index, question_id in enumerate(question_ids)
+        }
+        questions = self.load_questions(list(question_ids))
+        for question in questions:
+            question['option_order'] = orders[question['id']]
+        return dict(quiz, questions=questions, drawn_for=user_id)
+
+    def load_questions(self, question_ids):
+        """Question dicts for the given ids, in that order; missing ids are skipped."""
+        if not question_ids:
+            return []
+        found = {question.id: question for question in Question.query.filter(Question.id.in_(question_ids))}
+        return [_question_dict(found[question_id]) for question_id in question_ids if question_id in found]
+
+    def answer_key(self, quiz):
+        """Return the compiled AnswerKey for a content dict from get() or for_user().
+
+        Keys are memoised per loaded copy of the content, so a reload after
+        invalidation (in this or another worker) compiles a fresh key. Keys
+        for a user's draw are compiled on each call.
+        """
+        if 'drawn_for' in quiz:
+            return AnswerKey.from_questions(quiz['id'], quiz['questions'])
+        key = f"{quiz['id']}:{quiz['loaded_at']}"
+        answer_key = self.answer_keys.get(key)
+        if answer_key is None:
+            answer_key = AnswerKey.from_questions(quiz['id'], quiz['questions'])
+            self.answer_keys.set(key, answer_key)
+        return answer_key
+
+    def payload(self, quiz):
+        """Return (json bytes, etag) of a content dict without the correct answers.
+
+        Serialised once per loaded copy of the content, like answer keys, or
+        on each call for a user's draw. Options are listed by code, followed
+        by the order to display them in (shuffled for a user's draw).
+        """
+        key = f"{quiz['id']}:{quiz['loaded_at']}"
+        payload = None if 'drawn_for' in quiz else self.payloads.get(key)
+        if payload is None:
+            body = json.dumps({
+                'id': quiz['id'],
+                'chapter': quiz['chapter_name'],
+                'date': quiz['date_of_quiz'],
+                'duration': quiz['time_duration'],
+                'questions': [
+                    [question['id'], question['question_statement'], question['option1'],
+                     question['option2'], question['option3'], question['option4'],
+                     question.get('option_order', DEFAULT_OPTION_ORDER)]
+                    for question in quiz['questions']
+                ],
+            }, separators=(',', ':')).encode('utf-8')
+            payload = (body, hashlib.sha1(body).hexdigest())
+            if 'drawn_for' not in quiz:
+                self.payloads.set(key, payload)
+        return payload
+
+    def invalidate(self, quiz_id):
+        self.backend.delete(self._key(quiz_id))
+
+    def clear(self):
+        self.backend.clear()
+        self.answer_keys.clear()
+        self.payloads.clear()
+
+
+def _question_dict(question):
+    return {
+        'id': question.id,
+        'question_statement': question.question_statement,
+        'option1': question.option1,
+        'option2': question.option2,
+        'option3': question.option3,
+        'option4': question.option4,
+        'correct_option': question.correct_option
+    }
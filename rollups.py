@@ -0,0 +1,288 @@
+# In-process rollups for the analytics pages
+import itertools
+import threading
+import time
+
+from sqlalchemy import func
+
+from models import db, Subject, Chapter, Quiz, Score
+
+# Leaderboard scopes: a quiz, or all quizzes in a chapter or subject
+SCOPES = ('quiz', 'chapter', 'subject')
+
+
+class SharedInvalidation:
+    """Makes invalidate() reach every worker process, not just this one.
+
+    After share_invalidations(page_cache), invalidate() bumps a page cache
+    generation and each read compares it with the one last loaded. With
+    the sqlite page cache backend (used by `flask serve` with several
+    workers) the generation is shared, so an invalidation in one worker
+    makes every worker reload. Scores recorded in other workers still only
+    show up once the ttl runs out.
+    """
+
+    generation_name = None
+
+    def share_invalidations(self, page_cache):
+        self.shared = page_cache
+
+    def _generation(self):
+        if self.shared is None:
+            return None
+        return self.shared.generation(self.generation_name)
+
+    def _bump(self):
+        if self.shared is not None:
+            self.shared.bump(self.generation_name)
+
+
+class SubjectStats(SharedInvalidation):
+    """Per-subject top score, attempt count and quiz count.
+
+    Loaded with a single grouped query and kept current by record_score(),
+    so admin_summary does not issue queries per subject. Catalogue changes
+    (subjects, chapters, quizzes) call invalidate() and the next read reloads.
+    """
+
+    generation_name = 'rollup:subject_stats'
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.shared = None
+        self._lock = threading.Lock()
+        self._rows = None
+        self._loaded_at = 0.0
+        self._generation_loaded = None
+
+    def _load(self):
+        rows = db.session.query(
+            Subject.id,
+            Subject.name,
+            func.coalesce(func.max(Score.total_scored), 0),
+            func.count(Score.id),
+            func.count(func.distinct(Quiz.id))
+        ).outerjoin(
+            Chapter, Chapter.subject_id == Subject.id
+        ).outerjoin(
+            Quiz, Quiz.chapter_id == Chapter.id
+        ).outerjoin(
+            Score, Score.quiz_id == Quiz.id
+        ).group_by(
+            Subject.id
+        ).order_by(
+            Subject.id
+        ).all()
+
+        stats = {}
+        for subject_id, name, top_score, attempts, quiz_count in rows:
+            stats[subject_id] = {
+                'name': name,
+                'top_score': top_score,
+                'attempts': attempts,
+                'quiz_count': quiz_count
+            }
+        return stats
+
+    def all(self):
+        """Return the rollup rows ordered by subject id."""
+        generation = self._generation()
+        with self._lock:
+            expired = self.ttl and time.monotonic() - self._loaded_at > self.ttl
+            if self._rows is None or expired or generation != self._generation_loaded:
+                self._rows = self._load()
+                self._loaded_at = time.monotonic()
+                self._generation_loaded = generation
+            return [dict(row) for row in self._rows.values()]
+
+    def record_score(self, subject_id, total_scored):
+        """Fold a newly inserted Score into the rollup without re-querying."""
+        with self._lock:
+            if self._rows is None:
+                return
+            row = self._rows.get(subject_id)
+            if row is None:
+                # Subject created since the last load; reload on next read
+                self._rows = None
+                return
+            row['attempts'] += 1
+            row['top_score'] = max(row['top_score'], total_scored or 0)
+
+    def invalidate(self):
+        with self._lock:
+            self._rows = None
+        self._bump()
+
+
+class RankedBoard:
+    """Users ordered by total score, highest first, with O(log n) rank lookup.
+
+    A Fenwick tree counts users per total, so the number of users above a
+    total and the k-th highest total are both found in O(log m), where m is
+    the highest total seen. Users on the same total share a rank and are
+    listed in the order they reached it.
+    """
+
+    def __init__(self):
+        self.totals = {}  # user_id -> total
+        self._tied = {}  # total -> {user_id: None}, in arrival order
+        self._tree = [0] * 17  # 1-based Fenwick tree over totals 0..15
+
+    def __len__(self):
+        return len(self.totals)
+
+    def _add(self, total, delta):
+        i = total + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _at_most(self, total):
+        # Users whose total is <= total
+        count, i = 0, min(total + 1, len(self._tree) - 1)
+        while i > 0:
+            count += self._tree[i]
+            i -= i & -i
+        return count
+
+    def _nth_lowest(self, n):
+        # Smallest total with at least n users at or below it (binary lifting)
+        position, step = 0, 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            if position + step < len(self._tree) and self._tree[position + step] < n:
+                position += step
+                n -= self._tree[position]
+            step >>= 1
+        return position
+
+    def _grow(self, total):
+        # Rebuild the tree with room for totals up to at least total
+        size = len(self._tree) - 1
+        while size <= total:
+            size *= 2
+        self._tree = [0] * (size + 1)
+        for user_total, users in self._tied.items():
+            self._add(user_total, len(users))
+
+    def add(self, user_id, points):
+        """Add points to a user's total (a new user starts at 0)."""
+        old = self.totals.get(user_id)
+        new = (old or 0) + max(points or 0, 0)
+        if old is not None:
+            if old == new:
+                return
+            self._add(old, -1)
+            del self._tied[old][user_id]
+            if not self._tied[old]:
+                del self._tied[old]
+        if new >= len(self._tree) - 1:
+            self._grow(new)
+        self.totals[user_id] = new
+        self._tied.setdefault(new, {})[user_id] = None
+        self._add(new, 1)
+
+    def rank(self, user_id):
+        """(rank, total) of a user, or None if they have no score here."""
+        total = self.totals.get(user_id)
+        if total is None:
+            return None
+        return len(self.totals) - self._at_most(total) + 1, total
+
+    def top(self, limit):
+        """[(rank, user_id, total), ...] for the first limit users."""
+        rows = []
+        rank = 1
+        while rank <= len(self.totals) and len(rows) < limit:
+            total = self._nth_lowest(len(self.totals) - rank + 1)
+            users = self._tied[total]
+            for user_id in itertools.islice(users, limit - len(rows)):
+                rows.append((rank, user_id, total))
+            rank += len(users)
+        return rows
+
+
+class Leaderboards(SharedInvalidation):
+    """A RankedBoard for every quiz, chapter and subject.
+
+    Quiz boards rank by score; chapter and subject boards rank by the sum
+    of a user's quiz scores within them. Built from Score with one query on
+    first use and kept current by record_score(), so reads issue no
+    queries. Like SubjectStats, the boards are rebuilt after ttl seconds
+    (picking up other worker processes' submissions) and after invalidate()
+    in any worker.
+    """
+
+    generation_name = 'rollup:leaderboards'
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.shared = None
+        self._lock = threading.Lock()
+        self._boards = None
+        self._loaded_at = 0.0
+        self._generation_loaded = None
+
+    def _load(self):
+        boards = {}
+        rows = db.session.query(
+            Score.user_id, Score.quiz_id, Quiz.chapter_id, Chapter.subject_id, Score.total_scored
+        ).join(
+            Quiz, Score.quiz_id == Quiz.id
+        ).join(
+            Chapter, Quiz.chapter_id == Chapter.id
+        ).order_by(
+            Score.id
+        )
+        for user_id, quiz_id, chapter_id, subject_id, total_scored in rows:
+            for key in (('quiz', quiz_id), ('chapter', chapter_id), ('subject', subject_id)):
+                board = boards.get(key)
+                if board is None:
+                    board = boards[key] = RankedBoard()
+                board.add(user_id, total_scored)
+        return boards
+
+    def _current(self, generation):
+        # Called with self._lock held
+        expired = self.ttl and time.monotonic() - self._loaded_at > self.ttl
+        if self._boards is None or expired or generation != self._generation_loaded:
+            self._boards = self._load()
+            self._loaded_at = time.monotonic()
+            self._generation_loaded = generation
+        return self._boards
+
+    def preload(self):
+        """Build the boards now rather than on the first read; returns their count."""
+        generation = self._generation()
+        with self._lock:
+            return len(self._current(generation))
+
+    def standings(self, scope, scope_id, user_id=None, limit=10):
+        """Top entries of a board, the user's (rank, total) and the number of entrants."""
+        generation = self._generation()
+        with self._lock:
+            board = self._current(generation).get((scope, scope_id)) or RankedBoard()
+            return board.top(limit), board.rank(user_id), len(board)
+
+    def record_score(self, quiz_id, chapter_id, subject_id, user_id, total_scored):
+        """Fold a newly inserted Score into the boards without re-querying."""
+        with self._lock:
+            if self._boards is None:
+                return
+            if chapter_id is None or subject_id is None:
+                # Where the quiz sits is unknown; rebuild on next read
+                self._boards = None
+                return
+            for key in (('quiz', quiz_id), ('chapter', chapter_id), ('subject', subject_id)):
+                board = self._boards.get(key)
+                if board is None:
+                    board = self._boards[key] = RankedBoard()
+                board.add(user_id, total_scored)
+
+    def invalidate(self):
+        with self._lock:
+            self._boards = None
+        self._bump()
+
+
+subject_stats = SubjectStats()
+leaderboards = Leaderboards()
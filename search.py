@@ -0,0 +1,75 @@
+# SQLite FTS5 search index over users, subjects, chapters and questions
+import re
+
+from sqlalchemy import text
+
+from models import db
+
+# Indexed tables and the text columns each FTS table mirrors. The FTS tables
+# use the source table as external content, keyed by its id.
+INDEXED = {
+    'user': ('username', 'full_name'),
+    'subject': ('name', 'description'),
+    'chapter': ('name',),
+    'question': ('question_statement',)
+}
+
+
+def _ddl(table, columns):
+    fts = f'{table}_fts'
+    cols = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    return [
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5('
+        f'{cols}, content="{table}", content_rowid="id", prefix="2 3")',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{table}" BEGIN '
+        f'INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{table}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON "{table}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); "
+        f'INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END'
+    ]
+
+
+def ensure_search_index(engine):
+    """Create the FTS tables and sync triggers, building any new index from existing rows."""
+    with engine.begin() as conn:
+        existing = {row[0] for row in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '%_fts'"
+        ))}
+        created = []
+        for table, columns in INDEXED.items():
+            for statement in _ddl(table, columns):
+                conn.execute(text(statement))
+            if f'{table}_fts' not in existing:
+                conn.execute(text(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')"))
+                created.append(table)
+    return created
+
+
+def match_expression(query):
+    """Turn free text into an FTS5 query matching every word as a prefix."""
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_ids(table, query, limit, offset=0):
+    """Ids of rows in table matching query, best match first."""
+    expression = match_expression(query)
+    if not expression:
+        return []
+    rows = db.session.execute(text(
+        f'SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH :q ORDER BY rank LIMIT :limit OFFSET :offset'
+    ), {'q': expression, 'limit': limit, 'offset': offset})
+    return [row[0] for row in rows]
+
+
+def search(model, query, limit, offset=0):
+    """Model instances matching query in rank order."""
+    ids = search_ids(model.__tablename__, query, limit, offset)
+    if not ids:
+        return []
+    rows = {row.id: row for row in model.query.filter(model.id.in_(ids)).all()}
+    return [rows[row_id] for row_id in ids if row_id in rows]
@@ -0,0 +1,157 @@
+# Pre-forking production server: load and warm the app once, then fork workers
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from werkzeug.serving import make_server
+
+from models import db
+
+
+class PreforkServer:
+    """Runs a WSGI app in worker processes forked from one preloaded parent.
+
+    The parent imports the app, runs the warm-up callables (filling caches,
+    compiling templates), closes its database connections and freezes the
+    garbage collector, then forks. Workers start with everything already
+    loaded and share those memory pages copy-on-write, so a restart during
+    an exam does not send the first requests to cold workers. Each worker
+    serves the shared listening socket with a thread per request and opens
+    its own database connections. Workers that die are replaced; SIGTERM
+    or SIGINT stops them all.
+    """
+
+    def __init__(self, app, host='127.0.0.1', port=8000, workers=2, warmers=(), on_worker_exit=()):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.warmers = list(warmers)
+        self.on_worker_exit = list(on_worker_exit)
+        self.pids = set()
+        self.listener = None
+        self._stopping = False
+
+    def log(self, message):
+        print(f'[{os.getpid()}] {message}', file=sys.stderr, flush=True)
+
+    def warm(self):
+        """Run the warm-up callables in an app context; returns their descriptions."""
+        done = []
+        with self.app.app_context():
+            for warmer in self.warmers:
+                started = time.perf_counter()
+                description = warmer()
+                done.append(f'{description} in {time.perf_counter() - started:.2f}s')
+            # Connections must not be inherited by the workers
+            db.session.remove()
+            db.engine.dispose()
+        # Objects created so far are never freed; keeping the collector off
+        # them stops it from touching (and so copying) the shared pages
+        gc.collect()
+        gc.freeze()
+        return done
+
+    def start(self):
+        """Bind, warm up and fork the workers; returns once all are accepting."""
+        started = time.perf_counter()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((self.host, self.port))
+        self.listener.listen(1024)
+        self.port = self.listener.getsockname()[1]
+
+        for line in self.warm():
+            self.log(f'Warmed {line}')
+
+        ready_read, ready_write = os.pipe()
+        for _ in range(self.workers):
+            self._spawn(ready_write)
+        os.close(ready_write)
+        # Each worker writes one byte once its server is built
+        ready = 0
+        while ready < self.workers:
+            chunk = os.read(ready_read, self.workers)
+            if not chunk:
+                break
+            ready += len(chunk)
+        os.close(ready_read)
+        self.log(f'{ready} workers listening on http://{self.host}:{self.port} '
+                 f'(ready in {time.perf_counter() - started:.2f}s)')
+        return self.port
+
+    def _spawn(self, ready_write=None):
+        pid = os.fork()
+        if pid:
+            self.pids.add(pid)
+            return pid
+
+        # Worker process
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        signal.signal(signal.SIGINT, lambda *_: sys.exit(0))
+        status = 0
+        try:
+            server = make_server(self.host, self.port, self.app, threaded=True, fd=self.listener.fileno())
+            if ready_write is not None:
+                os.write(ready_write, b'.')
+                os.close(ready_write)
+            server.serve_forever()
+        except SystemExit:
+            pass
+        except Exception as e:
+            print(f"Error: {str(e)}")  # For debugging
+            status = 1
+        finally:
+            for callback in self.on_worker_exit:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Error: {str(e)}")  # For debugging
+            os._exit(status)
+
+    def serve(self):
+        """Start, then replace workers that exit until told to stop."""
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        self.start()
+        while self.pids:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            self.pids.discard(pid)
+            if not self._stopping:
+                self.log(f'Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; starting a replacement')
+                time.sleep(1)  # Do not spin if workers fail at startup
+                if not self._stopping:
+                    self._spawn()
+        self.listener.close()
+        self.log('Stopped')
+
+    def _handle_stop(self, signum, frame):
+        if not self._stopping:
+            self.log('Stopping workers')
+        self.stop(wait=False)
+
+    def stop(self, wait=True):
+        """Ask every worker to finish; with wait, reap them too."""
+        self._stopping = True
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                self.pids.discard(pid)
+        if wait:
+            for pid in list(self.pids):
+                try:
+                    os.waitpid(pid, 0)
+                except OSError:
+                    pass
+                self.pids.discard(pid)
+            if self.listener is not None:
+                self.listener.close()
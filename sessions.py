@@ -0,0 +1,266 @@
+# Server-side sessions: the cookie holds only a random id, the data lives in a store
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from flask import g, redirect, flash, session, jsonify
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from database import LocalConnections
+
+
+class MemoryStore:
+    """Sessions in a dict; for tests and single-process development."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def get(self, sid):
+        entry = self._sessions.get(sid)
+        if entry is None or entry[2] < time.time():
+            return None
+        return entry[1], entry[2]
+
+    def set(self, sid, user_id, data, expires):
+        with self._lock:
+            self._sessions[sid] = (user_id, data, expires)
+
+    def touch(self, sid, expires):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is not None:
+                self._sessions[sid] = (entry[0], entry[1], expires)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            for sid in [sid for sid, entry in self._sessions.items() if entry[0] == user_id]:
+                del self._sessions[sid]
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, entry in self._sessions.items() if entry[2] < now]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+
+class SQLiteStore:
+    """Sessions in a local SQLite file shared by every worker process.
+
+    A request costs one primary-key lookup; user_id is indexed so all of a
+    user's sessions can be revoked at once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # The file is only created once a session is first used
+        self._connect = LocalConnections(path, [
+            'CREATE TABLE IF NOT EXISTS session ('
+            'id TEXT PRIMARY KEY, user_id INTEGER, data TEXT NOT NULL, expires REAL NOT NULL)',
+            'CREATE INDEX IF NOT EXISTS ix_session_user_id ON session (user_id)',
+            'CREATE INDEX IF NOT EXISTS ix_session_expires ON session (expires)',
+        ])
+
+    def get(self, sid):
+        return self._connect().execute(
+            'SELECT data, expires FROM session WHERE id = ? AND expires >= ?', (sid, time.time())
+        ).fetchone()
+
+    def set(self, sid, user_id, data, expires):
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO session (id, user_id, data, expires) VALUES (?, ?, ?, ?)',
+            (sid, user_id, data, expires)
+        )
+        conn.commit()
+
+    def touch(self, sid, expires):
+        conn = self._connect()
+        conn.execute('UPDATE session SET expires = ? WHERE id = ?', (expires, sid))
+        conn.commit()
+
+    def delete(self, sid):
+        conn = self._connect()
+        conn.execute('DELETE FROM session WHERE id = ?', (sid,))
+        conn.commit()
+
+    def delete_user(self, user_id):
+        conn = self._connect()
+        conn.execute('DELETE FROM session WHERE user_id = ?', (user_id,))
+        conn.commit()
+
+    def sweep(self):
+        conn = self._connect()
+        deleted = conn.execute('DELETE FROM session WHERE expires < ?', (time.time(),)).rowcount
+        conn.commit()
+        return deleted
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its id and whether it changed."""
+
+    def __init__(self, initial=None, sid=None, expires=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires = expires
+        self.new = sid is None
+        self.modified = False
+        self.replaced_sid = None
+
+    def regenerate(self):
+        """Move the data to a fresh id, e.g. on login to prevent session fixation."""
+        if self.sid is not None and self.replaced_sid is None:
+            self.replaced_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+
+class SessionStore(SessionInterface):
+    """Flask session interface backed by MemoryStore or SQLiteStore.
+
+    Sessions expire after SESSION_LIFETIME seconds without activity. The
+    expiry is pushed forward (one UPDATE) once less than half of it remains,
+    and a background thread deletes expired sessions every
+    SESSION_SWEEP_INTERVAL seconds.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, app=None):
+        self.store = None
+        self._sweeper_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.lifetime = app.config.get('SESSION_LIFETIME', 86400)
+        self.sweep_interval = app.config.get('SESSION_SWEEP_INTERVAL', 300)
+        if app.config.get('SESSION_BACKEND', 'sqlite') == 'sqlite':
+            path = app.config.get('SESSION_DB_PATH') or os.path.join(app.instance_path, 'sessions.db')
+            self.store = SQLiteStore(path)
+        else:
+            self.store = MemoryStore()
+        app.session_interface = self
+
+    def _start_sweeper(self):
+        # One sweeper per process, started on first use (and again after a fork)
+        if self._sweeper_pid == os.getpid() or not self.sweep_interval:
+            return
+        with self._lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+            threading.Thread(target=self._sweep_forever, name='session-sweeper', daemon=True).start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.store.sweep()
+            except sqlite3.Error:
+                pass  # Busy database; try again next interval
+
+    def open_session(self, app, request):
+        self._start_sweeper()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            row = self.store.get(sid)
+            if row is not None:
+                return ServerSession(self.serializer.loads(row[0]), sid=sid, expires=row[1])
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.replaced_sid is not None:
+            self.store.delete(session.replaced_sid)
+
+        if not session:
+            # Emptied (logged out): forget it server-side and in the browser
+            if session.sid is not None and session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        if session.modified:
+            session.expires = now + self.lifetime
+            self.store.set(session.sid, session.get('user_id'), self.serializer.dumps(dict(session)),
+                           session.expires)
+        elif session.expires - now < self.lifetime / 2:
+            session.expires = now + self.lifetime
+            self.store.touch(session.sid, session.expires)
+
+        if session.new or session.replaced_sid is not None or session.permanent:
+            response.set_cookie(
+                name, session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+    def revoke_user(self, user_id):
+        """End every session belonging to a user, e.g. after a password change."""
+        self.store.delete_user(user_id)
+
+
+def login_user(user):
+    """Start a user session, caching the fields pages need so no User query is required."""
+    session.regenerate()
+    session['user_id'] = user.id
+    session['user'] = {'id': user.id, 'username': user.username, 'full_name': user.full_name}
+
+
+def login_required(view):
+    """Redirect to the login page unless a user is logged in; sets g.user."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if 'user_id' not in session:
+            return redirect('/login')
+        g.user = session.get('user') or {'id': session['user_id']}
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def api_login_required(view):
+    """Like login_required, but answers 401 JSON for API clients."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not logged in'}), 401
+        g.user = session.get('user') or {'id': session['user_id']}
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def admin_required(view):
+    """Redirect to the admin login page unless the admin is logged in."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not session.get('admin'):
+            flash('Please login as admin first!', 'error')
+            return redirect('/admin_login')
+        return view(*args, **kwargs)
+    return wrapped
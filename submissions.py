@@ -0,0 +1,376 @@
+# Write-behind queue for graded quiz submissions
+import atexit
+import base64
+import glob
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Score, AnswerSheet
+from rollups import subject_stats, leaderboards
+
+
+class SubmissionQueue:
+    """Graded submissions journaled to disk and committed in batches.
+
+    enqueue() appends the submission to an append-only journal and returns
+    once it is on disk. Journal writes are fsynced as a group: one fsync
+    covers every submission written before it started, so concurrent
+    enqueue() calls share it rather than waiting for one each. A background writer thread inserts queued
+    submissions in batched transactions and then appends a commit marker.
+    When the writer starts, journaled submissions without a marker are
+    replayed and any whose Score already exists are skipped, so a crash
+    neither loses nor duplicates attempts.
+
+    Each process keeps its own journal (the process id is part of the file
+    name), so worker processes never truncate or replay each other's
+    submissions. A starting writer takes over only the journals of
+    processes that have exited, and is_pending() also looks in the other
+    journals, so results wait for a submission queued by any worker.
+
+    A batch that violates a constraint is retried one submission at a time
+    and submissions that still fail (say, their quiz was deleted while they
+    were queued) are logged and dropped. Batches that fail for other
+    reasons, such as a locked database, are retried with backoff up to
+    SUBMISSION_MAX_RETRIES times; submissions still failing after that stay
+    in the journal, to be replayed when the process next starts.
+
+    While the queue is disabled nothing is pending; journals left by an
+    earlier run are replayed when it is next enabled.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._written = 0  # Journal entries written by this process
+        self._synced = 0  # ... and how many of them are known to be on disk
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._abandoned = set()
+        self._journal = None
+        self._thread = None
+        self._pid = None
+        self._foreign = {}  # Other journals' path -> (mtime, size, pending pairs)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('SUBMISSION_QUEUE_ENABLED', False)
+        self.batch_size = app.config.get('SUBMISSION_BATCH_SIZE', 200)
+        self.flush_interval = app.config.get('SUBMISSION_FLUSH_INTERVAL', 0.05)
+        self.max_retries = app.config.get('SUBMISSION_MAX_RETRIES', 5)
+        self.fsync = app.config.get('SUBMISSION_JOURNAL_FSYNC', True)
+        self.journal_base = (app.config.get('SUBMISSION_JOURNAL_PATH')
+                             or os.path.join(app.instance_path, 'submissions.journal'))
+
+    @property
+    def journal_path(self):
+        """This process's journal: the configured path with the pid before the extension."""
+        root, ext = os.path.splitext(self.journal_base)
+        return f'{root}.{os.getpid()}{ext}'
+
+    def _journals(self):
+        root, ext = os.path.splitext(self.journal_base)
+        return glob.glob(f'{glob.escape(root)}.*{ext}')
+
+    def _journal_pid(self, path):
+        root, ext = os.path.splitext(self.journal_base)
+        try:
+            return int(path[len(root) + 1:len(path) - len(ext)].split('.')[0])
+        except ValueError:
+            return None
+
+    def _start(self):
+        # Called with self._lock held; once per process, again after a fork
+        if self._pid == os.getpid():
+            return
+        if self._pid is not None:
+            # Forked from a process whose writer was running: its queue is not ours
+            self._queue = queue.Queue()
+            self._pending = set()
+            self._abandoned = set()
+            self._written = self._synced = 0
+        self._pid = os.getpid()
+        os.makedirs(os.path.dirname(os.path.abspath(self.journal_base)), exist_ok=True)
+
+        # Take over the journals of exited processes (including a stale one
+        # left by an earlier process with our pid). Renaming to a name with
+        # our pid claims a journal, so two starting workers cannot both replay it.
+        records = {}
+        claimed = []
+        root, ext = os.path.splitext(self.journal_base)
+        for path in self._journals():
+            pid = self._journal_pid(path)
+            if pid is None or (pid != self._pid and _alive(pid)):
+                continue
+            claim = f'{root}.{self._pid}.{uuid.uuid4().hex}{ext}'
+            try:
+                os.rename(path, claim)
+            except FileNotFoundError:
+                continue  # Claimed by another process first
+            records.update(_read_journal(claim))
+            claimed.append(claim)
+
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        for record in records.values():
+            self._write(record)
+            self._pending.add((record['quiz_id'], record['user_id']))
+            self._queue.put(record)
+        if records and self.fsync:
+            os.fsync(self._journal.fileno())
+            self._synced = self._written
+        # Now in our own journal
+        for claim in claimed:
+            os.remove(claim)
+        self._thread = threading.Thread(target=self._run, name='submission-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _write(self, entry):
+        # Called with self._lock held; on disk once _sync() covers it
+        self._journal.write(json.dumps(entry) + '\n')
+        self._journal.flush()
+        self._written += 1
+
+    def _sync(self, written):
+        # Group commit: whoever takes the sync lock fsyncs everything written
+        # so far, and callers whose entries that covered return without one.
+        # Commit markers need no fsync of their own: a lost marker only means
+        # a replay, which skips submissions whose Score exists.
+        if not self.fsync:
+            return
+        with self._sync_lock:
+            if self._synced >= written:
+                return
+            with self._lock:
+                written = self._written
+                fileno = self._journal.fileno()
+            os.fsync(fileno)
+            self._synced = written
+
+    def enqueue(self, quiz_id, user_id, chapter_id, subject_id, total_scored, question_ids, answers):
+        """Journal a graded submission for the writer and return its token."""
+        record = {
+            'token': uuid.uuid4().hex,
+            'quiz_id': quiz_id,
+            'user_id': user_id,
+            'chapter_id': chapter_id,
+            'subject_id': subject_id,
+            'total_scored': total_scored,
+            'question_ids': base64.b64encode(question_ids).decode('ascii'),
+            'answers': base64.b64encode(answers).decode('ascii'),
+            'attempted_at': datetime.now().isoformat()
+        }
+        with self._lock:
+            self._start()
+            self._write(record)
+            written = self._written
+            self._pending.add((quiz_id, user_id))
+        self._sync(written)
+        self._queue.put(record)
+        return record['token']
+
+    def is_pending(self, quiz_id, user_id):
+        """True if any process has a queued, not yet committed submission."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            if (quiz_id, user_id) in self._pending:
+                return True
+        return (quiz_id, user_id) in self._foreign_pending()
+
+    def _foreign_pending(self):
+        # Pending pairs in other processes' journals, re-read only when a file
+        # changes; writers truncate their journal once drained, so this is cheap
+        own = self.journal_path
+        pending = set()
+        seen = {}
+        for path in self._journals():
+            if path == own:
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            cached = self._foreign.get(path)
+            if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+                try:
+                    records = _read_journal(path) if stat.st_size else {}
+                except FileNotFoundError:
+                    continue
+                pairs = {(record['quiz_id'], record['user_id']) for record in records.values()}
+                cached = (stat.st_mtime_ns, stat.st_size, pairs)
+            seen[path] = cached
+            pending |= cached[2]
+        self._foreign = seen
+        return pending
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is None
+            records = [record for record in batch if record is not None]
+            if records:
+                self._commit(records)
+            if stop:
+                return
+
+    def _insert(self, records):
+        # Inserts the records without a Score yet in one transaction; returns those inserted
+        pairs = [(record['quiz_id'], record['user_id']) for record in records]
+        existing = set(db.session.query(Score.quiz_id, Score.user_id).filter(
+            tuple_(Score.quiz_id, Score.user_id).in_(pairs)
+        ).all())
+
+        inserted = []
+        for record in records:
+            key = (record['quiz_id'], record['user_id'])
+            if key in existing:
+                continue
+            existing.add(key)
+            score = Score(
+                quiz_id=record['quiz_id'],
+                user_id=record['user_id'],
+                total_scored=record['total_scored'],
+                attempted_at=datetime.fromisoformat(record['attempted_at'])
+            )
+            score.answer_sheet = AnswerSheet(
+                question_ids=base64.b64decode(record['question_ids']),
+                answers=base64.b64decode(record['answers'])
+            )
+            db.session.add(score)
+            inserted.append(record)
+        db.session.commit()
+        return inserted
+
+    def _commit(self, records):
+        done = []  # Inserted, already present or dropped: the journal no longer needs them
+        inserted = []
+        failed = []
+        error = None
+        with self.app.app_context():
+            try:
+                inserted = self._insert(records)
+                done = records
+            except IntegrityError:
+                # One bad record must not hold up the rest of the batch
+                db.session.rollback()
+                for record in records:
+                    try:
+                        inserted += self._insert([record])
+                        done.append(record)
+                    except IntegrityError as e:
+                        db.session.rollback()
+                        self.errors += 1
+                        print(f"Error: dropping submission for quiz {record['quiz_id']}, "
+                              f"user {record['user_id']}: {str(e)}")  # For debugging
+                        done.append(record)
+                    except Exception as e:
+                        db.session.rollback()
+                        failed.append(record)
+                        error = e
+            except Exception as e:
+                db.session.rollback()
+                failed = records
+                error = e
+
+        for record in inserted:
+            subject_stats.record_score(record['subject_id'], record['total_scored'])
+            leaderboards.record_score(record['quiz_id'], record.get('chapter_id'), record['subject_id'],
+                                      record['user_id'], record['total_scored'])
+
+        with self._lock:
+            if done:
+                self._write({'committed': [record['token'] for record in done]})
+            for record in done:
+                self._pending.discard((record['quiz_id'], record['user_id']))
+            # Everything journaled has been committed; start a fresh journal
+            if not self._pending and not self._abandoned:
+                self._journal.seek(0)
+                self._journal.truncate()
+
+        if failed:
+            self._retry(failed, error)
+
+    def _retry(self, records, error):
+        # Requeue after a failed commit (e.g. "database is locked"), backing off;
+        # records out of retries are left in the journal for the next start
+        self.errors += 1
+        print(f"Error: {str(error)}")  # For debugging
+        retry = []
+        for record in records:
+            record['attempts'] = record.get('attempts', 0) + 1
+            if record['attempts'] <= self.max_retries:
+                retry.append(record)
+                continue
+            print(f"Error: giving up on submission for quiz {record['quiz_id']}, "
+                  f"user {record['user_id']} until restart")  # For debugging
+            with self._lock:
+                self._pending.discard((record['quiz_id'], record['user_id']))
+                self._abandoned.add(record['token'])
+        if retry:
+            time.sleep(min(self.flush_interval * 2 ** retry[0]['attempts'], 5))
+            for record in retry:
+                self._queue.put(record)
+
+    def close(self):
+        """Stop the writer after it commits everything already queued."""
+        with self._lock:
+            thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        thread.join(timeout=30)
+        with self._lock:
+            self._journal.close()
+            self._thread = None
+            self._journal = None
+            self._pid = None
+
+
+def _read_journal(path):
+    # token -> record for every journaled submission without a commit marker
+    records = {}
+    with open(path, encoding='utf-8') as journal:
+        for line in journal:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Torn write at the end of the journal
+            if 'committed' in entry:
+                for token in entry['committed']:
+                    records.pop(token, None)
+            else:
+                records[entry['token']] = entry
+    return records
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists, owned by another user
+    return True
@@ -0,0 +1,72 @@
+# Shared fixtures: a bare app bound to a throwaway database, and the full app's test client
+import os
+import sys
+from datetime import date
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import init_database  # noqa: E402
+from models import db, User, Subject, Chapter, Quiz, Question  # noqa: E402
+
+
+def seed(questions=3, sample_size=None):
+    """One subject, chapter and quiz (questions all answered by option 1) and one user."""
+    subject = Subject(name='Physics', description='')
+    db.session.add(subject)
+    db.session.flush()
+    chapter = Chapter(subject_id=subject.id, name='Optics')
+    db.session.add(chapter)
+    db.session.flush()
+    quiz = Quiz(chapter_id=chapter.id, date_of_quiz=date(2030, 1, 1), time_duration='10',
+                question_count=questions, sample_size=sample_size)
+    db.session.add(quiz)
+    db.session.flush()
+    for number in range(questions):
+        db.session.add(Question(quiz_id=quiz.id, question_statement=f'Question {number}',
+                                option1='a', option2='b', option3='c', option4='d', correct_option='1'))
+    user = User(username='student', password='pbkdf2:sha256:1000$salt$hash', full_name='Student')
+    db.session.add(user)
+    db.session.commit()
+    return {'subject_id': subject.id, 'chapter_id': chapter.id, 'quiz_id': quiz.id, 'user_id': user.id}
+
+
+@pytest.fixture
+def db_app(tmp_path):
+    """A bare Flask app with the models on a fresh SQLite file, for testing one component."""
+    app = Flask(__name__, instance_path=str(tmp_path / 'instance'))
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['TESTING'] = True
+    init_database(app)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture(scope='session')
+def quizmaster(tmp_path_factory):
+    """The real app module on a throwaway database, with query budgets enforced."""
+    tmp = tmp_path_factory.mktemp('quizmaster')
+    os.environ['DATABASE_URL'] = f"sqlite:///{tmp / 'quizmaster.db'}"
+    import app as quizmaster
+    from passwords import LoginRateLimiter
+    from search import ensure_search_index
+
+    app = quizmaster.app
+    app.instance_path = str(tmp / 'instance')
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, ENFORCE_QUERY_BUDGETS=True,
+                      SESSION_BACKEND='memory')
+    quizmaster.session_store.init_app(app)
+    quizmaster.job_queue.init_app(app)
+    quizmaster.submission_queue.init_app(app)
+    quizmaster.login_limiter = LoginRateLimiter(app.config['LOGIN_RATE_LIMIT'], app.config['LOGIN_RATE_WINDOW'])
+    with app.app_context():
+        db.create_all()
+        ensure_search_index(db.engine)
+    return quizmaster
@@ -0,0 +1,85 @@
+from array import array
+
+from conftest import seed
+from grading import AnswerKey, NO_ANSWER, UNGRADABLE, grade_batch, regrade_quiz, unpack_answers
+from models import db, Question, Score, AnswerSheet, User
+
+
+def test_grade_batch_counts_matching_answers():
+    key = AnswerKey(1, [10, 11, 12], [1, 2, 3])
+    results = grade_batch(key, [bytes([1, 2, 3]), bytes([1, 3, 3]), bytes([4, 4, 4])])
+    assert results == [(3, bytes([1, 1, 1])), (2, bytes([1, 0, 1])), (0, bytes([0, 0, 0]))]
+
+
+def test_unanswered_questions_never_match():
+    key = AnswerKey(1, [10, 11], [1, 2])
+    assert grade_batch(key, [bytes([NO_ANSWER, 2])]) == [(1, bytes([0, 1]))]
+    # Short submissions are padded as unanswered, long ones cut to the key
+    assert grade_batch(key, [bytes([1]), bytes([1, 2, 3])]) == [(1, bytes([1, 0])), (2, bytes([1, 1]))]
+
+
+def test_ungradable_questions_never_match():
+    key = AnswerKey.from_questions(1, [
+        {'id': 10, 'correct_option': '1'},
+        {'id': 11, 'correct_option': '5'},
+        {'id': 12, 'correct_option': None},
+    ])
+    assert key.correct == bytes([1, UNGRADABLE, UNGRADABLE])
+    assert key.grade(bytes([1, 2, 1])) == (1, bytes([1, 0, 0]))
+    assert key.grade(key.pack({'question_10': '1', 'question_11': '5', 'question_12': '1'}))[0] == 1
+
+
+def test_empty_key_and_no_submissions():
+    assert grade_batch(AnswerKey(1, [], []), [b'', b'\x01']) == [(0, b''), (0, b'')]
+    assert grade_batch(AnswerKey(1, [10], [1]), []) == []
+
+
+def test_pack_and_unpack_round_trip():
+    key = AnswerKey(1, [10, 11, 12], [1, 2, 3])
+    packed = key.pack({'question_10': '2', 'question_12': '9'})
+    assert packed == bytes([2, NO_ANSWER, NO_ANSWER])
+    assert key.unpack(packed) == {10: '2'}
+    assert unpack_answers(key.packed_ids(), packed) == {10: '2'}
+
+
+def add_sheet(ids, username, question_ids, answers, total):
+    user = User(username=username, password='x', full_name=username)
+    db.session.add(user)
+    db.session.flush()
+    score = Score(quiz_id=ids['quiz_id'], user_id=user.id, total_scored=total)
+    score.answer_sheet = AnswerSheet(question_ids=array('q', question_ids).tobytes(), answers=bytes(answers))
+    db.session.add(score)
+    db.session.commit()
+    return score.id
+
+
+def test_regrade_quiz_handles_each_layout(db_app):
+    with db_app.app_context():
+        ids = seed(questions=3)
+        first, second, third = [question.id for question in Question.query.order_by(Question.id)]
+        # Before the third question was added: still right
+        old = add_sheet(ids, 'old', [first, second], [1, 1], 2)
+        # All three, one unanswered
+        new = add_sheet(ids, 'new', [first, second, third], [1, 2, NO_ANSWER], 1)
+        # Drawn from a bank, including a question deleted since
+        drawn = add_sheet(ids, 'drawn', [third, first, 999], [2, 1, 1], 1)
+        # No answer sheet: left alone
+        user = User(username='bare', password='x', full_name='Bare')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Score(quiz_id=ids['quiz_id'], user_id=user.id, total_scored=3))
+
+        # The second question's answer was wrong, the third's is unusable
+        db.session.get(Question, second).correct_option = '2'
+        db.session.get(Question, third).correct_option = '7'
+        db.session.commit()
+
+        assert regrade_quiz(ids['quiz_id'], chunk_size=2) == (3, 2)
+        totals = {score.id: score.total_scored for score in Score.query}
+        assert totals[old] == 1
+        assert totals[new] == 2
+        assert totals[drawn] == 1
+        assert sorted(totals.values()) == [1, 1, 2, 3]
+
+        # Nothing changes a second time
+        assert regrade_quiz(ids['quiz_id']) == (3, 0)
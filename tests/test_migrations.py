@@ -0,0 +1,148 @@
+import sqlite3
+
+import pytest
+from flask import Flask
+
+import migrations
+from database import init_database
+from models import db
+from search import ensure_search_index
+
+# The schema db.create_all() made before any migration existed
+BASELINE = '''
+    CREATE TABLE user (
+        id INTEGER NOT NULL, username VARCHAR(100) NOT NULL, password VARCHAR(100) NOT NULL,
+        full_name VARCHAR(100) NOT NULL, qualification VARCHAR(100), dob VARCHAR(100),
+        PRIMARY KEY (id), UNIQUE (username)
+    );
+    CREATE TABLE subject (
+        id INTEGER NOT NULL, name VARCHAR(200) NOT NULL, description TEXT,
+        PRIMARY KEY (id), UNIQUE (name)
+    );
+    CREATE TABLE chapter (
+        id INTEGER NOT NULL, subject_id INTEGER, name VARCHAR(200) NOT NULL,
+        PRIMARY KEY (id), FOREIGN KEY(subject_id) REFERENCES subject (id)
+    );
+    CREATE TABLE quiz (
+        id INTEGER NOT NULL, chapter_id INTEGER, date_of_quiz VARCHAR(20), time_duration VARCHAR(10),
+        PRIMARY KEY (id), FOREIGN KEY(chapter_id) REFERENCES chapter (id)
+    );
+    CREATE TABLE question (
+        id INTEGER NOT NULL, quiz_id INTEGER, question_statement TEXT NOT NULL,
+        option1 VARCHAR(200) NOT NULL, option2 VARCHAR(200) NOT NULL, option3 VARCHAR(200) NOT NULL,
+        option4 VARCHAR(200) NOT NULL, correct_option VARCHAR(200) NOT NULL,
+        PRIMARY KEY (id), FOREIGN KEY(quiz_id) REFERENCES quiz (id)
+    );
+    CREATE TABLE score (
+        id INTEGER NOT NULL, quiz_id INTEGER, user_id INTEGER, total_scored INTEGER,
+        PRIMARY KEY (id), FOREIGN KEY(quiz_id) REFERENCES quiz (id), FOREIGN KEY(user_id) REFERENCES user (id)
+    );
+
+    INSERT INTO user VALUES (1, 'student', 'x', 'Student One', NULL, NULL);
+    INSERT INTO subject VALUES (1, 'Physics', 'Light and lenses');
+    INSERT INTO chapter VALUES (1, 1, 'Optics');
+    INSERT INTO chapter VALUES (2, 99, 'Orphaned chapter');
+    INSERT INTO quiz VALUES (1, 1, '2030-01-01', '10');
+    INSERT INTO quiz VALUES (2, 2, '2030-01-02', '10');
+    INSERT INTO question VALUES (1, 1, 'Angle of refraction', 'a', 'b', 'c', 'd', '1');
+    INSERT INTO question VALUES (2, 1, 'Focal length', 'a', 'b', 'c', 'd', '2');
+    INSERT INTO question VALUES (3, 2, 'Orphaned question', 'a', 'b', 'c', 'd', '1');
+    INSERT INTO score VALUES (1, 1, 1, 2);
+    INSERT INTO score VALUES (2, 1, 1, 0);
+    INSERT INTO score VALUES (3, 1, 99, 1);
+    INSERT INTO score VALUES (4, 2, 1, 1);
+'''
+
+
+def setup_database(path, search_first=False):
+    """Upgrade the database at path the way database_setup.py does; returns the migrations applied."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    init_database(app)
+    with app.app_context():
+        if search_first:
+            # A database whose search index was built before the constraints migration
+            ensure_search_index(db.engine)
+        db.create_all()
+        conn = db.engine.raw_connection()
+        try:
+            applied = migrations.upgrade(conn)
+        finally:
+            conn.close()
+        ensure_search_index(db.engine)
+        db.session.remove()
+        db.engine.dispose()
+    return applied
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    path = tmp_path / 'baseline.db'
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE)
+    conn.close()
+    return path
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA foreign_keys=ON')
+    return conn
+
+
+def search(conn, table, query):
+    return [rowid for rowid, in conn.execute(
+        f'SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ? ORDER BY rowid', (query,)
+    )]
+
+
+@pytest.mark.parametrize('search_first', [False, True])
+def test_baseline_upgrades_to_latest(baseline, search_first):
+    applied = setup_database(baseline, search_first)
+    assert len(applied) == migrations.LATEST_VERSION
+
+    conn = connect(baseline)
+    assert migrations.current_version(conn) == migrations.LATEST_VERSION
+    # Rows whose parent was missing are gone, and only the first score per quiz and user is kept
+    assert [row for row, in conn.execute('SELECT id FROM chapter')] == [1]
+    assert [row for row, in conn.execute('SELECT id FROM quiz')] == [1]
+    assert [row for row, in conn.execute('SELECT id FROM question ORDER BY id')] == [1, 2]
+    assert conn.execute('SELECT id, total_scored FROM score').fetchall() == [(1, 2)]
+    assert conn.execute('SELECT question_count FROM quiz WHERE id = 1').fetchone() == (2,)
+    assert 'attempted_at' in migrations._columns(conn, 'score')
+    for column in ('expires_at', 'expired_at', 'question_ids', 'option_orders'):
+        assert column in migrations._columns(conn, 'attempt')
+
+    # The search index holds the surviving rows, and its triggers keep it in sync
+    assert search(conn, 'question', 'refraction') == [1]
+    assert search(conn, 'question', 'orphaned') == []
+    assert search(conn, 'subject', 'lenses') == [1]
+    conn.execute("INSERT INTO question VALUES (5, 1, 'Total internal reflection', 'a', 'b', 'c', 'd', '1')")
+    assert search(conn, 'question', 'reflection') == [5]
+    conn.close()
+
+
+def test_deletes_cascade_after_upgrade(baseline):
+    setup_database(baseline)
+    conn = connect(baseline)
+    conn.execute("INSERT INTO attempt (quiz_id, user_id, started_at) VALUES (1, 1, '2030-01-01 09:00:00')")
+    conn.execute("INSERT INTO answer_sheet (score_id, question_ids, answers) VALUES (1, x'', x'')")
+    conn.execute('DELETE FROM subject WHERE id = 1')
+    for table in ('chapter', 'quiz', 'question', 'score', 'answer_sheet', 'attempt'):
+        assert conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone() == (0,), table
+    assert search(conn, 'question', 'refraction') == []
+
+    # Deleting a user removes their scores
+    conn.execute("INSERT INTO subject VALUES (2, 'Maths', '')")
+    conn.execute("INSERT INTO chapter (id, subject_id, name) VALUES (3, 2, 'Algebra')")
+    conn.execute("INSERT INTO quiz (id, chapter_id, date_of_quiz, time_duration) VALUES (3, 3, '2030-01-01', '5')")
+    conn.execute('INSERT INTO score (quiz_id, user_id, total_scored) VALUES (3, 1, 1)')
+    conn.execute('DELETE FROM user WHERE id = 1')
+    assert conn.execute('SELECT COUNT(*) FROM score').fetchone() == (0,)
+    conn.close()
+
+
+def test_upgrade_is_a_no_op_at_the_latest_version(baseline):
+    setup_database(baseline)
+    assert setup_database(baseline) == []
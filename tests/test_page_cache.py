@@ -0,0 +1,91 @@
+import pytest
+from flask import Flask, flash
+
+from page_cache import PageCache
+
+
+def make_app(tmp_path, backend='memory'):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test'
+    app.config['PAGE_CACHE_BACKEND'] = backend
+    app.config['PAGE_CACHE_PATH'] = str(tmp_path / 'page_cache.db')
+    cache = PageCache(app)
+    app.renders = 0
+    app.content = 'first'
+
+    @app.route('/subjects/<int:subject_id>')
+    @cache.cached('subject:{subject_id}')
+    def subject(subject_id):
+        app.renders += 1
+        return f'{app.content} {subject_id}'
+
+    @app.route('/flash')
+    def add_flash():
+        flash('Saved')
+        return 'ok'
+
+    return app, cache
+
+
+@pytest.fixture
+def app_and_cache(tmp_path):
+    return make_app(tmp_path)
+
+
+def test_repeat_request_is_served_from_cache_with_etag(app_and_cache):
+    app, _ = app_and_cache
+    client = app.test_client()
+    first = client.get('/subjects/1')
+    second = client.get('/subjects/1')
+    assert first.get_data(as_text=True) == second.get_data(as_text=True) == 'first 1'
+    assert first.headers['ETag'] and first.headers['ETag'] == second.headers['ETag']
+    assert app.renders == 1
+
+
+def test_matching_etag_gets_empty_304(app_and_cache):
+    app, _ = app_and_cache
+    client = app.test_client()
+    etag = client.get('/subjects/1').headers['ETag']
+    response = client.get('/subjects/1', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+
+
+def test_bump_invalidates_only_dependent_pages(app_and_cache):
+    app, cache = app_and_cache
+    client = app.test_client()
+    etag = client.get('/subjects/1').headers['ETag']
+    client.get('/subjects/2')
+    app.content = 'edited'
+
+    cache.bump('subject:1')
+    response = client.get('/subjects/1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == 'edited 1'
+    assert response.headers['ETag'] != etag
+    assert client.get('/subjects/2').get_data(as_text=True) == 'first 2'
+    assert app.renders == 3
+
+
+def test_pages_with_pending_flashes_are_not_cached(app_and_cache):
+    app, _ = app_and_cache
+    client = app.test_client()
+    client.get('/flash')
+    assert 'ETag' not in client.get('/subjects/1').headers
+    client.get('/subjects/1')
+    assert app.renders == 2
+
+
+def test_sqlite_backend_shares_bumps_between_processes(tmp_path):
+    # Two caches on one file stand in for two worker processes
+    app, cache = make_app(tmp_path, backend='sqlite')
+    other_app, _ = make_app(tmp_path, backend='sqlite')
+    other_app.content = app.content
+    client, other_client = app.test_client(), other_app.test_client()
+    client.get('/subjects/1')
+    assert other_client.get('/subjects/1').get_data(as_text=True) == 'first 1'
+    assert other_app.renders == 0
+
+    other_app.content = 'edited'
+    cache.bump('subject:1')
+    assert other_client.get('/subjects/1').get_data(as_text=True) == 'edited 1'
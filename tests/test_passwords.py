@@ -0,0 +1,96 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+from flask import Flask
+
+from passwords import PasswordHasher, PasswordServiceBusy, LoginRateLimiter, SQLiteRateLimiter
+
+
+def hasher(**config):
+    app = Flask(__name__)
+    app.config.update({'PASSWORD_HASH_ITERATIONS': 1000, 'PASSWORD_HASH_WORKERS': 0, **config})
+    return PasswordHasher(app)
+
+
+def test_hash_verifies_only_the_same_password():
+    passwords = hasher()
+    hashed = passwords.hash('secret')
+    assert hashed.startswith('pbkdf2:sha256:1000$')
+    assert passwords.verify(hashed, 'secret')
+    assert not passwords.verify(hashed, 'Secret')
+
+
+def test_hashing_on_the_process_pool():
+    passwords = hasher(PASSWORD_HASH_WORKERS=1)
+    try:
+        hashed = passwords.hash('secret')
+        assert passwords.verify(hashed, 'secret')
+        assert not passwords.verify(hashed, 'wrong')
+    finally:
+        passwords.shutdown(wait=True)
+
+
+def test_needs_rehash_when_the_cost_changes():
+    passwords = hasher()
+    hashed = passwords.hash('secret')
+    assert not passwords.needs_rehash(hashed)
+    assert hasher(PASSWORD_HASH_ITERATIONS=2000).needs_rehash(hashed)
+    assert hasher(PASSWORD_HASH_METHOD='pbkdf2:sha512').needs_rehash(hashed)
+
+
+def test_busy_once_the_queue_is_full():
+    passwords = hasher(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_PENDING=1, PASSWORD_HASH_QUEUE_TIMEOUT=0.05)
+    waiting = Future()
+    passwords._get_executor = lambda: type('Executor', (), {'submit': lambda *args, **kwargs: waiting})()
+
+    holder = threading.Thread(target=passwords.hash, args=('first',))
+    holder.start()
+    try:
+        time.sleep(0.05)
+        with pytest.raises(PasswordServiceBusy):
+            passwords.hash('second')
+    finally:
+        waiting.set_result('hashed')
+        holder.join()
+    # The slot is free again
+    waiting = Future()
+    waiting.set_result('hashed')
+    assert passwords.hash('third') == 'hashed'
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def limiter(request, tmp_path):
+    if request.param == 'memory':
+        return LoginRateLimiter(limit=3, window=0.2)
+    return SQLiteRateLimiter(str(tmp_path / 'login_attempts.db'), limit=3, window=0.2)
+
+
+def test_limit_applies_per_username(limiter):
+    assert [limiter.allow('alice') for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow('bob')
+
+
+def test_attempts_expire_after_the_window(limiter):
+    for _ in range(3):
+        limiter.allow('alice')
+    assert not limiter.allow('alice')
+    time.sleep(0.25)
+    assert limiter.allow('alice')
+
+
+def test_reset_clears_a_username(limiter):
+    for _ in range(3):
+        limiter.allow('alice')
+    limiter.reset('alice')
+    assert limiter.allow('alice')
+
+
+def test_sqlite_limit_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'login_attempts.db')
+    first = SQLiteRateLimiter(path, limit=2, window=60)
+    second = SQLiteRateLimiter(path, limit=2, window=60)
+    assert first.allow('alice')
+    assert second.allow('alice')
+    assert not first.allow('alice')
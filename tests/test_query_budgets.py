@@ -0,0 +1,67 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+from conftest import seed
+from instrumentation import query_budget
+from models import db, User
+
+
+@pytest.fixture(scope='module')
+def ids(quizmaster):
+    with quizmaster.app.app_context():
+        ids = seed(questions=5, sample_size=3)
+        user = User(username='budget', password=generate_password_hash('secret', method='pbkdf2:sha256:1000'),
+                    full_name='Budget Tester')
+        db.session.add(user)
+        db.session.commit()
+        ids['user_id'] = user.id
+    return ids
+
+
+@pytest.fixture
+def client(quizmaster, ids):
+    client = quizmaster.app.test_client()
+    response = client.post('/login', data={'username': 'budget', 'password': 'secret'})
+    assert response.status_code == 302
+    return client
+
+
+def budget(quizmaster, endpoint):
+    return quizmaster.app.config['QUERY_BUDGETS'][endpoint]
+
+
+def test_uncached_sampled_quiz_stays_within_budget(quizmaster, ids, client):
+    quizmaster.quiz_cache.clear()
+    with query_budget(budget(quizmaster, 'api_quiz')):
+        response = client.get(f"/api/v1/quizzes/{ids['quiz_id']}")
+    assert response.status_code == 200
+    questions = response.get_json()['questions']
+    assert len(questions) == 3
+    # The user's shuffled option order is sent with each question
+    assert all(sorted(question[6]) == [1, 2, 3, 4] for question in questions)
+
+
+@pytest.mark.parametrize('endpoint, url', [
+    ('api_quizzes', '/api/v1/quizzes'),
+    ('api_leaderboard', '/api/v1/leaderboards/quiz/{quiz_id}'),
+    ('user_dashboard', '/user_dashboard'),
+    ('view_scores', '/view_scores'),
+    ('user_summary', '/user_summary'),
+])
+def test_pages_stay_within_budget(quizmaster, ids, client, endpoint, url):
+    with query_budget(budget(quizmaster, endpoint)):
+        response = client.get(url.format(**ids))
+    assert response.status_code == 200
+
+
+def test_result_stays_within_budget(quizmaster, ids, client):
+    quiz_id = ids['quiz_id']
+    questions = client.get(f'/api/v1/quizzes/{quiz_id}').get_json()['questions']
+    response = client.post(f'/api/v1/quizzes/{quiz_id}/submission',
+                           json={'answers': {str(question[0]): '1' for question in questions}})
+    assert response.status_code in (200, 201)
+
+    with query_budget(budget(quizmaster, 'api_result')):
+        response = client.get(f'/api/v1/quizzes/{quiz_id}/result')
+    assert response.status_code == 200
+    assert response.get_json()['score'] == 3
@@ -0,0 +1,118 @@
+import random
+
+from conftest import seed
+from models import db, Score, User
+from rollups import RankedBoard, Leaderboards
+
+
+def test_ties_share_a_rank_in_arrival_order():
+    board = RankedBoard()
+    for user_id, points in [(1, 5), (2, 7), (3, 5), (4, 3), (5, 7)]:
+        board.add(user_id, points)
+    assert board.top(10) == [(1, 2, 7), (1, 5, 7), (3, 1, 5), (3, 3, 5), (5, 4, 3)]
+    assert [board.rank(user_id) for user_id in (1, 2, 3, 4, 5)] == [(3, 5), (1, 7), (3, 5), (5, 3), (1, 7)]
+    assert board.rank(6) is None
+    # The limit can cut through a tie
+    assert board.top(3) == [(1, 2, 7), (1, 5, 7), (3, 1, 5)]
+
+
+def test_updates_move_a_user_and_grow_the_tree():
+    board = RankedBoard()
+    board.add(1, 4)
+    board.add(2, 6)
+    board.add(1, 3)
+    assert board.rank(1) == (1, 7)
+    assert board.rank(2) == (2, 6)
+    # Totals beyond the initial tree size
+    board.add(2, 100)
+    assert board.top(2) == [(1, 2, 106), (2, 1, 7)]
+    # Zero and negative points leave the total as it was
+    board.add(1, 0)
+    board.add(1, -5)
+    board.add(3, None)
+    assert board.rank(1) == (2, 7)
+    assert board.rank(3) == (3, 0)
+    assert len(board) == 3
+
+
+def test_matches_sorting_for_random_scores():
+    rng = random.Random(7)
+    board = RankedBoard()
+    totals = {}
+    for _ in range(2000):
+        user_id, points = rng.randrange(200), rng.randrange(12)
+        board.add(user_id, points)
+        totals[user_id] = totals.get(user_id, 0) + points
+    for user_id, total in totals.items():
+        assert board.rank(user_id) == (1 + sum(other > total for other in totals.values()), total)
+    assert [total for _, _, total in board.top(50)] == sorted(totals.values(), reverse=True)[:50]
+
+
+def add_score(ids, username, total):
+    user = User(username=username, password='x', full_name=username)
+    db.session.add(user)
+    db.session.flush()
+    score = Score(quiz_id=ids['quiz_id'], user_id=user.id, total_scored=total)
+    db.session.add(score)
+    db.session.commit()
+    return user.id, score
+
+
+def test_boards_follow_recorded_and_deleted_scores(db_app):
+    with db_app.app_context():
+        ids = seed()
+        boards = Leaderboards(ttl=0)
+        first, _ = add_score(ids, 'first', 2)
+        second, score = add_score(ids, 'second', 3)
+        top, rank, entrants = boards.standings('quiz', ids['quiz_id'], first)
+        assert top == [(1, second, 3), (2, first, 2)] and rank == (2, 2) and entrants == 2
+
+        # A submission through this worker is folded in without a reload
+        third, _ = add_score(ids, 'third', 3)
+        boards.record_score(ids['quiz_id'], ids['chapter_id'], ids['subject_id'], third, 3)
+        assert boards.standings('subject', ids['subject_id'], third)[1] == (1, 3)
+
+        # Deleting a score only shows once the boards are invalidated
+        db.session.delete(score)
+        db.session.commit()
+        assert boards.standings('quiz', ids['quiz_id'])[2] == 3
+        boards.invalidate()
+        top, _, entrants = boards.standings('quiz', ids['quiz_id'])
+        assert top == [(1, third, 3), (2, first, 2)] and entrants == 2
+        assert boards.standings('chapter', ids['chapter_id'], second)[1] is None
+
+
+def test_boards_reload_once_the_ttl_expires(db_app):
+    with db_app.app_context():
+        ids = seed()
+        boards = Leaderboards(ttl=60)
+        add_score(ids, 'first', 1)
+        assert boards.preload() == 3
+        # Submitted through another worker: not seen until the ttl runs out
+        other, _ = add_score(ids, 'other', 3)
+        assert boards.standings('quiz', ids['quiz_id'], other)[1] is None
+        boards._loaded_at -= 61
+        assert boards.standings('quiz', ids['quiz_id'], other)[1] == (1, 3)
+
+
+def test_invalidation_reaches_boards_sharing_a_generation(db_app):
+    class Generations:
+        def __init__(self):
+            self.values = {}
+
+        def generation(self, name):
+            return self.values.get(name, 0)
+
+        def bump(self, name):
+            self.values[name] = self.generation(name) + 1
+
+    with db_app.app_context():
+        ids = seed()
+        shared = Generations()
+        here, there = Leaderboards(ttl=0), Leaderboards(ttl=0)
+        here.share_invalidations(shared)
+        there.share_invalidations(shared)
+        assert there.standings('quiz', ids['quiz_id'])[2] == 0
+        user_id, _ = add_score(ids, 'late', 2)
+        here.invalidate()
+        assert there.standings('quiz', ids['quiz_id'], user_id)[1] == (1, 2)
@@ -0,0 +1,165 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import seed
+from models import db, Score
+from submissions import SubmissionQueue, _read_journal
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def journal_line(token, quiz_id, user_id):
+    return json.dumps({
+        'token': token, 'quiz_id': quiz_id, 'user_id': user_id, 'chapter_id': None, 'subject_id': None,
+        'total_scored': 1, 'question_ids': '', 'answers': '', 'attempted_at': '2030-01-01T09:00:00'
+    }) + '\n'
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+@pytest.fixture
+def ids(db_app):
+    with db_app.app_context():
+        return seed()
+
+
+@pytest.fixture
+def submissions(db_app):
+    db_app.config['SUBMISSION_QUEUE_ENABLED'] = True
+    db_app.config['SUBMISSION_FLUSH_INTERVAL'] = 0.2
+    db_app.config['SUBMISSION_JOURNAL_FSYNC'] = False
+    queue = SubmissionQueue(db_app)
+    yield queue
+    queue.close()
+
+
+def scores(app):
+    with app.app_context():
+        return {(score.quiz_id, score.user_id): score.total_scored for score in Score.query.all()}
+
+
+def test_batch_with_deleted_quiz_still_commits_valid_submissions(db_app, ids, submissions):
+    submissions.enqueue(ids['quiz_id'] + 100, ids['user_id'], None, None, 1, b'', b'')
+    submissions.enqueue(ids['quiz_id'], ids['user_id'], ids['chapter_id'], ids['subject_id'], 2, b'', b'')
+
+    assert wait_until(lambda: not submissions.is_pending(ids['quiz_id'], ids['user_id']))
+    assert not submissions.is_pending(ids['quiz_id'] + 100, ids['user_id'])
+    assert scores(db_app) == {(ids['quiz_id'], ids['user_id']): 2}
+    assert submissions.errors == 1
+    # Both are resolved, so the journal was started afresh
+    assert _read_journal(submissions.journal_path) == {}
+
+
+def test_failing_commits_are_retried_a_bounded_number_of_times(db_app, ids, submissions, monkeypatch):
+    submissions.max_retries = 2
+    submissions.flush_interval = 0.01
+    attempts = []
+
+    def locked(records):
+        attempts.append(len(records))
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(submissions, '_insert', locked)
+    token = submissions.enqueue(ids['quiz_id'], ids['user_id'], ids['chapter_id'], ids['subject_id'], 2, b'', b'')
+
+    assert wait_until(lambda: not submissions.is_pending(ids['quiz_id'], ids['user_id']))
+    assert len(attempts) == 3
+    # Given up on for now, but kept in the journal for the next start
+    assert token in _read_journal(submissions.journal_path)
+    assert scores(db_app) == {}
+
+
+def test_replays_journals_of_exited_processes_only(db_app, ids, submissions):
+    root, ext = os.path.splitext(submissions.journal_base)
+    os.makedirs(os.path.dirname(root), exist_ok=True)
+    dead = f'{root}.{exited_pid()}{ext}'
+    live = f'{root}.{os.getppid()}{ext}'
+    with open(dead, 'w') as journal:
+        journal.write(journal_line('replayed', ids['quiz_id'], ids['user_id']))
+        journal.write(journal_line('committed', ids['quiz_id'], ids['user_id'] + 1))
+        journal.write(json.dumps({'committed': ['committed']}) + '\n')
+        journal.write('{"torn')
+    with open(live, 'w') as journal:
+        journal.write(journal_line('live', ids['quiz_id'], ids['user_id'] + 2))
+
+    # Not yet replayed, but another process's journal still counts as pending
+    assert submissions.is_pending(ids['quiz_id'], ids['user_id'])
+    assert not submissions.is_pending(ids['quiz_id'], ids['user_id'] + 1)
+
+    submissions.enqueue(ids['quiz_id'] + 100, ids['user_id'], None, None, 0, b'', b'')
+    assert wait_until(lambda: (ids['quiz_id'], ids['user_id']) in scores(db_app))
+
+    assert not os.path.exists(dead)
+    assert set(_read_journal(live)) == {'live'}
+    assert submissions.is_pending(ids['quiz_id'], ids['user_id'] + 2)
+    os.remove(live)
+    assert not submissions.is_pending(ids['quiz_id'], ids['user_id'] + 2)
+
+
+def test_replayed_submission_already_saved_is_not_duplicated(db_app, ids, submissions):
+    with db_app.app_context():
+        db.session.add(Score(quiz_id=ids['quiz_id'], user_id=ids['user_id'], total_scored=3))
+        db.session.commit()
+    root, ext = os.path.splitext(submissions.journal_base)
+    os.makedirs(os.path.dirname(root), exist_ok=True)
+    with open(f'{root}.{exited_pid()}{ext}', 'w') as journal:
+        journal.write(journal_line('again', ids['quiz_id'], ids['user_id']))
+
+    submissions.enqueue(ids['quiz_id'], ids['user_id'] + 100, None, None, 0, b'', b'')
+    assert wait_until(lambda: not submissions.is_pending(ids['quiz_id'], ids['user_id']))
+    assert scores(db_app) == {(ids['quiz_id'], ids['user_id']): 3}
+
+
+def test_nothing_is_pending_while_disabled(db_app, ids, submissions):
+    root, ext = os.path.splitext(submissions.journal_base)
+    os.makedirs(os.path.dirname(root), exist_ok=True)
+    with open(f'{root}.{exited_pid()}{ext}', 'w') as journal:
+        journal.write(journal_line('left', ids['quiz_id'], ids['user_id']))
+    assert submissions.is_pending(ids['quiz_id'], ids['user_id'])
+
+    submissions.enabled = False
+    assert not submissions.is_pending(ids['quiz_id'], ids['user_id'])
+
+
+def test_concurrent_submissions_share_fsyncs(db_app, ids, submissions, monkeypatch):
+    import threading
+
+    submissions.fsync = True
+    synced = []
+    real_fsync = os.fsync
+
+    def slow_fsync(fileno):
+        synced.append(fileno)
+        time.sleep(0.05)
+        real_fsync(fileno)
+
+    monkeypatch.setattr(os, 'fsync', slow_fsync)
+    threads = [
+        threading.Thread(target=submissions.enqueue,
+                         args=(ids['quiz_id'], ids['user_id'] + number, None, None, 0, b'', b''))
+        for number in range(1, 21)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Every journaled submission is on disk, with fewer fsyncs than submissions
+    assert submissions._synced == submissions._written
+    assert len(synced) < len(threads)
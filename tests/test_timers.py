@@ -0,0 +1,134 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from conftest import seed
+from models import db, Attempt
+from timers import DeadlineScheduler, QuizTimers, CLAIM_TIMEOUT
+
+
+class Recorder:
+    def __init__(self, expected):
+        self.keys = []
+        self.expected = expected
+        self.done = threading.Event()
+
+    def __call__(self, key):
+        self.keys.append(key)
+        if len(self.keys) >= self.expected:
+            self.done.set()
+
+
+def test_scheduler_fires_in_deadline_order():
+    recorder = Recorder(3)
+    scheduler = DeadlineScheduler(recorder)
+    now = time.time()
+    scheduler.schedule('c', now + 0.15)
+    scheduler.schedule('a', now + 0.05)
+    scheduler.schedule('b', now + 0.1)
+    assert recorder.done.wait(2)
+    assert recorder.keys == ['a', 'b', 'c']
+    assert len(scheduler) == 0
+
+
+def test_cancelled_keys_never_fire():
+    recorder = Recorder(1)
+    scheduler = DeadlineScheduler(recorder)
+    now = time.time()
+    scheduler.schedule('cancelled', now + 0.05)
+    scheduler.schedule('kept', now + 0.1)
+    scheduler.cancel('cancelled')
+    assert scheduler.deadline('cancelled') is None
+    assert recorder.done.wait(2)
+    time.sleep(0.1)
+    assert recorder.keys == ['kept']
+
+
+def test_rescheduling_replaces_the_earlier_deadline():
+    recorder = Recorder(2)
+    scheduler = DeadlineScheduler(recorder)
+    now = time.time()
+    scheduler.schedule('moved', now + 0.05)
+    scheduler.schedule('other', now + 0.1)
+    scheduler.schedule('moved', now + 0.2)
+    assert scheduler.deadline('moved') == now + 0.2
+    assert recorder.done.wait(2)
+    assert recorder.keys == ['other', 'moved']
+
+
+def test_earlier_deadline_wakes_a_sleeping_scheduler():
+    recorder = Recorder(1)
+    scheduler = DeadlineScheduler(recorder)
+    scheduler.schedule('late', time.time() + 60)
+    time.sleep(0.05)
+    scheduler.schedule('soon', time.time() + 0.05)
+    assert recorder.done.wait(2)
+    assert recorder.keys == ['soon']
+
+
+def test_expiry_is_handled_once_however_many_processes_time_it(db_app):
+    with db_app.app_context():
+        ids = seed()
+        db.session.add(Attempt(quiz_id=ids['quiz_id'], user_id=ids['user_id'],
+                               started_at=datetime.now(), expires_at=datetime.now()))
+        db.session.commit()
+    # One QuizTimers per worker process, all timing the same attempt
+    handled = []
+    workers = [QuizTimers(db_app) for _ in range(4)]
+    for timers in workers:
+        timers.on_expire(lambda quiz_id, user_id: handled.append((quiz_id, user_id)))
+    threads = [threading.Thread(target=timers._expire, args=((ids['quiz_id'], ids['user_id']),))
+               for timers in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert handled == [(ids['quiz_id'], ids['user_id'])]
+
+
+def test_stale_claim_is_taken_over(db_app):
+    with db_app.app_context():
+        ids = seed()
+        db.session.add(Attempt(quiz_id=ids['quiz_id'], user_id=ids['user_id'], started_at=datetime.now(),
+                               expires_at=datetime.now(),
+                               expired_at=datetime.now() - timedelta(seconds=CLAIM_TIMEOUT + 1)))
+        db.session.commit()
+    handled = []
+    timers = QuizTimers(db_app)
+    timers.on_expire(lambda quiz_id, user_id: handled.append(quiz_id))
+    timers._expire((ids['quiz_id'], ids['user_id']))
+    timers._expire((ids['quiz_id'], ids['user_id']))
+    assert handled == [ids['quiz_id']]
+
+
+def test_sampled_attempt_keeps_its_draw_when_the_bank_changes(db_app):
+    from quiz_cache import QuizCache
+    from models import Question
+
+    with db_app.app_context():
+        ids = seed(questions=8, sample_size=5)
+        cache = QuizCache(db_app)
+        timers = QuizTimers(db_app)
+        timers.enabled = False
+        quiz = cache.get(ids['quiz_id'])
+        draw = lambda: cache.draw(quiz, ids['user_id'])
+        _, drawn = timers.begin(quiz, ids['user_id'], draw)
+        before = cache.for_user(quiz, ids['user_id'], drawn)
+
+        # An admin replaces most of the bank while the attempt is open
+        for question in Question.query.filter(Question.id.notin_([q['id'] for q in before['questions']])):
+            db.session.delete(question)
+        for number in range(20):
+            db.session.add(Question(quiz_id=ids['quiz_id'], question_statement=f'New {number}',
+                                    option1='a', option2='b', option3='c', option4='d', correct_option='2'))
+        db.session.commit()
+        cache.invalidate(ids['quiz_id'])
+        quiz = cache.get(ids['quiz_id'])
+
+        _, drawn = timers.begin(quiz, ids['user_id'], lambda: cache.draw(quiz, ids['user_id']))
+        after = cache.for_user(quiz, ids['user_id'], drawn)
+        assert after['questions'] == before['questions']
+        assert timers.drawn(ids['quiz_id'], ids['user_id']) == drawn
+        form = {f"question_{question['id']}": '1' for question in after['questions']}
+        key = cache.answer_key(after)
+        assert key.grade(key.pack(form))[0] == 5
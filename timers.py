@@ -0,0 +1,250 @@
+# Server-side quiz timers: attempt start times in the database, deadlines in one heap
+import heapq
+import itertools
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Attempt, Score
+
+# Seconds after which an expiry claimed by a process that never finished it is retried
+CLAIM_TIMEOUT = 60
+
+
+class DeadlineScheduler:
+    """Calls callback(key) once each key's deadline (a time.time() value) passes.
+
+    Deadlines sit in a single binary heap watched by one thread that sleeps
+    until the earliest of them, so scheduling and expiring cost O(log n)
+    however many timers are running. cancel() and rescheduling only update
+    the key's entry in a dict; stale heap entries are dropped when popped.
+    """
+
+    def __init__(self, callback, name='deadline-scheduler'):
+        self.callback = callback
+        self.name = name
+        self._heap = []
+        self._deadlines = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread_pid = None
+
+    def schedule(self, key, deadline):
+        with self._condition:
+            self._deadlines[key] = deadline
+            heapq.heappush(self._heap, (deadline, next(self._counter), key))
+            # Only an earlier head deadline means the thread must wake sooner
+            if self._heap[0][2] == key:
+                self._condition.notify()
+            self._start()
+
+    def cancel(self, key):
+        with self._condition:
+            self._deadlines.pop(key, None)
+
+    def deadline(self, key):
+        """The key's pending deadline, or None."""
+        with self._condition:
+            return self._deadlines.get(key)
+
+    def __len__(self):
+        with self._condition:
+            return len(self._deadlines)
+
+    def _start(self):
+        # Called with the condition held; one thread per process, restarted after a fork
+        if self._thread_pid == os.getpid():
+            return
+        self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name=self.name, daemon=True).start()
+
+    def _pop_due(self):
+        # Called with the condition held; returns the due keys or waits for the next one
+        due = []
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+                due.append(key)
+        if not due:
+            self._condition.wait(self._heap[0][0] - now if self._heap else None)
+        return due
+
+    def _run(self):
+        while True:
+            with self._condition:
+                due = self._pop_due()
+            for key in due:
+                try:
+                    self.callback(key)
+                except Exception as e:
+                    print(f"Error: {str(e)}")  # For debugging
+
+
+class QuizTimers:
+    """Records when each attempt starts and submits it when time runs out.
+
+    The first visit to a quiz stores an Attempt with its deadline (start plus
+    the quiz's duration) and, for sampled quizzes, the user's draw. Submissions later than QUIZ_TIMER_GRACE seconds
+    after the deadline are refused, and a DeadlineScheduler calls the
+    on_expire handler for attempts nobody submitted. Each worker process
+    schedules the attempts it starts, and loads every unsubmitted attempt
+    from the database once when it first starts a timer, so attempts survive
+    a restart. Every process therefore times the same attempts; on expiry
+    each tries to mark the Attempt expired, and only the one that does runs
+    the handler. The handler must still tolerate an attempt the user has
+    submitted meanwhile.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.handler = None
+        self.scheduler = DeadlineScheduler(self._expire, name='quiz-timers')
+        self._loaded_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('QUIZ_TIMERS_ENABLED', True)
+        self.grace = app.config.get('QUIZ_TIMER_GRACE', 30)
+
+    def on_expire(self, handler):
+        """Register handler(quiz_id, user_id), called in an app context on expiry."""
+        self.handler = handler
+        return handler
+
+    def _expire(self, key):
+        if self.handler is not None:
+            with self.app.app_context():
+                if self._claim(*key):
+                    self.handler(*key)
+
+    def _claim(self, quiz_id, user_id):
+        # One UPDATE decides which process submits the attempt; a claim left
+        # by a process that died before submitting is taken over after CLAIM_TIMEOUT
+        now = datetime.now()
+        claimed = Attempt.query.filter(
+            Attempt.quiz_id == quiz_id,
+            Attempt.user_id == user_id,
+            or_(Attempt.expired_at.is_(None), Attempt.expired_at < now - timedelta(seconds=CLAIM_TIMEOUT))
+        ).update({'expired_at': now}, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+
+    def _load(self):
+        # Schedule unsubmitted attempts once per process, including ones
+        # started before a restart or by another worker
+        if self._loaded_pid == os.getpid():
+            return
+        with self._lock:
+            if self._loaded_pid == os.getpid():
+                return
+            self._loaded_pid = os.getpid()
+            rows = db.session.query(Attempt.quiz_id, Attempt.user_id, Attempt.expires_at, Attempt.expired_at).outerjoin(
+                Score, and_(Score.quiz_id == Attempt.quiz_id, Score.user_id == Attempt.user_id)
+            ).filter(Score.id.is_(None), Attempt.expires_at.isnot(None)).all()
+            for quiz_id, user_id, expires_at, expired_at in rows:
+                deadline = expires_at.timestamp() + self.grace
+                if expired_at is not None:
+                    # Claimed already: only retry if the claim goes stale
+                    deadline = max(deadline, expired_at.timestamp() + CLAIM_TIMEOUT)
+                self.scheduler.schedule((quiz_id, user_id), deadline)
+
+    def start(self, quiz, user_id):
+        """Deadline (a time.time() value) of the user's attempt, starting it if needed.
+
+        Returns None for quizzes without a time limit.
+        """
+        return self.begin(quiz, user_id)[0]
+
+    def begin(self, quiz, user_id, draw=None):
+        """Start the user's attempt if needed; returns (deadline, drawn).
+
+        deadline is as for start(). Sampled quizzes pass draw(), returning
+        the packed (question ids, option orders) to store with a new
+        attempt; drawn is the pair the attempt holds, so the user keeps the
+        questions first drawn for them however the bank changes afterwards.
+        Untimed quizzes without a draw store no attempt.
+        """
+        duration = duration_seconds(quiz)
+        if duration is None and draw is None:
+            return None, None
+        key = (quiz['id'], user_id)
+        scheduled = self.scheduler.deadline(key)
+        if scheduled is not None and draw is None:
+            return scheduled - self.grace, None
+
+        attempt = Attempt.query.filter_by(quiz_id=quiz['id'], user_id=user_id).first()
+        if attempt is None:
+            started_at = datetime.now()
+            expires_at = datetime.fromtimestamp(started_at.timestamp() + duration) if duration else None
+            drawn = draw() if draw is not None else None
+            db.session.add(Attempt(quiz_id=quiz['id'], user_id=user_id,
+                                   started_at=started_at, expires_at=expires_at,
+                                   question_ids=drawn and drawn[0], option_orders=drawn and drawn[1]))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Started concurrently by another request
+                db.session.rollback()
+                attempt = Attempt.query.filter_by(quiz_id=quiz['id'], user_id=user_id).one()
+
+        if attempt is not None:
+            expires_at = attempt.expires_at
+            drawn = _drawn(attempt)
+            changed = False
+            if drawn is None and draw is not None:
+                # Started before the quiz was sampled
+                drawn = draw()
+                attempt.question_ids, attempt.option_orders = drawn
+                changed = True
+            if expires_at is None and duration is not None:
+                # Started before the quiz had a time limit
+                expires_at = datetime.fromtimestamp(attempt.started_at.timestamp() + duration)
+                attempt.expires_at = expires_at
+                changed = True
+            if changed:
+                db.session.commit()
+
+        if duration is None:
+            return None, drawn
+        deadline = expires_at.timestamp()
+        if self.enabled:
+            self._load()
+            self.scheduler.schedule(key, deadline + self.grace)
+        return deadline, drawn
+
+    def drawn(self, quiz_id, user_id):
+        """The (question ids, option orders) stored with the user's attempt, or None."""
+        attempt = Attempt.query.filter_by(quiz_id=quiz_id, user_id=user_id).first()
+        return _drawn(attempt) if attempt is not None else None
+
+    def expired(self, deadline):
+        """True once a submission for this deadline is too late to accept."""
+        return self.enabled and deadline is not None and time.time() > deadline + self.grace
+
+    def finish(self, quiz_id, user_id):
+        """Stop the timer of a submitted attempt."""
+        self.scheduler.cancel((quiz_id, user_id))
+
+
+def _drawn(attempt):
+    if attempt.question_ids is None:
+        return None
+    return attempt.question_ids, attempt.option_orders
+
+
+def duration_seconds(quiz):
+    """The quiz's time limit, or None; time_duration holds whole minutes as a string."""
+    try:
+        minutes = int(quiz['time_duration'])
+    except (TypeError, ValueError):
+        return None
+    return minutes * 60 if minutes > 0 else None